@@ -614,10 +614,14 @@ class EventsController < BaseController
 
     @event_interface.create(params[:event_interface], current_account)
 
-    if @event_interface.event.persisted?
-      redirect_to event_path(@event_interface.event.id), notice: 'Event was successfully created.'
-    else
-      render "event_interfaces/#{ @event_interface.view_directory }/new"
+    respond_to do |format|
+      if @event_interface.event.persisted?
+        format.html { redirect_to event_path(@event_interface.event.id), notice: 'Event was successfully created.' }
+        format.json { render json: { id: @event_interface.event.id }, status: :created, location: event_path(@event_interface.event.id) }
+      else
+        format.html { render "event_interfaces/#{ @event_interface.view_directory }/new" }
+        format.json { render json: @event_interface.errors, status: :unprocessable_entity }
+      end
     end
   end
 
@@ -790,6 +794,7 @@ private
       
       format.html { render 'event_interfaces/standard/show' }
       format.js { render 'event_interfaces/standard/target_tab'}
+      format.json { head :no_content }
     end    
   end
 
@@ -244,7 +244,12 @@ class SessionsController < ApplicationController
   	elsif account && account.authenticate(params[:session][:password])
 
       sign_in account
-      redirect_to events_path
+
+      respond_to do |format|
+        format.html { redirect_to events_path }
+        # API clients get the CSRF token directly, instead of rendering the page of events to read it from
+        format.json { render json: { authenticity_token: form_authenticity_token } }
+      end
 
   	else
       flash.now[:error] = 'Login failed:  Invalid credentials.'
@@ -252,6 +252,10 @@ module EventInterface
       @event_signal = EventSignal.new(event_interface_params[:event_signal])
       @event_signal_interval = EventSignalInterval.new(event_interface_params[:event_signal_interval])
 
+      # Optional list of consecutive intervals (each with its own `:duration` and `:payload`), submitted in a single
+      # request instead of the single `:event_signal_interval`
+      intervals_params = event_interface_params[:event_signal_intervals]
+
       # Any setup for the EventInterface *itself* (eg. setting attributes which should remain on
       # the object regardless of failure in try/catch) should be handled outside of this try/catch.
       begin
@@ -290,13 +294,31 @@ module EventInterface
 
           @event_signal.save!
 
-          @event_signal_interval.event_signal = @event_signal
+          if intervals_params.present?
+
+            intervals_params.each_with_index do |interval_params, uid|
+              event_signal_interval = EventSignalInterval.new(interval_params)
+
+              event_signal_interval.event_signal = @event_signal
 
-          @event_signal_interval.duration = @event.duration
-          @event_signal_interval.uid = 0
-          @event_signal_interval.payload_type = PayloadType.find_by_name("normal")
+              event_signal_interval.uid = uid
+              event_signal_interval.payload_type = PayloadType.find_by_name("normal")
+
+              event_signal_interval.save!
+
+              @event_signal_interval = event_signal_interval if uid == 0
+            end
 
-          @event_signal_interval.save!
+          else
+
+            @event_signal_interval.event_signal = @event_signal
+
+            @event_signal_interval.duration = @event.duration
+            @event_signal_interval.uid = 0
+            @event_signal_interval.payload_type = PayloadType.find_by_name("normal")
+
+            @event_signal_interval.save!
+          end
 
           if !account.is_admin?
             account.vens.each do |ven|
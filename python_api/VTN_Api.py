@@ -1,5 +1,86 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import json
+import re
+from urllib.parse import urljoin
+import time
+import os
+try:
+    from .metrics import REGISTRY
+except ImportError:
+    # Imported as a top-level module, from this folder: from VTN_Api import VTN_Api
+    from metrics import REGISTRY
+
+# Defaults for the HTTP connection pool, overridable in the settings file
+DEFAULT_POOL_SIZE = 10  # Maximum amount of keep-alive connections kept open to the VTN
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) timeouts, in seconds
+DEFAULT_MAX_RETRIES = 3  # Retries for idempotent calls (PUT, DELETE) on connection errors and 5xx
+DEFAULT_BACKOFF_FACTOR = 0.5  # Sleep between retries: backoff_factor * 2^(retry - 1) seconds
+RETRY_STATUS_CODES = (502, 503, 504)
+DEFAULT_MAX_CONCURRENCY = 4  # Amount of events pushed in parallel by submit_events()
+DEFAULT_SESSION_CACHE_FILE = '.vtn_session.json'  # The file storing the VTN session between runs
+DEFAULT_SESSION_TTL = 3600  # Time after which a cached session is not reused anymore, in seconds
+LOGIN_PATH = "/login"
+LOGOUT_PATH = "/logout"
+
+# JSON is preferred when the VTN supports it, HTML is the fallback of older VTN versions
+ACCEPT_HEADER = "application/json, text/html;q=0.9"
+EVENT_LOCATION_REGEX = re.compile(r'/events/(\d+)/?$')
+ENDPOINT_ID_REGEX = re.compile(r'/\d+(?=/|$)')
+CSRF_META_REGEX = re.compile(r'<meta[^>]*content="([^"]*)"[^>]*name="csrf-token"|<meta[^>]*name="csrf-token"[^>]*content="([^"]*)"')
+
+# Latency and errors of the calls to the VTN, per endpoint (the ids in the paths are replaced by ':id')
+VTN_REQUEST_SECONDS = REGISTRY.histogram('vtn_request_duration_seconds', "Duration of the calls to the VTN", ('method', 'endpoint'))
+VTN_REQUEST_ERRORS = REGISTRY.counter('vtn_request_errors', "Calls to the VTN that failed, by HTTP status or exception", ('method', 'endpoint', 'error'))
+VTN_LOGINS = REGISTRY.counter('vtn_relogins', "Calls replayed after logging in again, the session having expired")
+
+
+def get_endpoint(path):
+    """
+    :return: the path of a VTN resource without its ids, e.g. '/events/:id/publish'
+    """
+    return ENDPOINT_ID_REGEX.sub('/:id', path)
+
+
+class NotLoggedInError(Exception):
+    """
+    Raised when events are pushed before VTN_Api.login()
+    """
+    pass
+
+
+class EventSubmission():
+    """
+    The result of the submission of one event through VTN_Api.submit_events()
+    """
+    PENDING = 'pending'
+    CREATED = 'created'
+    TARGETED = 'targeted'
+    PUBLISHED = 'published'
+    FAILED = 'failed'
+
+    def __init__(self, event):
+        self.event = event
+        self.event_id = None
+        self.status = EventSubmission.PENDING
+        self.last_step = None  # The last status reached before the failure, once FAILED
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.status == EventSubmission.PUBLISHED
+
+    def __repr__(self):
+        return "EventSubmission(event_id={0}, status={1}, last_step={2}, error={3})".format(self.event_id, self.status, self.last_step, self.error)
+
+    def fail(self, error):
+        self.error = error
+        self.last_step = self.status
+        self.status = EventSubmission.FAILED
+
 
 class VTN_Api():
     def __init__(self, config_file='settings.json'):
@@ -11,17 +92,205 @@ class VTN_Api():
         self.username = config["username"]
         self.password = config["password"]
         self.authenticity_token = ""
-        self.cookies = {}
+
+        self.timeout = config.get("timeout", DEFAULT_TIMEOUT)
+        if type(self.timeout) == list:
+            self.timeout = tuple(self.timeout)
+
+        self.pool_size = config.get("pool_size", DEFAULT_POOL_SIZE)
+        self.max_concurrency = config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)
+
+        self.session = self.create_session(pool_size=self.pool_size,
+                                           max_retries=config.get("max_retries", DEFAULT_MAX_RETRIES),
+                                           backoff_factor=config.get("backoff_factor", DEFAULT_BACKOFF_FACTOR))
+
+        # The session (cookies and authenticity token) is cached on disk to be reused by the next runs
+        self.session_cache_file = config.get("session_cache_file", DEFAULT_SESSION_CACHE_FILE)
+        self.session_ttl = config.get("session_ttl", DEFAULT_SESSION_TTL)
+        self.__login_lock = threading.Lock()
+        self.__login_generation = 0  # Incremented at each login
+
+    def create_session(self, pool_size, max_retries, backoff_factor):
+        """
+        Create the keep-alive session used for every call to the VTN. The session holds the connection pool and the
+        cookies, so that the TCP/TLS connection is reused between calls.
+        :param pool_size: the maximum amount of connections kept open to the VTN
+        :param max_retries: the amount of retries for idempotent calls
+        :param backoff_factor: the backoff factor between two retries
+        :return: a requests.Session
+        """
+        # Only idempotent methods are retried (urllib3 default), POST requests are never replayed
+        retries = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+                        raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'content-type': "multipart/form-data", 'accept': ACCEPT_HEADER})
+
+        return session
+
+    @property
+    def cookies(self):
+        return self.session.cookies.get_dict()
+
+    def request(self, method, path, data=None, **kwargs):
+        """
+        Send a request to the VTN through the pooled session, adding the authenticity token to the form data.
+        If the VTN answers that the session expired, log in again (once) and replay the request.
+        :param method: the HTTP method
+        :param path: the path of the resource on the VTN, starting with '/'
+        :param data: the form data, as a dictionary or a list of (key, value) tuples
+        :return: the response
+        """
+        generation = self.__login_generation
+        rsp = self.send(method, path, data, **kwargs)
+
+        if path not in (LOGIN_PATH, LOGOUT_PATH) and self.is_authentication_required(rsp):
+            with self.__login_lock:
+                # Another thread may have logged in again in the meantime
+                if self.__login_generation == generation:
+                    self.__login()
+            VTN_LOGINS.inc()
+            rsp = self.send(method, path, data, **kwargs)
+
+        return rsp
+
+    def send(self, method, path, data=None, **kwargs):
+        # Form data given as a list of (key, value) tuples keeps repeated keys, e.g. for multiple intervals
+        if data is None:
+            form = []
+        elif type(data) == list:
+            form = list(data)
+        else:
+            form = list(data.items())
+
+        if self.authenticity_token:
+            form.append(("authenticity_token", self.authenticity_token))
+
+        req_url = self.url + ":" + self.port + path
+        endpoint = get_endpoint(path)
+
+        start = time.perf_counter()
+        try:
+            rsp = self.session.request(method, req_url, data=form, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            VTN_REQUEST_ERRORS.inc(method=method, endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            VTN_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, endpoint=endpoint)
+
+        if rsp.status_code >= 400:
+            VTN_REQUEST_ERRORS.inc(method=method, endpoint=endpoint, error=rsp.status_code)
+
+        return rsp
+
+    def is_authentication_required(self, rsp):
+        """
+        Check if the VTN refused a request because the session is not valid anymore: it then answers 401 or redirects
+        to the login page
+        """
+        if rsp.status_code == 401:
+            return True
+
+        for r in rsp.history + [rsp]:
+            if r.is_redirect and r.headers.get('Location', '').split('?')[0].endswith(LOGIN_PATH):
+                return True
+
+        return False
+
+    def ensure_logged_in(self):
+        """
+        Make sure a session is opened with the VTN, reusing the cached session if it has not expired, or logging in
+        """
+        with self.__login_lock:
+            if self.authenticity_token != "" and self.cookies != {}:
+                return
+            if self.load_session():
+                self.__login_generation += 1
+                return
+            self.__login()
+
+    def load_session(self):
+        """
+        Restore the session cached on disk by a previous run
+        :return: True if a valid session was restored, False otherwise
+        """
+        if not self.session_cache_file or not os.path.isfile(self.session_cache_file):
+            return False
+
+        try:
+            with open(self.session_cache_file, 'r') as f:
+                cache = json.load(f)
+        except (IOError, ValueError):
+            return False
+
+        if cache.get("url") != self.url + ":" + self.port or cache.get("username") != self.username:
+            return False
+        if cache.get("expires_at", 0) <= time.time():
+            return False
+
+        self.session.cookies.clear()
+        for c in cache["cookies"]:
+            self.session.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"])
+        self.authenticity_token = cache["authenticity_token"]
+
+        return True
+
+    def save_session(self):
+        """
+        Cache the current session on disk, so that the next runs don't have to log in again
+        """
+        if not self.session_cache_file:
+            return
+
+        cache = {
+            "url": self.url + ":" + self.port,
+            "username": self.username,
+            "expires_at": time.time() + self.session_ttl,
+            "authenticity_token": self.authenticity_token,
+            "cookies": [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path} for c in self.session.cookies]
+        }
+
+        # Write to a temporary file first, so that another process never reads a half-written cache
+        tmp_file = "{0}.{1}.tmp".format(self.session_cache_file, os.getpid())
+        with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, self.session_cache_file)
+
+    def clear_session(self):
+        """
+        Forget the current session, in memory and on disk
+        """
+        self.authenticity_token = ""
+        self.session.cookies.clear()
+        if self.session_cache_file and os.path.isfile(self.session_cache_file):
+            os.remove(self.session_cache_file)
+
+    def is_json(self, rsp):
+        return rsp.headers.get('Content-Type', '').startswith('application/json')
 
     def get_authenticity_token(self, content):
-        for line in content.split('\n'):
-            if line.strip().endswith("name=\"csrf-token\" />"):
-                authenticity_token = line.strip()
-                start = authenticity_token.find("\"") + 1
-                end = authenticity_token.find("name") - 2
-                return authenticity_token[start:end]
+        """
+        Fallback for VTN versions that don't answer the login in JSON: find the CSRF token in the meta tags of a page
+        :param content: the HTML page
+        :return: the token, or None if it was not found
+        """
+        match = CSRF_META_REGEX.search(content)
+        if match is None:
+            return None
+        return match.group(1) or match.group(2)
 
     def login(self):
+        with self.__login_lock:
+            return self.__login()
+
+    def __login(self):
+        """
+        Open a new session with the VTN. The caller holds the login lock, so that the other threads don't replay their
+        calls with a session that is being replaced.
+        """
         data = {
             "session[agree]": "[...]",
             "0": 0,
@@ -30,16 +299,28 @@ class VTN_Api():
             "session[user_name]": self.username,
             "utf8": True,
         }
-        headers = {
-            'content-type': "multipart/form-data"
-        }
 
-        req_url = self.url + ":" + self.port + "/login"
-        rsp = requests.post(req_url, data=data, headers=headers)
-        content = (rsp.content).decode("utf8")
-        self.authenticity_token = self.get_authenticity_token(content)
-        self.cookies = rsp.history[0].cookies.get_dict()
-        self.cookies.update(rsp.cookies.get_dict())
+        # Start from a fresh session: the cookies of the new one are stored by the session itself
+        self.authenticity_token = ""
+        self.session.cookies.clear()
+
+        rsp = self.request('POST', LOGIN_PATH, data=data, allow_redirects=False)
+
+        if self.is_json(rsp):
+            self.authenticity_token = rsp.json().get("authenticity_token") or ""
+        elif rsp.is_redirect:
+            # Older VTN versions redirect to the list of events, whose page holds the token
+            page = self.session.get(urljoin(rsp.url, rsp.headers['Location']), timeout=self.timeout)
+            self.authenticity_token = self.get_authenticity_token(page.content.decode("utf8")) or ""
+        else:
+            self.authenticity_token = self.get_authenticity_token(rsp.content.decode("utf8")) or ""
+
+        if self.authenticity_token and self.cookies != {}:
+            self.save_session()
+
+        # Only once the new session is complete: the threads refused during the login replay their calls with it
+        self.__login_generation += 1
+
         return rsp
 
     def create_single_event(self, payload, signal_name_id, signal_type_id, dtstart_str, duration, market_context_id,
@@ -57,45 +338,49 @@ class VTN_Api():
             "event_interface[event][test_event]": test_event,
             "event_interface[event][time_zone]": timezone,
             "event_interface[event][vtn_comment]": vtn_comment,
-            "utf8": True,
-            "authenticity_token": self.authenticity_token
-        }
-        headers = {
-            'content-type': "multipart/form-data"
+            "utf8": True
         }
-        req_url = self.url + ":" + self.port + "/events"
-        return requests.post(req_url, data=data, cookies=self.cookies, headers=headers)
+        return self.request('POST', "/events", data=data, allow_redirects=False)
 
-    def create_events(self, events):
+    def create_multi_interval_event(self, intervals, signal_name_id, signal_type_id, dtstart_str, market_context_id,
+                                    priority, response_required_type_id, test_event, timezone, vtn_comment):
+        """
+        Create an event made of several consecutive intervals, in a single request
+        :param intervals: a list of (duration, payload) tuples, the duration being in minutes
+        :return: the response of the VTN
+        """
+        data = [
+            ("event_interface[event_signal][signal_name_id]", signal_name_id),
+            ("event_interface[event_signal][signal_type_id]", signal_type_id),
+            ("event_interface[event][dtstart_str]", dtstart_str),
+            ("event_interface[event][duration]", sum([duration for duration, payload in intervals])),
+            ("event_interface[event][market_context_id]", market_context_id),
+            ("event_interface[event][priority]", priority),
+            ("event_interface[event][response_required_type_id]", response_required_type_id),
+            ("event_interface[event][test_event]", test_event),
+            ("event_interface[event][time_zone]", timezone),
+            ("event_interface[event][vtn_comment]", vtn_comment),
+            ("utf8", True)
+        ]
+        for duration, payload in intervals:
+            data.append(("event_interface[event_signal_intervals][][duration]", duration))
+            data.append(("event_interface[event_signal_intervals][][payload]", payload))
 
-        if self.authenticity_token == "" or self.cookies == {}:
-            print ("Error. Not logged in yet. Run login() first")
-            return
+        return self.request('POST', "/events", data=data, allow_redirects=False)
 
-        if type(events) == list:
-            responses = []
-            for event in events:
-                response = self.create_single_event(
-                    payload=event["payload"],
-                    signal_name_id=event["signal_name_id"],
-                    signal_type_id=event["signal_type_id"],
-                    dtstart_str=event["dtstart_str"],
-                    duration=int(event["duration"].seconds/60.0),
-                    market_context_id=event["market_context_id"],
-                    priority=event["priority"],
-                    response_required_type_id=event["response_required_type_id"],
-                    test_event=event["test_event"],
-                    timezone=event["time_zone"],
-                    vtn_comment=event["vtn_comment"])
-                responses.append(response)
-            return responses
-        else:
-            return self.create_single_event(
-                payload=event["payload"],
+    def create_event(self, event):
+        """
+        Create one event from a dictionary formatted by event_json_readers.format_dr_event(), or merged by
+        event_json_readers.coalesce_dr_events() (in which case all its intervals are sent in the same request)
+        :param event: the event dictionary
+        :return: the response of the VTN
+        """
+        if "intervals" in event:
+            return self.create_multi_interval_event(
+                intervals=[(int(duration.total_seconds()/60.0), payload) for duration, payload in event["intervals"]],
                 signal_name_id=event["signal_name_id"],
                 signal_type_id=event["signal_type_id"],
                 dtstart_str=event["dtstart_str"],
-                duration=int(event["duration"].seconds/60.0),
                 market_context_id=event["market_context_id"],
                 priority=event["priority"],
                 response_required_type_id=event["response_required_type_id"],
@@ -103,7 +388,98 @@ class VTN_Api():
                 timezone=event["time_zone"],
                 vtn_comment=event["vtn_comment"])
 
+        return self.create_single_event(
+            payload=event["payload"],
+            signal_name_id=event["signal_name_id"],
+            signal_type_id=event["signal_type_id"],
+            dtstart_str=event["dtstart_str"],
+            duration=int(event["duration"].seconds/60.0),
+            market_context_id=event["market_context_id"],
+            priority=event["priority"],
+            response_required_type_id=event["response_required_type_id"],
+            test_event=event["test_event"],
+            timezone=event["time_zone"],
+            vtn_comment=event["vtn_comment"])
+
+    def create_events(self, events):
+        """
+        :raise NotLoggedInError: if login() was not called
+        """
+        if self.authenticity_token == "" or self.cookies == {}:
+            raise NotLoggedInError("Not logged in yet. Run login() first")
+
+        if type(events) == list:
+            return [self.create_event(event) for event in events]
+        else:
+            return self.create_event(events)
+
+    def submit_event(self, event, target_id):
+        """
+        Push one event through the whole pipeline: create it, add the target and publish it.
+        Any error is caught and stored in the returned result, so that it does not stop the other submissions.
+        :param event: the event dictionary
+        :param target_id: the id of the target to add to the event
+        :return: an EventSubmission
+        """
+        result = EventSubmission(event)
+
+        try:
+            rsp = self.create_event(event)
+            rsp.raise_for_status()
+            result.event_id = self.get_event_id(rsp)
+            result.status = EventSubmission.CREATED
+
+            self.add_target_to_event(event_id=result.event_id, target_id=target_id).raise_for_status()
+            result.status = EventSubmission.TARGETED
+
+            self.publish_event(event_id=result.event_id).raise_for_status()
+            result.status = EventSubmission.PUBLISHED
+        except Exception as e:
+            result.fail(e)
+
+        return result
+
+    def submit_events(self, events, target_id=4, max_concurrency=None):
+        """
+        Create, target and publish a list of events, with at most max_concurrency events in flight at the same time.
+        Each event goes through the pipeline on its own, so a slow or failed event does not stall the others.
+        :param events: a list of event dictionaries
+        :param target_id: the id of the target to add to each event
+        :param max_concurrency: the amount of events pushed in parallel (default: the "max_concurrency" setting)
+        :return: the list of EventSubmission, in the same order as the events; they all failed with a NotLoggedInError
+        if login() was not called
+        """
+        if self.authenticity_token == "" or self.cookies == {}:
+            results = [EventSubmission(ev) for ev in events]
+            for res in results:
+                res.fail(NotLoggedInError("Not logged in yet. Run login() first"))
+            return results
+
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency
+
+        # More workers than pooled connections would only wait for a free connection
+        max_workers = max(1, min(max_concurrency, self.pool_size, len(events)))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda ev: self.submit_event(ev, target_id), events))
+
     def get_event_id(self, response):
+        """
+        Get the id of the event created by create_single_event() or create_multi_interval_event()
+        :param response: the response of the VTN
+        :return: the id of the event
+        """
+        if self.is_json(response):
+            return int(response.json()["id"])
+
+        # The VTN redirects to the page of the created event
+        for r in [response] + response.history:
+            match = EVENT_LOCATION_REGEX.search(r.headers.get('Location', ''))
+            if match is not None:
+                return int(match.group(1))
+
+        # Fallback: find the event in the HTML page
         content = response.content.decode("utf8")
         start_idx = content.find("<div class=\"item current\">")
         return int(content[start_idx:].split("/events/")[1].split("\">")[0])
@@ -111,32 +487,29 @@ class VTN_Api():
     def add_target_to_event(self, event_id, target_id=4):
         data = {
             "utf8": True,
-            "authenticity_token": self.authenticity_token,
             "target[id][]": target_id
         }
-        headers = {
-            'content-type': "multipart/form-data"
-        }
-        req_url = self.url + ":" + self.port + "/events/%d/add_targets" % event_id
-        return requests.put(req_url, data=data, cookies=self.cookies, headers=headers)
+        return self.request('PUT', "/events/%d/add_targets" % event_id, data=data, allow_redirects=False)
 
     def publish_event(self, event_id):
         data = {
-            "utf8": True,
-            "authenticity_token": self.authenticity_token
-        }
-        headers = {
-            'content-type': "multipart/form-data"
+            "utf8": True
         }
-        req_url = self.url + ":" + self.port + "/events/%d/publish" % event_id
-        return requests.put(req_url, data=data, cookies=self.cookies, headers=headers)
+        return self.request('PUT', "/events/%d/publish" % event_id, data=data, allow_redirects=False)
 
-    def logout(self):
+    def cancel_event(self, event_id):
         data = {
-            "authenticity_token":self.authenticity_token
-        }
-        headers = {
-            'content-type': "multipart/form-data"
+            "utf8": True
         }
-        req_url = self.url+":"+self.port+"/logout"
-        return requests.delete(req_url, data=data, cookies = self.cookies, headers = headers)
\ No newline at end of file
+        return self.request('PUT', "/events/%d/cancel" % event_id, data=data, allow_redirects=False)
+
+    def logout(self):
+        rsp = self.request('DELETE', LOGOUT_PATH, allow_redirects=False)
+        self.clear_session()
+        return rsp
+
+    def close(self):
+        """
+        Close the connections kept open in the session pool
+        """
+        self.session.close()
@@ -0,0 +1,76 @@
+import os
+import argparse
+from .common import Timer, latency_summary, get_rss_mb, get_peak_rss_mb, print_result
+from .stub_vtn import StubVTN
+from .workloads import generate_pdp_events
+
+PDP_EVENTS_FILE = 'pdp_events.json'
+SETTINGS_FILE = 'settings.json'
+
+
+def run(workdir, n_events, latency, max_concurrency, pool_size, json_mode=False, seed=0):
+    """
+    Push n_events PDP events to a stub VTN answering after latency seconds: read and format the events like
+    event_json_readers, then create, target and publish them with VTN_Api.submit_events()
+    :return: a dictionary of results
+    """
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    vtn = StubVTN(latency=latency, json_mode=json_mode).start()
+    vtn.write_settings(SETTINGS_FILE, pool_size=pool_size, max_concurrency=max_concurrency)
+    generate_pdp_events(PDP_EVENTS_FILE, n_events, seed)
+
+    from .. import event_json_readers as readers
+    from ..VTN_Api import VTN_Api
+
+    with Timer() as t_prepare:
+        data = readers.read_from_json(PDP_EVENTS_FILE)
+        events = [readers.format_dr_event(4, 4, e['start_date'], e['dur'], e['price']) for e in data]
+        events = readers.coalesce_dr_events(events)
+
+    api = VTN_Api(config_file=SETTINGS_FILE)
+    with Timer() as t_login:
+        api.ensure_logged_in()
+
+    with Timer() as t_push:
+        results = api.submit_events(events, target_id=readers.DR_EVENT_SOLARPLUS_VEN_TARGET_ID)
+
+    # Latency of the single events, measured sequentially
+    durations = []
+    for ev in events[:min(len(events), 50)]:
+        with Timer() as t:
+            api.submit_event(ev, readers.DR_EVENT_SOLARPLUS_VEN_TARGET_ID)
+        durations.append(t.elapsed)
+
+    api.close()
+    vtn.stop()
+
+    published = len([res for res in results if res.succeeded])
+    return {'events': len(events),
+            'published': published,
+            'failed': len(events) - published,
+            'vtn_latency_s': latency,
+            'max_concurrency': max_concurrency,
+            'prepare_s': round(t_prepare.elapsed, 4),
+            'login_s': round(t_login.elapsed, 4),
+            'push_s': round(t_push.elapsed, 4),
+            'push_events_per_s': round(len(events) / t_push.elapsed, 2),
+            'event_latency': latency_summary(durations),
+            'vtn_calls': vtn.get_calls(),
+            'rss_mb': get_rss_mb(),
+            'peak_rss_mb': get_peak_rss_mb()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the bulk push of events to a stub VTN")
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.005, help="the latency of the stub VTN, in seconds")
+    parser.add_argument('--max-concurrency', type=int, default=4)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--json-vtn', action='store_true', help="the stub VTN answers in JSON")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print_result(run(args.workdir, args.events, args.latency, args.max_concurrency, args.pool_size, args.json_vtn, args.seed))
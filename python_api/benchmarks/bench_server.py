@@ -0,0 +1,107 @@
+import os
+import argparse
+import threading
+from .common import Timer, latency_summary, get_rss_mb, get_peak_rss_mb, print_result, use_server_modules
+from .workloads import generate_dr_custom_data, random_timeframes
+
+DR_FOLDER = 'dr-custom-data'
+RELEASE_TIMEOUT = 600  # Maximum time waited for the scheduler to release the ingested events, in seconds
+
+
+def run(workdir, n_events, n_tariffs, n_queries, decode_processes=None, seed=0):
+    """
+    Ingest n_events DR events from generated files with update_dr_events(), wait for their release, then query them
+    with get_available_events() on random windows, twice (cold, then served from the caches)
+    :param decode_processes: the processes decoding the large files, None for the server default
+    :return: a dictionary of results
+    """
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    with Timer() as t_generate:
+        amounts = generate_dr_custom_data(DR_FOLDER, n_events, n_tariffs, seed)
+
+    rss_start = get_rss_mb()
+    use_server_modules()
+    with Timer() as t_import:
+        import dr_custom_server as server
+        from file_watcher import FileWatcher
+    server.logger.setLevel('WARNING')
+    if decode_processes is not None:
+        server.DECODE_PROCESSES = decode_processes
+    rss_imported = get_rss_mb()
+
+    # Ingest: read and decode the files, schedule the events
+    watcher = FileWatcher(DR_FOLDER)
+    with Timer() as t_ingest:
+        server.update_dr_events(watcher)
+    rss_ingested = get_rss_mb()
+
+    # Release: the notification dates are in the past, all the events are due
+    manager = server.get_drevent_manager()
+    released = {'amount': 0}
+    all_released = threading.Event()
+
+    def count_released(added, removed, version, full=False):
+        released['amount'] += len(added)
+        if released['amount'] >= sum(amounts.values()):
+            all_released.set()
+
+    manager.add_listener(count_released)
+    scheduler = server.get_event_scheduler()
+    with Timer() as t_release:
+        scheduler.start()
+        all_released.wait(RELEASE_TIMEOUT)
+    scheduler.stop()
+    watcher.stop()
+
+    types_dr = sorted(amounts)
+    timeframes = random_timeframes(n_queries, seed)
+
+    def query_latencies():
+        durations = []
+        for i, timeframe in enumerate(timeframes):
+            with Timer() as t:
+                manager.get_available_events(types_dr[i % len(types_dr)], timeframe)
+            durations.append(t.elapsed)
+        return durations
+
+    cold = query_latencies()
+    warm = query_latencies()
+
+    with Timer() as t_all:
+        manager.get_available_events(None, None)
+
+    if server.decode_pool is not None:
+        server.decode_pool.shutdown()
+
+    return {'events': n_events,
+            'tariffs': n_tariffs,
+            'files': amounts,
+            'generate_s': round(t_generate.elapsed, 4),
+            'import_s': round(t_import.elapsed, 4),
+            'ingest_s': round(t_ingest.elapsed, 4),
+            'ingest_events_per_s': round(n_events / t_ingest.elapsed, 2),
+            'release_s': round(t_release.elapsed, 4),
+            'available_events': len(manager.select_events()),
+            'query_cold': latency_summary(cold),
+            'query_warm': latency_summary(warm),
+            'query_all_s': round(t_all.elapsed, 4),
+            'rss_start_mb': rss_start,
+            'rss_imported_mb': rss_imported,
+            'rss_ingested_mb': rss_ingested,
+            'rss_mb': get_rss_mb(),
+            'peak_rss_mb': get_peak_rss_mb()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion and the queries of the DR server")
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--tariffs', type=int, default=1)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--decode-processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print_result(run(args.workdir, args.events, args.tariffs, args.queries, args.decode_processes, args.seed))
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from .common import Timer, latency_summary, print_result, REPOSITORY_DIR, PYTHON_API_DIR
+
+# The heavy dependencies whose loading is reported for each scenario
+HEAVY_MODULES = ['pandas', 'numpy', 'requests', 'dateutil', 'electricitycostcalculator']
+
+SETUP = "import sys; sys.path[:0] = [{0!r}, {1!r}]\n".format(REPOSITORY_DIR, PYTHON_API_DIR)
+
+# Each scenario is run in a new interpreter
+SCENARIOS = {
+    'interpreter': "pass",
+    'import_event_json_readers': "import python_api.event_json_readers",
+    'import_drevent_manager': "import drevent_manager",
+    'import_dr_custom_server': "import dr_custom_server",
+    # The server answers its first query (no events yet)
+    'server_first_response': "import dr_custom_server\n"
+                             "assert dr_custom_server.app.test_client().get('/get-all-signal').status_code == 200",
+}
+
+REPORT = "\nprint(json.dumps(sorted(m for m in {0!r} if m in sys.modules)))".format(HEAVY_MODULES)
+
+
+def run_scenario(code, workdir):
+    """
+    :return: a tuple (wall-clock duration of the interpreter, list of the heavy modules it loaded)
+    """
+    with Timer() as t:
+        proc = subprocess.run([sys.executable, '-c', SETUP + "import json\n" + code + REPORT], cwd=workdir,
+                              stdout=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise RuntimeError("The startup scenario failed:\n" + code)
+
+    return t.elapsed, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(workdir, repeat):
+    """
+    Measure the time to start an interpreter and import the modules of python_api, or serve a first query
+    :param repeat: the amount of runs of each scenario
+    :return: a dictionary of results
+    """
+    os.makedirs(workdir, exist_ok=True)
+
+    # A settings file like the one of a deployment, for the versions creating the VTN client at import
+    with open(os.path.join(workdir, 'settings.json'), 'w') as f:
+        json.dump({'url': 'http://127.0.0.1', 'port': '8080', 'username': 'benchmark', 'password': 'benchmark',
+                   'session_cache_file': None}, f)
+
+    ret = {}
+    for name, code in SCENARIOS.items():
+        durations = []
+        for i in range(repeat):
+            elapsed, loaded = run_scenario(code, workdir)
+            durations.append(elapsed)
+
+        summary = latency_summary(durations)
+        ret[name] = {'p50_ms': summary['p50_ms'], 'min_ms': round(min(durations) * 1000, 3), 'loaded_modules': loaded}
+
+    return ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the python_api modules")
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print_result(run(args.workdir, args.repeat))
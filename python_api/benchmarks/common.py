@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import math
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PYTHON_API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPOSITORY_DIR = os.path.dirname(PYTHON_API_DIR)
+
+
+def use_server_modules():
+    """
+    The DR server modules import each other as top-level modules (they are run from the python_api folder)
+    """
+    if PYTHON_API_DIR not in sys.path:
+        sys.path.insert(0, PYTHON_API_DIR)
+
+
+def percentile(values, p):
+    """
+    :param values: a sorted list of numbers
+    :param p: the percentile, between 0 and 100
+    :return: the value at the percentile (nearest rank), None if there are no values
+    """
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))
+    return values[rank]
+
+
+def latency_summary(durations):
+    """
+    :param durations: a list of durations, in seconds
+    :return: a dictionary of statistics of the durations, in milliseconds
+    """
+    values = sorted(durations)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {'count': len(values),
+            'mean_ms': ms(sum(values) / len(values)) if values else None,
+            'p50_ms': ms(percentile(values, 50)),
+            'p99_ms': ms(percentile(values, 99)),
+            'max_ms': ms(values[-1]) if values else None}
+
+
+def get_rss_mb():
+    """
+    :return: the current resident memory of the process in MB, or None if it is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6, 1)
+    except (IOError, ValueError, AttributeError):
+        return None
+
+
+def get_peak_rss_mb():
+    """
+    :return: the peak resident memory of the process in MB, or None if it is not available
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1e6 if sys.platform == 'darwin' else peak / 1e3, 1)  # Bytes on macOS, kB elsewhere
+
+
+class Timer():
+    """
+    Measure the wall-clock duration of a block: with Timer() as t: ...; t.elapsed
+    """
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.elapsed = None
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+def print_result(result):
+    """
+    Print the result of a benchmark run in a subprocess, as the last line of its output
+    """
+    sys.stdout.write(json.dumps(result) + '\n')
+    sys.stdout.flush()
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from .common import REPOSITORY_DIR
+
+RESULTS_VERSION = 1  # Incremented when the layout of the results changes
+DEFAULT_TOLERANCE = 0.2  # Relative change of a metric beyond which it is reported as a regression
+
+# The metrics compared with the baseline: suffix -> True if higher is better
+COMPARED_SUFFIXES = {'_per_s': True, '_s': False, '_ms': False, '_mb': False}
+IGNORED_METRICS = ['generate_s', 'vtn_latency_s']  # The generation of the workloads and the parameters
+# The parameters defining the workloads: the results are only compared with a baseline run with the same ones
+WORKLOAD_PARAMETERS = ['events', 'tariffs', 'queries', 'push_events', 'latency', 'max_concurrency', 'json_vtn',
+                       'decode_processes', 'startup_repeat', 'seed']
+
+
+def run_benchmark(module, workdir, options):
+    """
+    Run a benchmark module in its own process, so that its memory measurements are not affected by the other ones
+    :param module: the name of the module in python_api.benchmarks
+    :param options: the list of its command-line options
+    :return: the dictionary of its results
+    """
+    cmd = [sys.executable, '-m', 'python_api.benchmarks.' + module, '--workdir', workdir] + options
+    proc = subprocess.run(cmd, cwd=REPOSITORY_DIR, stdout=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise RuntimeError("The benchmark {0} failed with the exit code {1}".format(module, proc.returncode))
+
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_DIR, stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """
+    :return: a dictionary 'benchmark.metric' -> value of the numeric results
+    """
+    ret = {}
+    for k, v in results.items():
+        if isinstance(v, dict):
+            ret.update(flatten(v, prefix + k + '.'))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            ret[prefix + k] = v
+    return ret
+
+
+def parameter_differences(results, baseline):
+    """
+    :return: the list of the workload parameters that differ between the results and the baseline, as tuples
+    (parameter, baseline value, value)
+    """
+    current = results.get('parameters', {})
+    previous = baseline.get('parameters', {})
+    return [(name, previous.get(name), current.get(name)) for name in WORKLOAD_PARAMETERS
+            if previous.get(name) != current.get(name)]
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the results with those of a previous run
+    :return: the list of the regressions, as tuples (metric, baseline value, value)
+    :raise ValueError: if the baseline was run with other workload parameters, or has another layout
+    """
+    if baseline.get('version') != results['version']:
+        raise ValueError("the baseline results have the version {0}, expected {1}".format(baseline.get('version'), results['version']))
+
+    differences = parameter_differences(results, baseline)
+    if differences:
+        raise ValueError("the baseline was run with other parameters: " +
+                         ", ".join("{0}={1} (now {2})".format(name, previous, value) for name, previous, value in differences))
+
+    current = flatten(results['results'])
+    previous = flatten(baseline['results'])
+
+    regressions = []
+    for metric, value in sorted(current.items()):
+        suffix = [s for s in COMPARED_SUFFIXES if metric.endswith(s)]
+        if not suffix or not previous.get(metric) or metric.split('.')[-1] in IGNORED_METRICS:
+            continue
+
+        change = (value - previous[metric]) / float(previous[metric])
+        if (COMPARED_SUFFIXES[suffix[0]] and change < -tolerance) or (not COMPARED_SUFFIXES[suffix[0]] and change > tolerance):
+            regressions.append((metric, previous[metric], value))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the benchmarks and write their results in a JSON file")
+    parser.add_argument('--events', type=int, default=10000, help="the amount of DR events ingested by the server")
+    parser.add_argument('--tariffs', type=int, default=1, help="the amount of year-long real-time price tariffs")
+    parser.add_argument('--queries', type=int, default=1000, help="the amount of get_available_events() queries")
+    parser.add_argument('--push-events', type=int, default=1000, help="the amount of PDP events pushed to the stub VTN")
+    parser.add_argument('--latency', type=float, default=0.005, help="the latency of the stub VTN, in seconds")
+    parser.add_argument('--max-concurrency', type=int, default=4, help="the amount of events pushed in parallel")
+    parser.add_argument('--json-vtn', action='store_true', help="the stub VTN answers in JSON")
+    parser.add_argument('--decode-processes', type=int, default=None, help="the processes decoding the DR events files")
+    parser.add_argument('--startup-repeat', type=int, default=5, help="the amount of runs of each startup scenario")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', choices=['push', 'server', 'startup'], action='append', help="run only this benchmark (repeatable)")
+    parser.add_argument('--output', default='benchmark-results.json', help="the JSON file of the results")
+    parser.add_argument('--baseline', help="the results of a previous run with the same parameters: exit with an error if a metric regressed")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="the relative change tolerated by --baseline")
+    parser.add_argument('--keep-workdir', action='store_true', help="keep the generated files")
+    args = parser.parse_args()
+
+    benchmarks = args.only or ['push', 'server', 'startup']
+    workdir = tempfile.mkdtemp(prefix='dr-benchmarks-')
+
+    results = {}
+    try:
+        if 'push' in benchmarks:
+            options = ['--events', str(args.push_events), '--latency', str(args.latency),
+                       '--max-concurrency', str(args.max_concurrency), '--seed', str(args.seed)]
+            if args.json_vtn:
+                options.append('--json-vtn')
+            results['push'] = run_benchmark('bench_push', os.path.join(workdir, 'push'), options)
+
+        if 'server' in benchmarks:
+            options = ['--events', str(args.events), '--tariffs', str(args.tariffs), '--queries', str(args.queries),
+                       '--seed', str(args.seed)]
+            if args.decode_processes is not None:
+                options += ['--decode-processes', str(args.decode_processes)]
+            results['server'] = run_benchmark('bench_server', os.path.join(workdir, 'server'), options)
+
+        if 'startup' in benchmarks:
+            results['startup'] = run_benchmark('bench_startup', os.path.join(workdir, 'startup'), ['--repeat', str(args.startup_repeat)])
+    finally:
+        if args.keep_workdir:
+            print("Generated files kept in {}".format(workdir))
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {'version': RESULTS_VERSION,
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'commit': get_commit(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'parameters': vars(args),
+              'results': results}
+
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print("Results written to {}".format(args.output))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        try:
+            regressions = compare(output, baseline, args.tolerance)
+        except ValueError as e:
+            print("Not compared with {0}: {1}".format(args.baseline, e))
+            sys.exit(2)
+
+        for metric, previous, value in regressions:
+            print("REGRESSION {0}: {1} -> {2}".format(metric, previous, value))
+        if regressions:
+            sys.exit(1)
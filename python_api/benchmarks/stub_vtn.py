@@ -0,0 +1,208 @@
+import re
+import json
+import time
+import argparse
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SESSION_COOKIE = 'vtn_session'
+AUTHENTICITY_TOKEN = 'stub-authenticity-token'
+EVENT_ACTION_REGEX = re.compile(r'^/events/(\d+)/(add_targets|publish|cancel)/?$')
+
+
+class StubVTNHandler(BaseHTTPRequestHandler):
+    """
+    Answer the calls of VTN_Api like the EPRI VTN: the login redirects to the list of events (whose page holds the CSRF
+    token), the creation of an event redirects to its page, and the actions on an event redirect back to it.
+    In JSON mode, the login and the creation of an event answer in JSON instead.
+    """
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the VTN
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.count('connect')
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def reply(self, status, body=b'', headers=()):
+        time.sleep(self.server.latency)
+
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, path, headers=()):
+        self.reply(302, headers=[('Location', '{0}:{1}{2}'.format(self.server.url, self.server.server_port, path))] + list(headers))
+
+    def reply_injected_error(self):
+        """
+        Answer with the next error queued by StubVTN.inject_errors(), if any
+        :return: True if an error was sent
+        """
+        status = self.server.next_error()
+        if status is None:
+            return False
+        self.reply(status)
+        return True
+
+    def is_logged_in(self):
+        cookies = self.headers.get('Cookie', '')
+        return '{0}={1}'.format(SESSION_COOKIE, self.server.session_id) in cookies
+
+    def do_GET(self):
+        self.server.count('GET')
+        if self.path == '/events':
+            self.reply(200, '<html><head><meta content="{}" name="csrf-token" /></head></html>'.format(AUTHENTICITY_TOKEN).encode('utf8'),
+                       headers=[('Content-Type', 'text/html')])
+        elif self.path.startswith('/events/'):
+            self.reply(200, b'<html></html>', headers=[('Content-Type', 'text/html')])
+        else:
+            self.reply(404)
+
+    def do_POST(self):
+        self.read_body()
+        if self.reply_injected_error():
+            return
+        if self.path == '/login':
+            self.server.count('login')
+            cookie = ('Set-Cookie', '{0}={1}; path=/'.format(SESSION_COOKIE, self.server.session_id))
+            if self.server.json_mode:
+                self.reply(200, json.dumps({'authenticity_token': AUTHENTICITY_TOKEN}).encode('utf8'),
+                           headers=[('Content-Type', 'application/json'), cookie])
+            else:
+                self.redirect('/events', headers=[cookie])
+        elif self.path == '/events':
+            if not self.is_logged_in():
+                return self.redirect('/login')
+
+            self.server.count('create')
+            event_id = self.server.next_event_id()
+            if self.server.json_mode:
+                self.reply(201, json.dumps({'id': event_id}).encode('utf8'), headers=[('Content-Type', 'application/json')])
+            else:
+                self.redirect('/events/{}'.format(event_id))
+        else:
+            self.reply(404)
+
+    def do_PUT(self):
+        self.read_body()
+        if self.reply_injected_error():
+            return
+        match = EVENT_ACTION_REGEX.match(self.path)
+        if match is None:
+            return self.reply(404)
+        if not self.is_logged_in():
+            return self.redirect('/login')
+
+        self.server.count(match.group(2))
+        self.redirect('/events/{}'.format(match.group(1)))
+
+    def do_DELETE(self):
+        self.read_body()
+        if self.path != '/logout':
+            return self.reply(404)
+
+        self.server.count('logout')
+        self.redirect('/login')
+
+
+class StubVTN(ThreadingHTTPServer):
+    """
+    A local stand-in for the VTN, answering each call after a configurable latency, to benchmark VTN_Api
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, json_mode=False):
+        """
+        :param port: the port to listen on, 0 for any free port
+        :param latency: the time waited before answering each call, in seconds
+        :param json_mode: answer the login and the creation of the events in JSON, like the recent VTN versions
+        """
+        ThreadingHTTPServer.__init__(self, (host, port), StubVTNHandler)
+        self.latency = latency
+        self.json_mode = json_mode
+        self.session_id = 'stub-session'
+
+        self.__lock = threading.Lock()
+        self.__event_ids = itertools.count(1)
+        self.__calls = {}
+        self.__errors = []
+        self.__thread = None
+
+    def next_event_id(self):
+        with self.__lock:
+            return next(self.__event_ids)
+
+    def count(self, call):
+        with self.__lock:
+            self.__calls[call] = self.__calls.get(call, 0) + 1
+
+    def inject_errors(self, count, status=503):
+        """
+        Answer the next POST and PUT calls with an error instead of handling them
+        :param count: the amount of calls to fail
+        :param status: the HTTP status of the errors
+        """
+        with self.__lock:
+            self.__errors.extend([status] * count)
+
+    def next_error(self):
+        with self.__lock:
+            return self.__errors.pop(0) if self.__errors else None
+
+    def get_calls(self):
+        """
+        :return: a dictionary call -> amount of calls received ('connect' counts the TCP connections opened)
+        """
+        with self.__lock:
+            return dict(self.__calls)
+
+    @property
+    def url(self):
+        return 'http://{}'.format(self.server_address[0])
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name='stub-vtn')
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def write_settings(self, filename, **options):
+        """
+        Write a VTN_Api settings file pointing to this server
+        :param options: additional settings, e.g. pool_size or max_concurrency
+        """
+        settings = {'url': self.url, 'port': str(self.server_port), 'username': 'benchmark', 'password': 'benchmark',
+                    'session_cache_file': None}
+        settings.update(options)
+        with open(filename, 'w') as f:
+            json.dump(settings, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the VTN, to benchmark VTN_Api")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="the time waited before answering each call, in seconds")
+    parser.add_argument('--json', action='store_true', help="answer the login and the creation of the events in JSON")
+    args = parser.parse_args()
+
+    server = StubVTN(port=args.port, latency=args.latency, json_mode=args.json)
+    print("Stub VTN listening on {0}:{1}".format(server.url, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,25 @@
+import pytest
+from .run import compare, RESULTS_VERSION
+
+
+def make_results(ingest_s, **parameters):
+    params = {'events': 1000, 'queries': 50, 'latency': 0.005, 'seed': 0, 'output': 'results.json'}
+    params.update(parameters)
+    return {'version': RESULTS_VERSION, 'parameters': params, 'results': {'server': {'ingest_s': ingest_s, 'generate_s': 1}}}
+
+
+def test_regressions_beyond_the_tolerance():
+    baseline = make_results(1.0)
+    assert compare(make_results(1.1), baseline, 0.2) == []
+    assert compare(make_results(1.5), baseline, 0.2) == [('server.ingest_s', 1.0, 1.5)]
+
+    # The parameters that do not define the workload may differ
+    assert compare(make_results(1.1, output='new.json'), baseline, 0.2) == []
+
+
+def test_baseline_with_other_parameters_is_refused():
+    with pytest.raises(ValueError, match='events=1000 \\(now 100000\\)'):
+        compare(make_results(10.0, events=100000), make_results(1.0))
+
+    with pytest.raises(ValueError):
+        compare(make_results(1.0), dict(make_results(1.0), version=RESULTS_VERSION - 1))
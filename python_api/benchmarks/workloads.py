@@ -0,0 +1,140 @@
+import os
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+# Share of each type of DR event in the generated dr-custom-data files
+DR_TYPES_SHARE = {'dr_shed': 0.3, 'dr_limit': 0.2, 'dr_shift': 0.3, 'dr_track': 0.2}
+DEFAULT_START = datetime(2019, 1, 1)
+DEFAULT_DAYS = 365  # The events are spread over a year
+MAX_EVENT_HOURS = 6  # Maximum duration of a generated DR event
+NOTIFICATION_LEAD = timedelta(days=1)  # Time between the notification and the start of the events
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def generate_dr_event(type_dr, idx, rnd, start=DEFAULT_START, days=DEFAULT_DAYS):
+    """
+    Generate an entry of a dr-custom-data file, with a random start date and duration
+    :param type_dr: 'dr_shed', 'dr_limit', 'dr_shift' or 'dr_track'
+    :param idx: the index of the entry, used as its id
+    :param rnd: a random.Random
+    :return: a dictionary, in the format of the dr-custom-data templates
+    """
+    st = start + timedelta(hours=rnd.randrange(days * 24))
+    hours = rnd.randint(1, MAX_EVENT_HOURS)
+    et = st + timedelta(hours=hours)
+
+    entry = {'id': '{0}-{1}'.format(type_dr, idx),
+             'type': type_dr.replace('_', '-'),
+             'notification-date': (st - NOTIFICATION_LEAD).strftime(DATE_FORMAT)}
+
+    if type_dr in ('dr_shed', 'dr_limit'):
+        entry['data'] = {'power': rnd.randint(-50, 50), 'start-date': st.strftime(DATE_FORMAT), 'end-date': et.strftime(DATE_FORMAT)}
+    elif type_dr == 'dr_shift':
+        mid = st + timedelta(hours=max(1, hours // 2))
+        power = rnd.randint(1, 20)
+        entry['data'] = {'power-take': power, 'power-relax': -power,
+                         'start-date-take': st.strftime(DATE_FORMAT), 'end-date-take': mid.strftime(DATE_FORMAT),
+                         'start-date-relax': mid.strftime(DATE_FORMAT), 'end-date-relax': et.strftime(DATE_FORMAT)}
+    elif type_dr == 'dr_track':
+        entry['data'] = {'profile': [rnd.randint(0, 100) for h in range(hours)],
+                         'start-date': st.strftime(DATE_FORMAT), 'end-date': (et - timedelta(seconds=1)).strftime(DATE_FORMAT)}
+    else:
+        raise ValueError("Unknown type of DR event '{}'".format(type_dr))
+
+    return entry
+
+
+def generate_rtp_tariff(idx, rnd, start=DEFAULT_START, days=DEFAULT_DAYS):
+    """
+    Generate a dr_prices entry of real-time prices: one hourly price over the whole period (8760 values for a year)
+    """
+    hours = days * 24
+    et = start + timedelta(hours=hours - 1)
+    return {'id': 'dr_prices-{}'.format(idx),
+            'type': 'price-rtp',
+            'notification-date': (start - NOTIFICATION_LEAD).strftime(DATE_FORMAT),
+            'start-date': start.strftime(DATE_FORMAT),
+            'end-date': et.strftime(DATE_FORMAT),
+            'data': {'price': [round(rnd.uniform(0.05, 0.5), 4) for h in range(hours)]}}
+
+
+def write_json_array(filename, entries):
+    """
+    Write a JSON array one entry at a time, so that the large workloads are not built in memory
+    """
+    with open(filename, 'w') as f:
+        f.write('[')
+        for i, entry in enumerate(entries):
+            if i > 0:
+                f.write(',\n')
+            json.dump(entry, f)
+        f.write(']\n')
+
+
+def generate_dr_custom_data(folder, n_events, n_tariffs=1, seed=0, start=DEFAULT_START, days=DEFAULT_DAYS):
+    """
+    Generate a dr-custom-data folder: n_events DR events shared between the types of DR_TYPES_SHARE, and n_tariffs
+    real-time price tariffs covering the whole period
+    :return: a dictionary type_dr -> amount of generated entries
+    """
+    rnd = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    amounts = {type_dr: int(n_events * share) for type_dr, share in DR_TYPES_SHARE.items()}
+    amounts['dr_shed'] += n_events - sum(amounts.values())
+
+    for type_dr, amount in amounts.items():
+        write_json_array(os.path.join(folder, type_dr + '.json'),
+                         (generate_dr_event(type_dr, i, rnd, start, days) for i in range(amount)))
+
+    write_json_array(os.path.join(folder, 'dr_prices.json'), (generate_rtp_tariff(i, rnd, start, days) for i in range(n_tariffs)))
+    amounts['dr_prices'] = n_tariffs
+
+    return amounts
+
+
+def generate_pdp_events(filename, n_events, seed=0, start=DEFAULT_START):
+    """
+    Generate a pdp_events.json file: one Peak-Day Pricing event per day, from 1 to 4 hours in the afternoon. The events
+    never touch, so that each of them is created in the VTN with its own request.
+    """
+    rnd = random.Random(seed)
+
+    def entries():
+        for i in range(n_events):
+            st = start + timedelta(days=i, hours=rnd.randint(12, 16))
+            et = st + timedelta(hours=rnd.randint(1, 4))
+            yield {'utility_id': 14328, 'start_date': st.strftime(DATE_FORMAT) + '-08:00',
+                   'end_date': et.strftime(DATE_FORMAT) + '-08:00', 'price': rnd.randint(1, 10)}
+
+    write_json_array(filename, entries())
+
+
+def random_timeframes(n, seed=0, start=DEFAULT_START, days=DEFAULT_DAYS, max_hours=48):
+    """
+    Generate the windows of n queries within the period of the generated events
+    :return: a list of tuples (start, end), as ISO strings
+    """
+    rnd = random.Random(seed)
+    ret = []
+    for i in range(n):
+        st = start + timedelta(hours=rnd.randrange(days * 24))
+        et = st + timedelta(hours=rnd.randint(1, max_hours))
+        ret.append((st.strftime(DATE_FORMAT), et.strftime(DATE_FORMAT)))
+
+    return ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic DR workloads")
+    parser.add_argument('--events', type=int, default=10000, help="the amount of DR events to generate")
+    parser.add_argument('--tariffs', type=int, default=1, help="the amount of year-long real-time price tariffs")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dr-folder', default='dr-custom-data', help="the folder of the generated DR events files")
+    parser.add_argument('--pdp-file', default='pdp_events.json', help="the generated PDP events file")
+    args = parser.parse_args()
+
+    print(generate_dr_custom_data(args.dr_folder, args.events, args.tariffs, args.seed))
+    generate_pdp_events(args.pdp_file, args.events, args.seed)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The DR server modules import each other as top-level modules, like when they are run from this folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -1,13 +1,26 @@
 # !flask/bin/python
-from flask import Flask, request, g
+from flask import Flask, Response, request, g
 import json
 import time
-from threading import Timer
 import logging
 from os import listdir
-from os.path import isfile, join
+from os.path import isfile, join, basename
 import threading
-from drevent_manager import DReventManager, read_from_json
+import argparse
+import hashlib
+import os
+import multiprocessing
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from drevent_manager import DReventManager, iter_from_json, get_content_hash, get_event_key, decode_batch, DEFAULT_DT, STAGE_SECONDS
+from event_index import to_ns
+from event_scheduler import EventScheduler
+from file_watcher import FileWatcher
+from state_snapshot import write_snapshot, read_snapshot, ReleaseJournal, read_journal
+from event_notifier import EventBroadcaster, WebhookNotifier
+from event_store import SharedEventStore
+from signal_formats import negotiate_format, check_resolution, ndjson_lines, UnsupportedFormat, FORMAT_NDJSON, FORMAT_MSGPACK, FORMAT_MIMETYPES
+from metrics import REGISTRY, LAG_BUCKETS, BACKFILL_BUCKETS, PROMETHEUS_MIMETYPE, profile_call
 
 app = Flask(__name__)
 
@@ -18,9 +31,32 @@ logger = logging.getLogger('DR-SERVER')
 logger.setLevel(logging.INFO)
 
 ### CONFIGURATION
-TIME_REFRESH_EVENTS = 10  # The sleeping time, between which the DR events are updated from the files
+TIME_REFRESH_EVENTS = 10  # The maximum sleeping time, between which the DR events files are checked for changes
 FOLDER_DR_EVENTS = './dr-custom-data/'
 EXTERNAL_API = "http://127.0.0.1:5000"
+COMPACTION_INTERVAL = 60  # The time between two evictions of the expired DR events, in seconds
+EVENTS_ARCHIVE_FILE = './dr-events-archive.jsonl'  # The file to which the evicted DR events are appended
+SNAPSHOT_INTERVAL = 300  # The time between two snapshots of the server state, in seconds
+SNAPSHOT_FILE = './dr-server-snapshot.json'  # The snapshot restored when the server restarts
+RELEASE_JOURNAL_FILE = './dr-server-releases.jsonl'  # The events released since the snapshot, not released again on restart
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 5000
+SERVER_THREADS = 8  # The amount of threads serving the requests in production mode
+SSE_KEEPALIVE = 15  # The maximum time without sending anything to the SSE subscribers, in seconds
+LONG_POLL_TIMEOUT = 30  # The maximum time a long-poll request waits for new events, in seconds
+NOTIFY_URLS = []  # The downstream URLs notified of the released events, e.g. [EXTERNAL_API + "/dr-events"]
+DECODE_BATCH_SIZE = 5000  # The entries of a file are read and scheduled by batches of this size, to bound the memory
+DECODE_PROCESSES = (os.cpu_count() or 1) - 1  # The processes decoding the large batches of entries, 0 to decode in the reader thread
+PARALLEL_DECODE_MIN = 2000  # The batches smaller than this are decoded in the reader thread
+DECODE_CHUNK_SIZE = 500  # Amount of entries sent at once to a decoding process
+SHARED_STORE_FILE = './dr-events-store.sqlite'  # The events published by the ingest process to the workers
+REPLICA_REFRESH_INTERVAL = 0.2  # The time between two checks of the shared store by the workers, in seconds
+PROFILE_DIR = None  # The folder of the cProfile stats of the requests sent with ?profile=1, None to disable the profiling
+
+# Deployment roles
+ROLE_STANDALONE = 'standalone'  # A single process reads the files, releases the events and serves the API
+ROLE_INGEST = 'ingest'  # Reads the files and releases the events to the shared store, does not serve the API
+ROLE_WORKER = 'worker'  # Serves the API from a replica of the shared store, any number of worker processes can run
 
 list_dr_events = ['dr_prices','dr_shed', 'dr_limit', 'dr_shift', 'dr_track']
 
@@ -29,11 +65,27 @@ list_dr_events = ['dr_prices','dr_shed', 'dr_limit', 'dr_shift', 'dr_track']
 KEEP_READING_FILE = True
 
 # DR events information and state, to keep track of change and trigger new ones
-dr_manager = DReventManager()
+dr_manager = DReventManager(archive_file=EVENTS_ARCHIVE_FILE)
 
 def get_drevent_manager():
     return dr_manager
 
+# Subscribers notified of the released events, and downstream servers (started with the background tasks)
+event_broadcaster = EventBroadcaster()
+webhook_notifier = None
+
+# Record of the events released since the last snapshot (opened by the file reader)
+release_journal = None
+
+### METRICS, exposed on /metrics
+REQUEST_SECONDS = REGISTRY.histogram('dr_server_request_duration_seconds', "Duration of the API requests, until the response headers", ('endpoint', 'status'))
+DECODED_EVENTS = REGISTRY.counter('dr_server_decoded_events', "DR events decoded from the files", ('type_dr',))
+RELEASED_EVENTS = REGISTRY.counter('dr_server_released_events', "DR events released at their notification time", ('type_dr',))
+SCHEDULER_LAG = REGISTRY.histogram('dr_scheduler_lag_seconds', "Delay between the notification time of the DR events and their release", buckets=LAG_BUCKETS)
+SCHEDULER_BACKFILL = REGISTRY.histogram('dr_scheduler_backfill_seconds', "Delay between the notification time of the DR events read after it and their release", buckets=BACKFILL_BUCKETS)
+REGISTRY.gauge('dr_server_stored_bytes', "Estimated size of the signals of the available events", function=lambda: dr_manager.get_stored_size())
+REGISTRY.gauge('dr_server_events_version', "Version of the available events", function=lambda: dr_manager.get_version())
+
 #
 #### --- Flask API --- ####
 #
@@ -42,6 +94,38 @@ def print_receive_data(data_type, data_payload):
     print("Receive {} signal from the DR server:".format(data_type))
     print(data_payload)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+    # Opt-in profiling of a single request: the view is run under cProfile and its stats dumped in PROFILE_DIR
+    if PROFILE_DIR is not None and request.args.get('profile') == '1' and request.endpoint in app.view_functions:
+        view = app.view_functions[request.endpoint]
+        rsp, filename = profile_call(PROFILE_DIR, request.endpoint, view, **(request.view_args or {}))
+        rsp = app.make_response(rsp)
+        if filename is not None:
+            logger.info("Profile of {0} written to {1}".format(request.full_path, filename))
+            rsp.headers['X-Profile-File'] = filename
+        return rsp
+
+@app.after_request
+def observe_request_duration(rsp):
+    if 'request_start' in g:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unknown'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint, status=rsp.status_code)
+    return rsp
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    The metrics of the server, in the Prometheus text format
+    """
+    return Response(REGISTRY.render(), content_type=PROMETHEUS_MIMETYPE)
+
+# The ingest process does not serve the API, only its metrics
+metrics_app = Flask('dr-server-metrics')
+metrics_app.add_url_rule('/metrics', 'get_metrics', get_metrics)
+
 # - Test
 @app.route('/')
 def api_root():
@@ -62,10 +146,130 @@ def get_dr_signal(type_dr):
     if (st is not None) and (et is not None):
         timeframe = (st, et)
 
+    resolution = request.args.get('resolution')
+    since = request.args.get('since')
+    try:
+        fmt = negotiate_format(request.args.get('format'), request.accept_mimetypes)
+        check_resolution(resolution)
+        since = int(since) if since is not None else None
+        if timeframe is not None:
+            # Parsed like the index of the events does, to reject the malformed dates
+            to_ns(st), to_ns(et)
+    except UnsupportedFormat as e:
+        return Response(str(e), status=406)
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    ev_manager = get_drevent_manager()
+
+    # The version is read before building the response: if the events change meanwhile, the next request gets them
+    etag = make_etag(ev_manager.get_version(type_dr), type_dr, timeframe, resolution, fmt, since)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    if since is not None:
+        # Delta: only the events added, modified or removed after the version
+        data = ev_manager.get_available_changes_json(type_dr, since, timeframe, resolution, fmt)
+        rsp = Response(data, mimetype=FORMAT_MIMETYPES[FORMAT_MSGPACK] if fmt == FORMAT_MSGPACK else 'application/json')
+    elif fmt == FORMAT_NDJSON:
+        records = ev_manager.iter_available_records(type_dr, timeframe, resolution)
+        rsp = Response(ndjson_lines(records), mimetype=FORMAT_MIMETYPES[fmt])
+    else:
+        rsp = Response(ev_manager.get_available_events_json(type_dr, timeframe, resolution, fmt), mimetype=FORMAT_MIMETYPES[fmt])
+
+    rsp.set_etag(etag)
+    return rsp
+
+@app.route('/get-net-signal', methods=['GET'])
+def get_net_signal():
+
+    st = request.args.get('startdate')
+    et = request.args.get('enddate')
+    resolution = request.args.get('resolution', DEFAULT_DT)
+
+    if (st is None) or (et is None):
+        return Response('startdate and enddate are required', status=400)
+    try:
+        check_resolution(resolution)
+    except ValueError as e:
+        return Response(str(e), status=400)
+
     ev_manager = get_drevent_manager()
-    list_events = ev_manager.get_available_events(type_dr, timeframe)
 
-    return json.dumps(list_events)
+    etag = make_etag(ev_manager.get_version(), st, et, resolution)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    try:
+        data = ev_manager.get_net_signal_json((st, et), resolution)
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    rsp = Response(data, mimetype='application/json')
+    rsp.set_etag(etag)
+    return rsp
+
+def make_etag(version, *params):
+    """
+    The entity tag of a response: the version of the events it was built from, and a hash of the query parameters
+    """
+    return "{0}-{1}".format(version, hashlib.sha1(repr(params).encode('utf8')).hexdigest()[:12])
+
+def not_modified(etag):
+    rsp = Response(status=304)
+    rsp.set_etag(etag)
+    return rsp
+
+def get_subscription_args():
+    """
+    :return: a tuple (cursor of the last notification received, types of DR events to notify, None for all)
+    """
+    cursor = request.args.get('cursor', request.headers.get('Last-Event-ID'))
+    cursor = int(cursor) if cursor is not None else None
+
+    types_dr = request.args.get('type_dr')
+    types_dr = set(types_dr.split(',')) if types_dr else None
+
+    return cursor, types_dr
+
+@app.route('/stream', methods=['GET'])
+def stream_dr_events():
+    """
+    Server-Sent Events: one 'dr-event' message per released event, with its cursor as id
+    """
+    try:
+        cursor, types_dr = get_subscription_args()
+    except ValueError:
+        return Response('cursor must be an integer', status=400)
+
+    def generate(cursor):
+        if cursor is None:
+            cursor = event_broadcaster.current_cursor()
+        yield "retry: 1000\n\n"
+
+        while True:
+            notifications, cursor = event_broadcaster.wait_for(cursor, types_dr, SSE_KEEPALIVE)
+            if not notifications:
+                yield ": keepalive\n\n"
+            for n in notifications:
+                yield "id: {0}\nevent: dr-event\ndata: {1}\n\n".format(n['cursor'], json.dumps(n))
+
+    return Response(generate(cursor), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/poll', methods=['GET'])
+def poll_dr_events():
+    """
+    Long-poll: wait for the events released after the cursor, returns {"cursor": next cursor, "events": [...]}
+    """
+    try:
+        cursor, types_dr = get_subscription_args()
+        timeout = min(float(request.args.get('timeout', LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+    except ValueError:
+        return Response('cursor and timeout must be numbers', status=400)
+
+    notifications, cursor = event_broadcaster.wait_for(cursor, types_dr, timeout)
+
+    return Response(json.dumps({'cursor': cursor, 'events': notifications}), mimetype='application/json')
 
 #
 #### --- File management to update the DR events available --- ####
@@ -81,79 +285,427 @@ def init_event_scheduler():
     for f in listdir(FOLDER_DR_EVENTS):
         if isfile(join(FOLDER_DR_EVENTS, f)):
             name_dr = f.split(".")[0]
-            dr_manager.set_scheduled_amount(name_dr, 0)
+            dr_manager.set_scheduled_entries(name_dr, {})
 
 def push_event_to_queue(dr_data):
 
     global dr_manager
 
-    dr_manager.add_available_event(dr_data)
+    push_events_to_queue([dr_data])
+
+def push_events_to_queue(l_dr_data):
+
+    global dr_manager
+
+    logger.info("Releasing {} event(s)".format(len(l_dr_data)))
+    dr_manager.add_available_events(l_dr_data)
+    for dr_data in l_dr_data:
+        RELEASED_EVENTS.inc(type_dr=dr_data['type_dr'])
+
+    # Recorded before the notifications: after a crash, the events are restored without being notified again
+    if release_journal is not None:
+        try:
+            release_journal.record(l_dr_data)
+        except (IOError, TypeError, ValueError):
+            logger.exception("Could not record the release of {} event(s)".format(len(l_dr_data)))
+
+    # Notify the subscribers once the events are available
+    notifications = event_broadcaster.publish(l_dr_data)
+    if webhook_notifier is not None:
+        webhook_notifier.notify(notifications)
 
-def add_dr_event(type_dr, dr_raw_data):
+# A single thread releases the events at their notification time
+event_scheduler = EventScheduler(push_events_to_queue, lag_metric=SCHEDULER_LAG, backfill_metric=SCHEDULER_BACKFILL)
 
-    # Decode the event and create the timeseries
-    notif_time, data_dr = dr_manager.decode_rawjson(type_dr, dr_raw_data)
+def get_event_scheduler():
+    return event_scheduler
 
-    delay = max(0, notif_time - time.time())
+# Pool of processes decoding the large files, created when first needed
+decode_pool = None
 
-    # Scheduling the event to be triggered later
-    logger.info("Adding an event of type {0} to be available at time {1} ({2} seconds from now)".format(type_dr, notif_time, delay))
-    Timer(delay, push_event_to_queue, (data_dr,)).start()
+def get_decode_pool():
+    global decode_pool
 
-def update_dr_events():
+    if decode_pool is None:
+        # Spawned rather than forked: the server process runs several threads
+        decode_pool = ProcessPoolExecutor(max_workers=DECODE_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    return decode_pool
+
+def add_dr_events(type_dr, l_key_raw_data):
+    """
+    Decode and schedule a batch of DR events of a type. The large batches are decoded by a pool of processes, the
+    results being delivered in order.
+    :param l_key_raw_data: a list of tuples (key, raw data)
+    """
+    if len(l_key_raw_data) == 0:
+        return
+
+    with STAGE_SECONDS.time(stage='decode', type_dr=type_dr):
+        if DECODE_PROCESSES > 0 and len(l_key_raw_data) >= PARALLEL_DECODE_MIN:
+            chunks = [l_key_raw_data[i:i + DECODE_CHUNK_SIZE] for i in range(0, len(l_key_raw_data), DECODE_CHUNK_SIZE)]
+            decoded = [res for chunk in get_decode_pool().map(decode_batch, [type_dr] * len(chunks), chunks) for res in chunk]
+        else:
+            decoded = decode_batch(type_dr, l_key_raw_data)
+
+    # The malformed entries are skipped: they are decoded again once their file entry is fixed
+    for notif_time, data_dr, error in decoded:
+        if error is not None:
+            logger.warning("Skipping an invalid event of type {0}: {1}".format(type_dr, error))
+    decoded = [(notif_time, data_dr) for notif_time, data_dr, error in decoded if error is None]
+    DECODED_EVENTS.inc(len(decoded), type_dr=type_dr)
+
+    logger.info("Adding {0} event(s) of type {1}".format(len(decoded), type_dr))
+    for notif_time, data_dr in decoded:
+        event_scheduler.schedule(notif_time, data_dr, (type_dr, data_dr['key']))
+
+def remove_dr_events(type_dr, keys):
+    """
+    Remove a batch of DR events of a type: the pending ones are cancelled, the available ones are withdrawn at once, in
+    a single new version of the available events
+    :param keys: the keys of the events
     """
-    Read the files describing the DR events and add them internally
+    if len(keys) == 0:
+        return
+
+    # Each event is either still waiting for its notification time, or already available
+    available = [(type_dr, key) for key in keys if not event_scheduler.cancel((type_dr, key))]
+    if available:
+        dr_manager.remove_available_events(available)
+
+    logger.info("Removing {0} event(s) of type {1}".format(len(keys), type_dr))
+
+def update_dr_file(filepath):
+    """
+    Read a file describing DR events and apply the difference with the events already scheduled from it
+    :param filepath: the path of the file
     :return:
     """
     global dr_manager
 
-    for f in listdir(FOLDER_DR_EVENTS):
-        filepath = join(FOLDER_DR_EVENTS, f)
-        if isfile(join(FOLDER_DR_EVENTS, f)):
-            extension_file = f.split(".")[1]
-            type_dr = f.split(".")[0]
+    f = basename(filepath)
+    type_dr = f.split(".")[0]
+
+    # Compare the keys and contents of the scheduled events with the ones of the events in the file, read one entry at a
+    # time: only a batch of new or modified entries is kept in memory
+    scheduled_entries = dr_manager.get_scheduled_entries(type_dr)
+    file_entries = {}
+    batch = []
+    modified = []
+    try:
+        for dr_raw_data in iter_from_json(filepath):
+            content_hash = get_content_hash(dr_raw_data)
+            key = get_event_key(dr_raw_data, content_hash)
+            if key in file_entries:
+                continue
+            file_entries[key] = content_hash
+
+            if scheduled_entries.get(key) != content_hash:
+                if key in scheduled_entries:
+                    # An edited entry keeps its id: its previous version is cancelled, or withdrawn if already released,
+                    # before the new one is scheduled
+                    modified.append(key)
+                batch.append((key, dr_raw_data))
+
+            if len(batch) >= DECODE_BATCH_SIZE:
+                remove_dr_events(type_dr, modified)
+                add_dr_events(type_dr, batch)
+                batch = []
+                modified = []
+    except (IOError, ValueError) as e:
+        logger.warning("Could not read events in {0}: {1}".format(f, e))
+        # Keep the events read before the error, and the ones already scheduled
+        remove_dr_events(type_dr, modified)
+        add_dr_events(type_dr, batch)
+        entries = dict(scheduled_entries)
+        entries.update(file_entries)
+        dr_manager.set_scheduled_entries(type_dr, entries)
+        return
+
+    remove_dr_events(type_dr, modified)
+    add_dr_events(type_dr, batch)
+
+    remove_dr_events(type_dr, [key for key in scheduled_entries if key not in file_entries])
+
+    dr_manager.set_scheduled_entries(type_dr, file_entries)
+
+def remove_dr_file(filepath):
+    """
+    Remove the events of a deleted file
+    """
+    global dr_manager
 
-            if extension_file == 'json':
+    type_dr = basename(filepath).split(".")[0]
+    remove_dr_events(type_dr, list(dr_manager.get_scheduled_keys(type_dr)))
 
-                # Get the list of event
-                dr_list = read_from_json(filepath)
-                if dr_list is None: continue
-                if type(dr_list) is not list:
-                    logger.warning("Could not read events in {} because this is not a list".format(f))
-                    continue
+    dr_manager.set_scheduled_entries(type_dr, {})
 
-                # Compare the last stored length with the current file list length
-                if len(dr_list) > dr_manager.get_scheduled_amount(type_dr):
-                    for i in range(len(dr_list) - dr_manager.get_scheduled_amount(type_dr)):
-                        add_dr_event(type_dr, dr_list[i])
-                    dr_manager.set_scheduled_amount(type_dr, len(dr_list))
+def update_dr_events(watcher):
+    """
+    Read the files describing the DR events that changed since the last update and add them internally
+    :param watcher: the FileWatcher of the DR events folder
+    :return:
+    """
+    with STAGE_SECONDS.time(stage='scan', type_dr='all'):
+        changed_files, deleted_files = watcher.poll()
+    if changed_files or deleted_files:
+        logger.info(" Updating the event list")
+
+    for filepath in changed_files:
+        with STAGE_SECONDS.time(stage='update_file', type_dr=basename(filepath).split(".")[0]):
+            update_dr_file(filepath)
+
+    for filepath in deleted_files:
+        remove_dr_file(filepath)
+
+#### --- SNAPSHOTS OF THE SERVER STATE --- ####
+
+def save_snapshot(watcher):
+    """
+    Save the available events, the events waiting for their notification time and the state of the DR events files
+    :param watcher: the FileWatcher of the DR events folder
+    """
+    # The journal is marked first: the events released from then on are kept in it, whether the snapshot holds them as
+    # available, as pending, or not at all (released while it was taken)
+    mark = release_journal.mark() if release_journal is not None else None
+    pending = [[list(event_id), notif_time, data] for event_id, notif_time, data in event_scheduler.pending()]
+
+    state = {'folder': FOLDER_DR_EVENTS,
+             'manager': dr_manager.get_state(),
+             'pending': pending,
+             'files': watcher.get_state()}
+
+    try:
+        write_snapshot(SNAPSHOT_FILE, state)
+    except (IOError, TypeError, ValueError):
+        logger.exception("Could not save the snapshot of the server state")
+        return
+
+    if release_journal is not None:
+        release_journal.cut(mark)
+
+def restore_snapshot(watcher):
+    """
+    Restore the state saved by save_snapshot(), so that only the files changed since then are read again
+    :param watcher: the FileWatcher of the DR events folder
+    :return: True if a snapshot was restored, False otherwise
+    """
+    state = read_snapshot(SNAPSHOT_FILE)
+    if state is None or state['folder'] != FOLDER_DR_EVENTS:
+        return False
+
+    dr_manager.set_state(state['manager'])
+
+    # The events released after the snapshot are made available again, without notifying them twice
+    pending = {(type_dr, key): (notif_time, data) for (type_dr, key), notif_time, data in state['pending']}
+    released = []
+    for data in read_journal(RELEASE_JOURNAL_FILE):
+        event_id = (data['type_dr'], data['key'])
+        data.pop('version', None)  # Set by the manager on release
+        if event_id in pending and pending[event_id][1] == data:
+            del pending[event_id]
+            released.append(data)
+        elif event_id not in pending and dr_manager.get_available_event(*event_id) is None:
+            released.append(data)  # Released while the snapshot was taken
+    if released:
+        dr_manager.add_available_events(released)
+
+    # The events that were released while the snapshot was taken are already available
+    for (type_dr, key), (notif_time, data) in pending.items():
+        if dr_manager.get_available_event(type_dr, key) is None:
+            event_scheduler.schedule(notif_time, data, (type_dr, key))
+
+    watcher.set_state(state['files'])
+
+    logger.info(" Restored {} available and {} pending events from the snapshot, {} of them released since then".format(
+        len(state['manager']['events']) + len(released), len(pending), len(released)))
+
+    return True
+
+#### --- SHARED STORE, FOR THE MULTI-PROCESS DEPLOYMENT --- ####
+
+def start_publishing(store_file=SHARED_STORE_FILE):
+    """
+    Ingest role: publish every change of the events to the shared store
+    """
+    store = SharedEventStore(store_file)
+
+    # The store starts from the current events, not from the ones of a previous run
+    dr_manager.add_listener(store.publish)
+    state = dr_manager.get_state()
+    store.publish(state['events'], [], state['version'], full=True)
+
+    return store
+
+def replica_loop(store):
+    """
+    Worker role: keep the events of the manager up to date with the shared store, and notify the subscribers of the new
+    events
+    :param store: the SharedEventStore
+    """
+    since = -1  # Full load first
+    while KEEP_READING_FILE:
+        # The store can be locked or being replaced by the ingest process: the changes are read again on the next turn
+        try:
+            if store.get_version() != since:
+                version, events, removed, full = store.get_changes(since)
+                if full:
+                    dr_manager.set_state({'version': version, 'keys': {}, 'events': events, 'evicted': {}}, keep_version=True)
+                else:
+                    dr_manager.apply_changes(events, removed, version)
+
+                # A full reload (e.g. after a restart of the ingest process) also holds the events the replica already
+                # had: only the ones changed since its version are notified
+                if since >= 0:
+                    new_events = [ev for ev in events if ev.get('version', version) > since] if full else events
+                    if new_events:
+                        event_broadcaster.publish(new_events)
+                since = version
+        except (sqlite3.Error, ValueError, KeyError):
+            logger.exception("Could not read the changes of the shared store since version {}".format(since))
+
+        time.sleep(REPLICA_REFRESH_INTERVAL)
+
+def start_replica(store_file=SHARED_STORE_FILE):
+    """
+    Worker role: start the thread following the shared store
+    :return: the thread
+    """
+    store = SharedEventStore(store_file)
+    t = threading.Thread(target=replica_loop, args=(store,), name='dr-store-replica')
+    t.daemon = True
+    t.start()
+    return t
 
 #### --- FIlE READER PROCESS --- ####
 
 def file_reading_loop():
-    global KEEP_READING_FILE
+    global KEEP_READING_FILE, release_journal
 
-    # Init the scheduler state to keep track of the updates
-    init_event_scheduler()
+    # Restore the state of the last run, or init the scheduler state to keep track of the updates
+    watcher = FileWatcher(FOLDER_DR_EVENTS)
+    release_journal = ReleaseJournal(RELEASE_JOURNAL_FILE)
+    if not restore_snapshot(watcher):
+        release_journal.cut()
+        init_event_scheduler()
+    last_compaction = last_snapshot = time.time()
 
     # Run the server infinite loop
     while KEEP_READING_FILE:
-        # Read the events list, check if there is new ones and add them
-        logger.info(" Updating the event list")
-        update_dr_events()
+        # Read the files that changed, check if there are new or removed events and update them
+        update_dr_events(watcher)
+
+        # Publish all the events again to the shared store if a change could not be published
+        dr_manager.retry_listeners()
+
+        # Release the events that expired or exceed the memory budget
+        if time.time() - last_compaction >= COMPACTION_INTERVAL:
+            last_compaction = time.time()
+            nb_evicted = dr_manager.compact()
+            if nb_evicted > 0:
+                logger.info(" Evicted {} DR events".format(nb_evicted))
 
-        # Sleep
-        time.sleep(TIME_REFRESH_EVENTS)
+        if time.time() - last_snapshot >= SNAPSHOT_INTERVAL:
+            last_snapshot = time.time()
+            save_snapshot(watcher)
+
+        # Sleep until the next change
+        watcher.wait(min(TIME_REFRESH_EVENTS, COMPACTION_INTERVAL, SNAPSHOT_INTERVAL))
+
+    save_snapshot(watcher)
+    watcher.stop()
+
+
+def start_background_tasks(notify_urls=NOTIFY_URLS):
+    """
+    Start the scheduler releasing the DR events, the thread reading the DR events files and the downstream notifier
+    :param notify_urls: the URLs to which the released events are posted
+    :return: the file reader thread
+    """
+    global webhook_notifier
+
+    if notify_urls:
+        webhook_notifier = WebhookNotifier(notify_urls)
+
+    event_scheduler.start()
+    t = threading.Thread(target=file_reading_loop, name='dr-file-reader')
+    t.daemon = True
+    t.start()
+    return t
+
+def stop_background_tasks(t):
+    global KEEP_READING_FILE
+
+    KEEP_READING_FILE = False
+    t.join()
+    event_scheduler.stop()
+    if webhook_notifier is not None:
+        webhook_notifier.stop()
+    if decode_pool is not None:
+        decode_pool.shutdown()
+
+def serve(host, port, threads, wsgi_app=app):
+    """
+    Serve the API with a multi-threaded production WSGI server: waitress if it is installed, the threaded Werkzeug
+    server otherwise
+    """
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+
+    if waitress_serve is not None:
+        logger.info("Serving on {0}:{1} with waitress ({2} threads)".format(host, port, threads))
+        waitress_serve(wsgi_app, host=host, port=port, threads=threads)
+    else:
+        logger.info("Serving on {0}:{1} with the threaded Werkzeug server (install waitress for production)".format(host, port))
+        wsgi_app.run(host=host, port=port, debug=False, threaded=True, use_reloader=False)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Custom DR server")
+    parser.add_argument("--host", default=SERVER_HOST, help="the interface to listen on")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="the port to listen on")
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="the amount of threads serving the requests")
+    parser.add_argument("--debug", action="store_true", help="run the Flask development server in debug mode")
+    parser.add_argument("--notify-url", action="append", default=list(NOTIFY_URLS), help="a URL to which the released events are posted (repeatable)")
+    parser.add_argument("--role", choices=[ROLE_STANDALONE, ROLE_INGEST, ROLE_WORKER], default=ROLE_STANDALONE,
+                        help="standalone: single process; ingest: publish the events to the shared store; worker: serve the API from the shared store")
+    parser.add_argument("--store", default=SHARED_STORE_FILE, help="the SQLite file shared by the ingest and worker processes")
+    parser.add_argument("--decode-processes", type=int, default=DECODE_PROCESSES, help="the processes decoding the large DR events files, 0 to disable")
+    parser.add_argument("--retention-days", type=float, default=None,
+                        help="evict the events that ended more than this amount of days ago, kept forever by default")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR, help="enable the profiling of the requests sent with ?profile=1, their cProfile stats being written to this folder")
+    args = parser.parse_args()
+    DECODE_PROCESSES = args.decode_processes
+    PROFILE_DIR = args.profile_dir
+    if args.retention_days is not None:
+        dr_manager.retention_age = args.retention_days * 24 * 3600
+
     logger.info("#")
-    logger.info("### RUNNING THE CUSTOM DR SERVER ###")
+    logger.info("### RUNNING THE CUSTOM DR SERVER ({}) ###".format(args.role))
     logger.info("#")
 
-    t = threading.Thread(target=file_reading_loop)
-    t.start()
-    app.run(debug=True, use_reloader=False)
-    t.join()
+    if args.role == ROLE_WORKER:
+        t = start_replica(args.store)
+    else:
+        if args.role == ROLE_INGEST:
+            start_publishing(args.store)
+        t = start_background_tasks(args.notify_url)
+
+    try:
+        if args.role == ROLE_INGEST:
+            serve(args.host, args.port, 2, metrics_app)
+        elif args.debug:
+            app.run(host=args.host, port=args.port, debug=True, use_reloader=False)
+        else:
+            serve(args.host, args.port, args.threads)
+    except KeyboardInterrupt:
+        pass
+
+    if args.role == ROLE_WORKER:
+        KEEP_READING_FILE = False
+        t.join()
+    else:
+        stop_background_tasks(t)
 
     logger.info("--- KILLING THE CUSTOM DR SERVER ---")
\ No newline at end of file
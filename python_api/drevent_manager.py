@@ -3,180 +3,955 @@ __author__ = 'Olivier Van Cutsem'
 import time
 from datetime import datetime
 import json
-import os, sys
-from dateutil.parser import parse
-import pandas as pd
+import hashlib
+import os
+import threading
+import logging
+import collections
+from lazy_import import LazyModule
+from event_index import EventIntervalIndex, to_ns
+from lru_cache import LRUCache
+from json_stream import iter_json_array
+from signal_formats import FORMAT_JSON, resample_df, df_to_columnar, encode_records, encode_document
+from metrics import REGISTRY
+
+# The heavy dependencies are only imported when an event is materialized: the decoding of the events does not need them
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
 
 DEFAULT_DT = '1H'
+DEFAULT_DT_NS = 3600 * 10**9  # DEFAULT_DT in nanoseconds, to check the events without loading pandas
+SERIALIZATION_CACHE_SIZE = 4096  # Maximum amount of serialized events and query responses kept in memory
+SERIALIZATION_CACHE_BYTES = 64 * 1024 * 1024  # Maximum total size of the serialized events and query responses, in bytes
+TARIFF_CACHE_SIZE = 16  # Maximum amount of parsed tariff files kept in memory
+PRICE_CACHE_SIZE = 64  # Maximum amount of computed price signals kept in memory
+FRAME_CACHE_SIZE = 256  # Maximum amount of materialized event dataframes kept in memory
+FRAME_CACHE_BYTES = 128 * 1024 * 1024  # Maximum total size of the materialized event dataframes, in bytes
+
+# Retention of the available events: None disables the corresponding limit
+RETENTION_AGE = None  # Time after their end date before the events are evicted, in seconds (opt-in: the sample files are past-dated)
+MAX_EVENTS_MEMORY = 256 * 1024 * 1024  # Budget for the signals of the available events, in bytes (estimated)
+REMOVED_HISTORY_SIZE = 10000  # Amount of removed events remembered for the delta queries
+
+# How the power signals of the overlapping events are combined into the net signal
+NET_SIGNAL_SUM_TYPES = ['dr_shed', 'dr_shift']  # Summed
+NET_SIGNAL_MIN_TYPES = ['dr_limit']  # The lowest limit caps the result
+NET_SIGNAL_OVERRIDE_TYPES = ['dr_track']  # Replace the other signals
+
+# Time spent in each stage of the server, per type of DR event ('all' when the stage covers all the types)
+STAGE_SECONDS = REGISTRY.histogram('dr_server_stage_duration_seconds', "Duration of the processing stages of the DR server", ('stage', 'type_dr'))
+
+logger = logging.getLogger('DR-SERVER')
+
+def iter_from_json(filename):
+    """
+    Read a json file holding a list, one element at a time, without loading the whole file
+    :return: a generator of the elements of the list
+    :raise ValueError: if the file is not a json list
+    """
+    with open(filename, 'r') as input_file:
+        for element in iter_json_array(input_file):
+            yield element
+
 
-def read_from_json(filename):
+def slice_df(df, st, et):
     """
-    Read json data
-    :return:
-     - A JSON object of the file
+    Return the rows of a time-indexed dataframe between st and et (included), found by binary search on the index
     """
-    data_json = None
+    st, et = pd.Timestamp(st), pd.Timestamp(et)
+    if not df.index.is_monotonic_increasing:
+        return df[(df.index >= st) & (df.index <= et)]
 
-    try:
-        with open(filename, 'r') as input_file:
-            try:
-                data_json = json.load(input_file)
-            except ValueError:
-                print(('Could open {0} but failed to parse the json'.format(filename)))
-                return None
-    except:
-        print(('Cant open file {}'.format(filename)))
-        return None
+    lo = df.index.searchsorted(st, side='left')
+    hi = df.index.searchsorted(et, side='right')
+    return df.iloc[lo:hi]
 
-    return data_json
 
+def date_range_in_window(st, et, window=None, freq=DEFAULT_DT):
+    """
+    Return the points of pd.date_range(st, et, freq) that are inside the window, without building the whole range
+    :param window: a tuple (start, end), or None for the whole range
+    :return: a tuple (DatetimeIndex, position of its first point in the whole range)
+    """
+    st, et = pd.Timestamp(st), pd.Timestamp(et)
+    step = pd.Timedelta(freq)
 
-# Load the config and the CostCalculator Module
-from electricitycostcalculator.cost_calculator.cost_calculator import CostCalculator
-from electricitycostcalculator.cost_calculator.tariff_structure import *
-from electricitycostcalculator.openei_tariff.openei_tariff_analyzer import *
+    first, last = 0, (et - st) // step
+    if window is not None:
+        wst, wet = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+        if wst > st:
+            first = -((st - wst) // step)  # First point at or after the start of the window
+        if wet < et:
+            last = min(last, (wet - st) // step)
 
-import os, electricitycostcalculator
-costcalculator_path = os.path.dirname(electricitycostcalculator.__file__) + '/'
+    if last < first:
+        return pd.DatetimeIndex([], tz=st.tz), first
 
+    return pd.date_range(st + first * step, periods=last - first + 1, freq=freq), first
 
-class DReventManager():
 
-    def __init__(self):
-        self.__events_state = {}  # The amount of scheduled events since the beginning
-        self.__scheduled_queue = []  # This is an ordered list
+def slice_values(data, first, length):
+    """
+    Return the values of data (a list, or a dictionary of lists) between the positions first and first + length
+    """
+    if isinstance(data, dict):
+        return {k: v[first:first + length] for k, v in data.items()}
+
+    return data[first:first + length]
+
 
-        self.__tariff_manager = CostCalculator()
+def get_content_hash(raw_data):
+    """
+    The hash of the content of a DR event entry of a file, to detect its changes
+    """
+    content = json.dumps(raw_data, sort_keys=True)
+    return hashlib.sha1(content.encode('utf8')).hexdigest()
+
+
+def get_event_key(raw_data, content_hash=None):
+    """
+    A stable key identifying a DR event entry of a file: its "id" field if any, the hash of its content otherwise
+    :param content_hash: the result of get_content_hash(raw_data), if already computed
+    """
+    if isinstance(raw_data, dict) and 'id' in raw_data:
+        return str(raw_data['id'])
+
+    return content_hash if content_hash is not None else get_content_hash(raw_data)
+
+
+def serialization_size(value):
+    """
+    The size of a value of the serialization cache: an encoded response, or a tuple (event, serialized event)
+    """
+    if isinstance(value, tuple):
+        return len(value[1])
+    return len(value)
+
+
+def serialization_tags(cache_key):
+    """
+    The tags of the serialization cache entries, see DReventManager.__swap(): ('event', type_dr, key) for a serialized
+    event, ('query', type_dr) for a query response
+    """
+    if cache_key[0] == 'event':
+        return [cache_key[:3]]
+    return [cache_key[:2]]
+
+
+def frame_size(value):
+    """
+    The size of a value of the frame cache, a tuple (event, dataframe)
+    """
+    df = value[1]
+    return int(df.memory_usage(index=True).sum()) if df is not None else 0
+
+
+def decode_rawjson(type_dr, raw_data, key=None):
+    """
+    Decode a DR event entry into a compact description of its signal: the dataframe is only built by
+    DReventManager.materialize(), for the window that is queried. A module-level function, so that it can run in a
+    process pool.
+    :return: a tuple (notification time, decoded event)
+    """
+    # The notification date is in the ISO format "%Y-%m-%dT%H:%M:%S": fromisoformat() is much faster than strptime()
+    notif_time = time.mktime(datetime.fromisoformat(raw_data['notification-date']).timetuple())
+    if key is None:
+        key = get_event_key(raw_data)
+    ret_dict = {'type_dr': type_dr, 'key': key, 'startdate': None, 'enddate': None, 'signal': None}
+
+    if type_dr == 'dr_prices':
+        ret_dict['startdate'] = raw_data["start-date"]
+        ret_dict['enddate'] = raw_data["end-date"]
+        ret_dict['signal'] = {'kind': 'tariff', 'type': raw_data["type"], 'data': raw_data["data"]}
+    elif type_dr == 'dr_shed' or type_dr == 'dr_limit':
+        raw_data = raw_data["data"]
+        ret_dict['startdate'] = raw_data["start-date"]
+        ret_dict['enddate'] = raw_data["end-date"]
+        ret_dict['signal'] = {'kind': 'powerconstraints', 'timeframes': [(raw_data["start-date"], raw_data["end-date"])], 'power': [raw_data["power"]]}
+    elif type_dr == 'dr_shift':
+        raw_data = raw_data["data"]
+        ret_dict['startdate'] = raw_data["start-date-take"]
+        ret_dict['enddate'] = raw_data["end-date-relax"]
+        timeframe_list = [(raw_data["start-date-take"], raw_data["end-date-take"]), (raw_data["start-date-relax"], raw_data["end-date-relax"])]
+        power_list = [raw_data["power-take"], raw_data["power-relax"]]
+        ret_dict['signal'] = {'kind': 'powerconstraints', 'timeframes': timeframe_list, 'power': power_list}
+    elif type_dr == 'dr_track':
+        raw_data = raw_data["data"]
+        ret_dict['startdate'] = raw_data["start-date"]
+        ret_dict['enddate'] = raw_data["end-date"]
+        ret_dict['signal'] = {'kind': 'powersignal', 'profile': raw_data['profile']}
+
+    check_event(ret_dict)
+
+    return notif_time, ret_dict
+
+
+def check_event(ev):
+    """
+    Check that the signal of a decoded event can be materialized, so that a malformed entry is rejected when its file is
+    read, instead of failing the queries that include it
+    :raise ValueError: if the event is malformed
+    """
+    signal = ev['signal']
+    if ev['startdate'] is None or ev['enddate'] is None or signal is None:
+        return
+
+    st, et = to_ns(ev['startdate']), to_ns(ev['enddate'])
+    if et < st:
+        raise ValueError("the end date {0} is before the start date {1}".format(ev['enddate'], ev['startdate']))
+    points = (et - st) // DEFAULT_DT_NS + 1  # The length of the signal, at the DEFAULT_DT step
+
+    if signal['kind'] == 'tariff':
+        if signal['type'] == 'price-rtp':
+            columns = signal['data'].values() if isinstance(signal['data'], dict) else [signal['data']]
+            for values in columns:
+                if len(values) != points:
+                    raise ValueError("{0} prices for {1} time steps".format(len(values), points))
+        elif signal['type'] == 'price-tou':
+            tariff_path = get_costcalculator_path() + signal['data']['tariff-json']
+            if not os.path.isfile(tariff_path):
+                raise ValueError("the tariff file {} does not exist".format(tariff_path))
+    elif signal['kind'] == 'powerconstraints':
+        for (seg_st, seg_et), power in zip(signal['timeframes'], signal['power']):
+            if to_ns(seg_et) < to_ns(seg_st):
+                raise ValueError("the period {0} - {1} ends before it starts".format(seg_st, seg_et))
+            float(power)
+    elif signal['kind'] == 'powersignal':
+        if len(signal['profile']) != points:
+            raise ValueError("{0} profile values for {1} time steps".format(len(signal['profile']), points))
+        for value in signal['profile']:
+            float(value)
+
+
+def decode_batch(type_dr, l_key_raw_data):
+    """
+    Decode a batch of DR event entries of the same type, in a worker process of a pool
+    :param l_key_raw_data: a list of tuples (key, raw data)
+    :return: the list of the tuples (notification time, decoded event, error), in the same order. For a malformed
+    entry, the notification time and the event are None and error describes the problem.
+    """
+    ret = []
+    for key, raw_data in l_key_raw_data:
+        try:
+            ret.append(decode_rawjson(type_dr, raw_data, key) + (None,))
+        except Exception as e:
+            ret.append((None, None, "{0} {1}: {2}".format(key, type(e).__name__, e)))
+    return ret
+
+
+def get_costcalculator_path():
+    """
+    The folder of the electricitycostcalculator package, to which the paths of the tariff files are relative. The
+    package is only imported by the processes handling 'price-tou' events.
+    """
+    import electricitycostcalculator
+    return os.path.dirname(electricitycostcalculator.__file__) + '/'
+
+
+class DReventManager():
+
+    def __init__(self, retention_age=RETENTION_AGE, max_memory=MAX_EVENTS_MEMORY, archive_file=None):
+        """
+        :param retention_age: time after their end date before the events are evicted by compact(), in seconds
+        :param max_memory: the estimated size of the signals above which compact() evicts the oldest events, in bytes
+        :param archive_file: a JSON-lines file to which the evicted events are appended, or None to drop them
+        """
+        # The state is copy-on-write: the writers build a new version of the dictionaries and indexes under the write
+        # lock and then swap the reference, so that the readers never block nor see a half-updated state
+        self.__write_lock = threading.RLock()
+        self.__state_version = int(time.time() * 1000)  # Incremented after each swap, starts from a timestamp to keep increasing across restarts
+        self.__type_versions = {}  # type_dr -> version of the last swap that changed events of this type
+        self.__removed = collections.deque(maxlen=REMOVED_HISTORY_SIZE)  # (version, type_dr, key) of the removed events
+        self.__removed_horizon = 0  # The delta queries since an older version need a full response
+        self.__listeners = []  # Functions called on each change, see add_listener()
+        self.__stale_listeners = []  # The listeners that failed, to call with all the events
+        self.__events_state = {}  # The keys of the scheduled events, mapped to the hash of their content, per type of DR event
+        self.__scheduled_queue = {}  # The available events: an EventIntervalIndex per type of DR event
+
+        # Retention policy
+        self.retention_age = retention_age
+        self.max_memory = max_memory
+        self.archive_file = archive_file
+        self.__event_sizes = {}  # (type_dr, key) -> estimated size of the signal, in bytes
+        self.__stored_size = 0
+        self.__evicted = {}  # type_dr -> {'count': amount of evicted events, 'last_enddate': latest evicted end date}
+
+        # Serialized events, keyed by ('event', type_dr, key, timeframe, resolution), and encoded query responses, keyed
+        # by ('query', type_dr, timeframe, resolution, format)
+        # The events entries hold the event they were built from, and are only used for that same event
+        self.__json_cache = LRUCache(SERIALIZATION_CACHE_SIZE, SERIALIZATION_CACHE_BYTES, serialization_size, serialization_tags)
+
+        # The dataframes of the events are only built when queried, for the queried window and resolution, keyed by
+        # (type_dr, key, timeframe, resolution). The entries are (event, dataframe), like the events entries above.
+        self.__frame_cache = LRUCache(FRAME_CACHE_SIZE, FRAME_CACHE_BYTES, frame_size, lambda k: [k[:2]])
+
+        # One CostCalculator per tariff file, keyed by (path, mtime), and the price signals computed from them for the
+        # whole period of an event, keyed by (path, mtime, start date, end date, timestep)
+        self.__tariff_cache = LRUCache(TARIFF_CACHE_SIZE)
+        self.__price_cache = LRUCache(PRICE_CACHE_SIZE)
 
 
     def get_scheduled_amount(self, type_dr):
-        if type_dr not in list(self.__events_state.keys()): return 0
+        return len(self.get_scheduled_keys(type_dr))
+
+    def get_scheduled_keys(self, type_dr):
+        return set(self.get_scheduled_entries(type_dr))
+
+    def get_scheduled_entries(self, type_dr):
+        """
+        :return: a dictionary key -> content hash of the scheduled events of a type
+        """
+        if type_dr not in list(self.__events_state.keys()): return {}
 
         return self.__events_state[type_dr]
 
-    def set_scheduled_amount(self, type_dr, v):
-        self.__events_state[type_dr] = v
+    def set_scheduled_entries(self, type_dr, entries):
+        with self.__write_lock:
+            events_state = dict(self.__events_state)
+            events_state[type_dr] = dict(entries)
+            self.__events_state = events_state
 
     def add_available_event(self, ev):
+        self.add_available_events([ev])
+
+    def remove_available_event(self, type_dr, key):
+        self.remove_available_events([(type_dr, key)])
+
+    def add_available_events(self, l_ev):
+        """
+        Add a batch of events: the indexes of their types are copied once, updated and swapped
+        """
+        self.apply_changes(l_ev, [])
+
+    def remove_available_events(self, l_type_key):
+        """
+        Remove a batch of events, given as tuples (type_dr, key)
+        :return: the removed events
+        """
+        return self.apply_changes([], l_type_key)
+
+    def apply_changes(self, l_ev, l_type_key, version=None):
+        """
+        Add and remove a batch of events, in a single new version of the state
+        :param l_ev: the events to add or replace
+        :param l_type_key: the (type_dr, key) of the events to remove
+        :param version: the version of the new state, None to increment the current one. When given (by a replica of
+        another manager), the events keep the version they already have.
+        :return: the removed events
+        """
+        with self.__write_lock:
+            new_version = self.__state_version + 1 if version is None else version
+            scheduled_queue = dict(self.__scheduled_queue)
+            copied = set()
+            removed = []
+
+            for ev in l_ev:
+                # The events are indexed per type, ordered on their start date
+                type_dr = ev['type_dr']
+                if type_dr not in copied:
+                    scheduled_queue[type_dr] = scheduled_queue[type_dr].copy() if type_dr in scheduled_queue else EventIntervalIndex()
+                    copied.add(type_dr)
+
+                if version is None:
+                    ev['version'] = new_version
+                scheduled_queue[type_dr].insert(ev)
+
+                size = len(json.dumps(ev['signal'], default=str))
+                self.__stored_size += size - self.__event_sizes.get((type_dr, ev['key']), 0)
+                self.__event_sizes[(type_dr, ev['key'])] = size
+
+            for type_dr, key in l_type_key:
+                if type_dr not in scheduled_queue:
+                    continue
+                if type_dr not in copied:
+                    scheduled_queue[type_dr] = scheduled_queue[type_dr].copy()
+                    copied.add(type_dr)
+
+                ev = scheduled_queue[type_dr].remove(key)
+                if ev is not None:
+                    removed.append(ev)
+                    self.__stored_size -= self.__event_sizes.pop((type_dr, key), 0)
+
+                    if len(self.__removed) == self.__removed.maxlen:
+                        self.__removed_horizon = self.__removed[0][0]
+                    self.__removed.append((new_version, type_dr, key))
+
+            self.__swap(scheduled_queue, [(ev['type_dr'], ev['key']) for ev in l_ev] + list(l_type_key), new_version)
+            self.__notify_listeners(l_ev, [(ev['type_dr'], ev['key']) for ev in removed], False)
+
+        return removed
+
+    def __notify_listeners(self, l_ev, l_type_key, full, only_stale=False):
+        """
+        Call the listeners with a change of the events, must be called with the write lock held. A listener that fails
+        misses this change: it is called with all the events instead on the next change, or by retry_listeners().
+        :param only_stale: only call the listeners that failed
+        """
+        for listener in self.__listeners:
+            if only_stale and listener not in self.__stale_listeners:
+                continue
 
-        # TODO: insert the ev at the right place in the list
-        self.__scheduled_queue.append(ev)
+            try:
+                if listener in self.__stale_listeners:
+                    events = [ev for index in self.__scheduled_queue.values() for ev in index.all()]
+                    listener(events, [], self.__state_version, True)
+                    self.__stale_listeners.remove(listener)
+                else:
+                    listener(l_ev, l_type_key, self.__state_version, full)
+            except Exception:
+                logger.exception("Failed to publish the version {} of the DR events".format(self.__state_version))
+                if listener not in self.__stale_listeners:
+                    self.__stale_listeners.append(listener)
+
+    def retry_listeners(self):
+        """
+        Call the listeners that failed with all the events
+        :return: True if no listener is still failing
+        """
+        with self.__write_lock:
+            if self.__stale_listeners:
+                self.__notify_listeners([], [], False, only_stale=True)
+            return not self.__stale_listeners
 
-    def get_available_events(self, type_dr=None, timeframe= None):
+    def add_listener(self, listener):
+        """
+        Register a function called with (added events, removed (type_dr, key), new version, full) each time the events
+        change, with the write lock held: the calls are in the order of the versions. full is True when the events were
+        all replaced, by set_state(), or when the listener failed on a previous change: it is then given all the events.
+        """
+        with self.__write_lock:
+            self.__listeners.append(listener)
 
-        ret_sorted = self.__scheduled_queue
+    def __swap(self, scheduled_queue, changed, version):
+        """
+        Publish a new version of the available events, and drop the cached data of the changed (type_dr, key).
+        Must be called with the write lock held.
+        """
+        changed = set(changed)
+        changed_types = set(type_dr for type_dr, key in changed)
+
+        self.__scheduled_queue = scheduled_queue
+        self.__state_version = version
+        type_versions = dict(self.__type_versions)
+        for type_dr in changed_types:
+            type_versions[type_dr] = self.__state_version
+        self.__type_versions = type_versions
+
+        # The entries are found by their tags, without scanning the caches
+        self.__json_cache.discard_tags([('event', type_dr, key) for type_dr, key in changed] +
+                                       [('query', type_dr) for type_dr in changed_types] + [('query', None)])
+        self.__frame_cache.discard_tags(changed)
+
+    def get_version(self, type_dr=None):
+        """
+        :return: the version of the events of a type (of all the events if None): it increases each time they change
+        """
+        if type_dr is None:
+            return self.__state_version
 
-        # No specification: all the data
-        if type_dr is None and timeframe is None:
-            return [{'type': ev['type_dr'], 'data': ev['data_dr'].to_json()} for ev in ret_sorted if ev['data_dr'] is not None]
+        return self.__type_versions.get(type_dr, 0)
 
-        # Data type is specified
-        if type_dr is not None:
-            ret_sorted = [ev for ev in ret_sorted if ev['type_dr'] == type_dr]
+    def get_changes(self, type_dr=None, since=0, timeframe=None):
+        """
+        :param since: a version returned by get_version()
+        :return: a tuple (events added or modified after the version, list of (type_dr, key) of the events removed after
+        the version, True if the removed events since this version are not all known: all the events are returned)
+        """
+        with self.__write_lock:
+            full = since < self.__removed_horizon
+            removed = [] if full else [(t, key) for version, t, key in self.__removed
+                                       if version > since and (type_dr is None or t == type_dr)]
+
+        events = self.select_events(type_dr, timeframe)
+        if not full:
+            events = [ev for ev in events if ev.get('version', 0) > since]
+
+        return events, removed, full
+
+    def get_available_changes_json(self, type_dr=None, since=0, timeframe=None, resolution=None, fmt=FORMAT_JSON):
+        """
+        Encode the changes of the events after a version, as a document {"version", "full", "events", "removed"}. The
+        events are encoded like in get_available_events() for the legacy JSON format, as columnar records otherwise.
+        The response is cached until an event of this type is added or removed.
+        :return: bytes
+        """
+        cache_key = ('query', type_dr, timeframe, resolution, fmt, since)
+        version = self.__state_version
+
+        ret = self.__json_cache.get(cache_key)
+        if ret is None:
+            # Read before the changes: the events changed meanwhile are also in the next delta, never in none
+            type_version = self.get_version(type_dr)
+            events, removed, full = self.get_changes(type_dr, since, timeframe)
+            events = [ev for ev in events if ev['signal'] is not None]
+
+            if fmt == FORMAT_JSON:
+                l_data = [{'type': ev['type_dr'], 'key': ev['key'], 'data': self.event_to_json(ev, timeframe, resolution)} for ev in events]
+            else:
+                l_data = [df_to_columnar(ev['type_dr'], ev['key'], self.materialize(ev, timeframe, resolution), DEFAULT_DT) for ev in events]
+
+            doc = {'version': type_version, 'full': full, 'events': l_data,
+                   'removed': [{'type': t, 'key': key} for t, key in removed]}
+            ret = encode_document(doc, fmt)
+            self.__json_cache.put(cache_key, ret, lambda: self.__state_version == version)
+
+        return ret
+
+    def get_available_event(self, type_dr, key):
+        """
+        :return: the available event of this type with this key, or None
+        """
+        scheduled_queue = self.__scheduled_queue
+        if type_dr not in scheduled_queue:
+            return None
+
+        return scheduled_queue[type_dr].get(key)
+
+    def get_state(self):
+        """
+        :return: the keys of the scheduled events, the available events and the eviction summary, as a JSON-serializable
+        dictionary
+        """
+        with self.__write_lock:
+            return {'version': self.__state_version,
+                    'keys': {type_dr: dict(entries) for type_dr, entries in self.__events_state.items()},
+                    'events': [ev for index in self.__scheduled_queue.values() for ev in index.all()],
+                    'evicted': dict(self.__evicted)}
+
+    def set_state(self, state, keep_version=False):
+        """
+        Replace the events with the ones of a state returned by get_state()
+        :param keep_version: use the version of the state (for a replica), instead of a version above both the current
+        one and the one of the state
+        """
+        with self.__write_lock:
+            scheduled_queue = {}
+            self.__event_sizes = {}
+            self.__stored_size = 0
+            for ev in state['events']:
+                if ev['type_dr'] not in scheduled_queue:
+                    scheduled_queue[ev['type_dr']] = EventIntervalIndex()
+                scheduled_queue[ev['type_dr']].insert(ev)
+                self.__event_sizes[(ev['type_dr'], ev['key'])] = len(json.dumps(ev['signal'], default=str))
+            self.__stored_size = sum(self.__event_sizes.values())
+
+            self.__events_state = {type_dr: dict(entries) for type_dr, entries in state['keys'].items()}
+            self.__evicted = dict(state['evicted'])
+
+            self.__scheduled_queue = scheduled_queue
+            if keep_version:
+                self.__state_version = state['version']
+            else:
+                self.__state_version = max(self.__state_version, state.get('version', 0)) + 1
+            self.__type_versions = {type_dr: self.__state_version for type_dr in scheduled_queue}
+            self.__removed.clear()
+            self.__removed_horizon = self.__state_version
+            self.__json_cache.clear()
+            self.__frame_cache.clear()
+
+            self.__stale_listeners = []
+            self.__notify_listeners(state['events'], [], True)
+
+    def get_stored_size(self):
+        """
+        :return: the estimated size of the signals of the available events, in bytes
+        """
+        return self.__stored_size
+
+    def get_eviction_summary(self):
+        """
+        :return: a dictionary type_dr -> {'count': amount of evicted events, 'last_enddate': latest evicted end date}
+        """
+        return dict(self.__evicted)
+
+    def compact(self, now=None):
+        """
+        Evict the events that ended more than retention_age ago, then the events ending first until the signals fit in
+        max_memory. The evicted events are appended to the archive file if there is one, and counted in the summary.
+        :param now: the current time as a UNIX timestamp, time.time() if None
+        :return: the amount of evicted events
+        """
+        with self.__write_lock:
+            evicted = []
+
+            if self.retention_age is not None:
+                limit = datetime.fromtimestamp((time.time() if now is None else now) - self.retention_age)
+                expired = [ev for index in self.__scheduled_queue.values() for ev in index.ended_before(limit)]
+                evicted.extend(self.remove_available_events([(ev['type_dr'], ev['key']) for ev in expired]))
+
+            if self.max_memory is not None and self.__stored_size > self.max_memory:
+                candidates = sorted((ev for index in self.__scheduled_queue.values() for ev in index.all() if ev['enddate'] is not None),
+                                    key=lambda ev: to_ns(ev['enddate']))
+                over_budget = []
+                excess = self.__stored_size - self.max_memory
+                for ev in candidates:
+                    if excess <= 0:
+                        break
+                    over_budget.append((ev['type_dr'], ev['key']))
+                    excess -= self.__event_sizes.get((ev['type_dr'], ev['key']), 0)
+                evicted.extend(self.remove_available_events(over_budget))
+
+            if not evicted:
+                return 0
+
+            if self.archive_file is not None:
+                with open(self.archive_file, 'a') as f:
+                    for ev in evicted:
+                        f.write(json.dumps(ev, default=str) + '\n')
+
+            summaries = dict(self.__evicted)
+            for ev in evicted:
+                summary = dict(summaries.get(ev['type_dr'], {'count': 0, 'last_enddate': None}))
+                summary['count'] += 1
+                if summary['last_enddate'] is None or to_ns(ev['enddate']) > to_ns(summary['last_enddate']):
+                    summary['last_enddate'] = ev['enddate']
+                summaries[ev['type_dr']] = summary
+            self.__evicted = summaries
+
+        return len(evicted)
+
+    def invalidate_cache(self, type_dr, key):
+        """
+        Drop the cached serializations of an event, and of the query responses that may contain it
+        """
+        with self.__write_lock:
+            self.__swap(self.__scheduled_queue, [(type_dr, key)], self.__state_version + 1)
+
+    def event_to_json(self, ev, timeframe=None, resolution=None):
+        """
+        Serialize the data of an event, restricted to the timeframe and resampled to the resolution if given. The result
+        is cached.
+        """
+        cache_key = ('event', ev['type_dr'], ev['key'], timeframe, resolution)
+
+        cached = self.__json_cache.get(cache_key)
+        if cached is not None and cached[0] is ev:
+            return cached[1]
+
+        df = self.materialize(ev, timeframe, resolution)
+        with STAGE_SECONDS.time(stage='serialize', type_dr=ev['type_dr']):
+            ret = df.to_json() if df is not None else '{}'
+        self.__json_cache.put(cache_key, (ev, ret))
+
+        return ret
+
+    def materialize(self, ev, timeframe=None, resolution=None):
+        """
+        Build the dataframe of an event from its signal description, restricted to the timeframe if given.
+        The result is cached.
+        :param ev: a decoded event, as returned by decode_rawjson()
+        :param timeframe: a tuple (start, end), or None for the whole event
+        :param resolution: the step of the dataframe as a pandas frequency string, or None for the step of the event
+        :return: a pandas dataframe, or None if the event has no signal
+        """
+        signal = ev['signal']
+        if signal is None:
+            return None
+
+        cache_key = (ev['type_dr'], ev['key'], timeframe, resolution)
+        cached = self.__frame_cache.get(cache_key)
+        if cached is not None and cached[0] is ev:
+            return cached[1]
+
+        if resolution is not None:
+            df = self.materialize(ev, timeframe)
+            with STAGE_SECONDS.time(stage='resample', type_dr=ev['type_dr']):
+                df = resample_df(df, resolution, DEFAULT_DT)
+        else:
+            with STAGE_SECONDS.time(stage='materialize', type_dr=ev['type_dr']):
+                period = (ev['startdate'], ev['enddate'])
+                df = None
+                if signal['kind'] == 'tariff':
+                    df = self.get_df_tariff(signal['type'], period, signal['data'], timeframe)
+                elif signal['kind'] == 'powerconstraints':
+                    df = self.get_df_powerconstraints(signal['timeframes'], signal['power'], timeframe)
+                elif signal['kind'] == 'powersignal':
+                    df = self.get_df_powersignal(period, signal['profile'], timeframe)
+
+                if df is not None and timeframe is not None:
+                    df = slice_df(df, timeframe[0], timeframe[1])
+
+        if df is not None:
+            # The index engine of pandas is built lazily and not thread-safe: build it before sharing the dataframe
+            df.index.is_unique, df.columns.is_unique
+
+        self.__frame_cache.put(cache_key, (ev, df))
+
+        return df
+
+    def select_events(self, type_dr=None, timeframe=None):
+        """
+        :return: the events of a type (all the types if None) overlapping the timeframe (all the events if None),
+        sorted on their start date
+        """
+        scheduled_queue = self.__scheduled_queue
+        if type_dr is None:
+            indexes = list(scheduled_queue.values())
+        elif type_dr in scheduled_queue:
+            indexes = [scheduled_queue[type_dr]]
+        else:
+            indexes = []
+
+        with STAGE_SECONDS.time(stage='filter', type_dr=type_dr or 'all'):
+            if timeframe is None:
+                return [ev for index in indexes for ev in index.all()]
+
+            st, et = timeframe
+            return [ev for index in indexes for ev in index.overlapping(st, et)]
+
+    def get_available_events(self, type_dr=None, timeframe= None, resolution=None):
 
         if timeframe is None:
-            return [ev['data_dr'].to_json() for ev in ret_sorted]
+            ret_sorted = self.select_events(type_dr)
 
-        # Both timeframe and type of data are speficied
+            # No specification: all the data
+            if type_dr is None:
+                return [{'type': ev['type_dr'], 'data': self.event_to_json(ev, None, resolution)} for ev in ret_sorted if ev['signal'] is not None]
+
+            return [self.event_to_json(ev, None, resolution) for ev in ret_sorted]
+
+        # Timeframe is specified
         # (1) get the signals overlapping with this timeframe (2) shorten the signal
-        st, et = timeframe
-        ret_sorted = [x for x in ret_sorted if (x['startdate'] is not None) and (x['enddate'] is not None)]
-        ret_sorted = [x for x in ret_sorted if (st <= x['startdate'] <= et) or (st <= x['enddate'] <= et) or (x['startdate'] <= st and x['enddate'] >= et)]
-        ret_sorted = [ev['data_dr'][(ev['data_dr'].index >= st) & (ev['data_dr'].index <= et)].to_json() for ev in ret_sorted]
+        ret_sorted = [ev for ev in self.select_events(type_dr, timeframe) if ev['signal'] is not None]
+        ret_sorted = [self.event_to_json(ev, timeframe, resolution) for ev in ret_sorted]
 
         return ret_sorted
 
-    def decode_rawjson(self, type_dr, raw_data):
-        notif_time = time.mktime(datetime.strptime(raw_data['notification-date'], "%Y-%m-%dT%H:%M:%S").timetuple())
-        ret_dict = {'type_dr': type_dr, 'startdate': None, 'enddate': None, 'data_dr': None}
-
-        if type_dr == 'dr_prices':
-            ret_dict['startdate'] = raw_data["start-date"]
-            ret_dict['enddate'] = raw_data["end-date"]
-            ret_dict['data_dr'] = self.get_df_tariff(raw_data["type"], (raw_data["start-date"], raw_data["end-date"]), raw_data["data"])
-        elif type_dr == 'dr_shed' or type_dr == 'dr_limit':
-            raw_data = raw_data["data"]
-            ret_dict['startdate'] = raw_data["start-date"]
-            ret_dict['enddate'] = raw_data["end-date"]
-            ret_dict['data_dr'] = self.get_df_powerconstraints([(raw_data["start-date"], raw_data["end-date"])], [raw_data["power"]])
-        elif type_dr == 'dr_shift':
-            raw_data = raw_data["data"]
-            ret_dict['startdate'] = raw_data["start-date-take"]
-            ret_dict['enddate'] = raw_data["end-date-relax"]
-            timeframe_list = [(raw_data["start-date-take"], raw_data["end-date-take"]), (raw_data["start-date-relax"], raw_data["end-date-relax"])]
-            power_list = [raw_data["power-take"], raw_data["power-relax"]]
-            ret_dict['data_dr'] = self.get_df_powerconstraints(timeframe_list, power_list)
-        elif type_dr == 'dr_track':
-            raw_data = raw_data["data"]
-            ret_dict['startdate'] = raw_data["start-date"]
-            ret_dict['enddate'] = raw_data["end-date"]
-            ret_dict['data_dr'] = self.get_df_powersignal((raw_data["start-date"], raw_data["end-date"]), raw_data['profile'])
-
-        return notif_time, ret_dict
-
-    def get_df_tariff(self, type_tariff, date_period, raw_json_data):
+    def iter_available_records(self, type_dr=None, timeframe=None, resolution=None):
+        """
+        Same as get_available_events(), each event being a columnar record {type, key, start, step, values}.
+        The records are built one at a time, to stream them.
+        """
+        for ev in self.select_events(type_dr, timeframe):
+            if ev['signal'] is not None:
+                df = self.materialize(ev, timeframe, resolution)
+                with STAGE_SECONDS.time(stage='serialize', type_dr=ev['type_dr']):
+                    record = df_to_columnar(ev['type_dr'], ev['key'], df, DEFAULT_DT)
+                yield record
+
+    def get_available_records(self, type_dr=None, timeframe=None, resolution=None):
+        return list(self.iter_available_records(type_dr, timeframe, resolution))
+
+    def get_available_events_json(self, type_dr=None, timeframe=None, resolution=None, fmt=FORMAT_JSON):
+        """
+        Same as get_available_events() or get_available_records(), already encoded in the given format. The response
+        is cached until an event of this type is added or removed.
+        :param fmt: one of the signal_formats.FORMAT_* constants
+        :return: bytes
+        """
+        cache_key = ('query', type_dr, timeframe, resolution, fmt)
+        version = self.__state_version
+
+        ret = self.__json_cache.get(cache_key)
+        if ret is None:
+            if fmt == FORMAT_JSON:
+                data = self.get_available_events(type_dr, timeframe, resolution)
+                with STAGE_SECONDS.time(stage='serialize', type_dr=type_dr or 'all'):
+                    ret = json.dumps(data).encode('utf8')
+            else:
+                data = self.get_available_records(type_dr, timeframe, resolution)
+                with STAGE_SECONDS.time(stage='serialize', type_dr=type_dr or 'all'):
+                    ret = encode_records(data, fmt)
+            self.__json_cache.put(cache_key, ret, lambda: self.__state_version == version)
+
+        return ret
+
+    def get_net_signal(self, timeframe, resolution=DEFAULT_DT):
+        """
+        Combine the power signals of all the events overlapping the timeframe into a single power signal, on a time grid
+        of the given resolution: dr_shed and dr_shift powers are summed, the lowest dr_limit caps the result and
+        dr_track profiles override it
+        :param timeframe: a tuple (start, end)
+        :param resolution: the step of the time grid, as a pandas frequency string
+        :return: a pandas dataframe with a 'power' column, NaN where no event applies
+        :raise ValueError: if the timeframe or the resolution is malformed
+        """
+        st, et = timeframe
+        t0, step = to_ns(st), pd.Timedelta(resolution).value
+        if step <= 0:
+            raise ValueError("The resolution must be positive")
+        grid = pd.date_range(st, et, freq=resolution)
+        grid_ns = t0 + step * np.arange(len(grid), dtype=np.int64)
+
+        def grid_slice(seg_st, seg_et):
+            # The positions of the grid points inside [seg_st, seg_et]
+            i0 = max(0, -((t0 - to_ns(seg_st)) // step))
+            i1 = min(len(grid), (to_ns(seg_et) - t0) // step + 1)
+            return slice(i0, max(i0, i1))
+
+        summed = np.zeros(len(grid))
+        has_sum = np.zeros(len(grid), dtype=bool)
+        limit = np.full(len(grid), np.inf)
+        track = np.full(len(grid), np.nan)
+
+        for type_dr, index in list(self.__scheduled_queue.items()):
+            if type_dr not in NET_SIGNAL_SUM_TYPES + NET_SIGNAL_MIN_TYPES + NET_SIGNAL_OVERRIDE_TYPES:
+                continue
+
+            for ev in index.overlapping(st, et):
+                signal = ev['signal']
+                if signal is None:
+                    continue
+
+                if signal['kind'] == 'powerconstraints':
+                    # Like in materialize(), a time shared by consecutive periods (e.g. the take and relax periods of
+                    # dr_shift) is held by the later one
+                    ev_sl = grid_slice(ev['startdate'], ev['enddate'])
+                    values = np.full(ev_sl.stop - ev_sl.start, np.nan)
+                    for (seg_st, seg_et), power in zip(signal['timeframes'], signal['power']):
+                        sl = grid_slice(seg_st, seg_et)
+                        values[max(sl.start - ev_sl.start, 0):max(min(sl.stop, ev_sl.stop) - ev_sl.start, 0)] = power
+
+                    applies = ~np.isnan(values)
+                    if type_dr in NET_SIGNAL_MIN_TYPES:
+                        limit[ev_sl][applies] = np.minimum(limit[ev_sl][applies], values[applies])
+                    else:
+                        summed[ev_sl][applies] += values[applies]
+                        has_sum[ev_sl][applies] = True
+
+                elif signal['kind'] == 'powersignal':
+                    # The profile has a DEFAULT_DT step: each value holds until the next one
+                    sl = grid_slice(ev['startdate'], ev['enddate'])
+                    profile = np.asarray(signal['profile'], dtype=float)
+                    pos = (grid_ns[sl] - to_ns(ev['startdate'])) // pd.Timedelta(DEFAULT_DT).value
+                    valid = pos < len(profile)
+                    track[sl][valid] = profile[pos[valid]]
+
+        net = np.where(has_sum, summed, np.nan)
+        limited = np.isfinite(limit)
+        net[limited] = np.where(np.isnan(net[limited]), limit[limited], np.minimum(net[limited], limit[limited]))
+        tracked = ~np.isnan(track)
+        net[tracked] = track[tracked]
+
+        return pd.DataFrame(data={'power': net}, index=grid)
+
+    def get_net_signal_json(self, timeframe, resolution=DEFAULT_DT):
+        """
+        Same as get_net_signal(), already encoded as a JSON response. The response is cached until an event is added or
+        removed.
+        :return: bytes
+        """
+        cache_key = ('query', None, ('net', timeframe, resolution))
+        version = self.__state_version
+
+        ret = self.__json_cache.get(cache_key)
+        if ret is None:
+            with STAGE_SECONDS.time(stage='net_signal', type_dr='all'):
+                df = self.get_net_signal(timeframe, resolution)
+            with STAGE_SECONDS.time(stage='serialize', type_dr='all'):
+                ret = df.to_json().encode('utf8')
+            self.__json_cache.put(cache_key, ret, lambda: self.__state_version == version)
+
+        return ret
+
+    def decode_rawjson(self, type_dr, raw_data, key=None):
+        """
+        Decode a DR event entry, see decode_rawjson()
+        :return: a tuple (notification time, decoded event)
+        """
+        return decode_rawjson(type_dr, raw_data, key)
+
+    def get_tariff_manager(self, tariff_key):
+        """
+        Return the CostCalculator holding the blocks of a tariff file, parsing the file only if it is not cached
+        :param tariff_key: a tuple (path of the OpenEI json file, mtime of the file)
+        :return: a CostCalculator
+        """
+        tariff_manager = self.__tariff_cache.get(tariff_key)
+        if tariff_manager is None:
+            from electricitycostcalculator.cost_calculator.cost_calculator import CostCalculator
+            from electricitycostcalculator.openei_tariff.openei_tariff_analyzer import OpenEI_tariff, tariff_struct_from_openei_data
+
+            # Init the CostCalculator with the tariff data
+            tariff_manager = CostCalculator()
+            tariff_data = OpenEI_tariff()
+            tariff_data.read_from_json(tariff_key[0])
+            tariff_struct_from_openei_data(tariff_data, tariff_manager)  # Now tariff_manager has the blocks that defines the tariff
+
+            # A modified file replaces the previous version of the tariff
+            self.__tariff_cache.discard_if(lambda k: k[0] == tariff_key[0])
+            self.__price_cache.discard_if(lambda k: k[0] == tariff_key[0])
+            self.__tariff_cache.put(tariff_key, tariff_manager)
+
+        return tariff_manager
+
+    def get_df_tariff(self, type_tariff, date_period, raw_json_data, window=None):
         """
         Return a Pandas dataframe of elec prices
         :param type_tariff: 'price-rtp' or 'price-tou'
         :param date_period: (start_date, end_date )
         :param raw_json_data: the name of the json file
+        :param window: (start_date, end_date) to only build a part of the period, or None for the whole period
         :return: a pandas dataframe
         """
         start_date, end_date = date_period
 
         if type_tariff == 'price-tou':
+            from electricitycostcalculator.cost_calculator.tariff_structure import TariffElemPeriod
+            from dateutil.parser import parse
 
-            # Init the CostCalculator with the tariff data
-            tariff_data = OpenEI_tariff()
-            tariff_data.read_from_json(costcalculator_path+raw_json_data['tariff-json'])
-            tariff_struct_from_openei_data(tariff_data, self.__tariff_manager)  # Now __tariff_manager has the blocks that defines the tariff
+            tariff_path = get_costcalculator_path()+raw_json_data['tariff-json']
+            tariff_key = (tariff_path, os.stat(tariff_path).st_mtime_ns)
 
-            # Get the price signal
+            # The price signal is computed once for the whole period of the event, and the queried windows are sliced
+            # from it: overlapping windows share the same cache entry
             timestep = TariffElemPeriod.HOURLY
-            start_date_sig = parse(start_date)
-            end_date_sig = parse(end_date)
-            price_df, map = self.__tariff_manager.get_electricity_price((start_date_sig, end_date_sig), timestep)
+            price_key = tariff_key + (start_date, end_date, timestep)
+            price_df = self.__price_cache.get(price_key)
+            if price_df is None:
+                start_date_sig = parse(start_date)
+                end_date_sig = parse(end_date)
+                price_df, map = self.get_tariff_manager(tariff_key).get_electricity_price((start_date_sig, end_date_sig), timestep)
+                self.__price_cache.put(price_key, price_df)
+
+            if window is not None:
+                index, first = date_range_in_window(start_date, end_date, window)
+                if len(index) == 0:
+                    return None
+                price_df = slice_df(price_df, index[0], index[-1])
 
             return price_df
 
         elif type_tariff == 'price-rtp':
             st, et = date_period
-            index = pd.date_range(st, et, freq=DEFAULT_DT)
-            return pd.DataFrame(data=raw_json_data, index=index)
+            index, first = date_range_in_window(st, et, window)
+            return pd.DataFrame(data=slice_values(raw_json_data, first, len(index)), index=index)
         else:
             return None
 
-    def get_df_powerconstraints(self, l_timeframe, l_power_constraint):
+    def get_df_powerconstraints(self, l_timeframe, l_power_constraint, window=None):
         """
         Create and fill a Pandas dataframe with Power information between multiple timeframe
         :param timeframe: a list of tuple
         :param power_constraint: a list of power data
+        :param window: (start_date, end_date) to only build a part of the timeframes, or None for the whole timeframes
         :return:
         """
 
-        df = None
+        l_df = []
         for timeframe, power_constraint in zip(l_timeframe, l_power_constraint):
             st, et = timeframe
-            index = pd.date_range(st, et, freq=DEFAULT_DT)
+            index, first = date_range_in_window(st, et, window)
 
-            new_df = pd.DataFrame(data=len(index)* [power_constraint], index=index, columns=['power'])
+            l_df.append(pd.DataFrame(data=len(index)* [power_constraint], index=index, columns=['power']))
 
-            if df is None:
-                df = new_df
-            else:
-                df.append(new_df)
+        if not l_df:
+            return None
 
-        return df
+        # Consecutive timeframes share their boundary (e.g. the take and relax periods of dr_shift): the later one holds
+        df = pd.concat(l_df)
+        return df[~df.index.duplicated(keep='last')]
 
-    def get_df_powersignal(self, timeframe, signal):
+    def get_df_powersignal(self, timeframe, signal, window=None):
         """
         Create and fill a Pandas dataframe with Power information between multiple timeframe
         :param timeframe: a list of tuple
         :param power_constraint: a list of power data
+        :param window: (start_date, end_date) to only build a part of the timeframe, or None for the whole timeframe
         :return:
         """
         st, et = timeframe
-        index = pd.date_range(st, et, freq=DEFAULT_DT)
-        df = pd.DataFrame(data=signal, index=index, columns=['power'])
+        index, first = date_range_in_window(st, et, window)
+        df = pd.DataFrame(data=slice_values(signal, first, len(index)), index=index, columns=['power'])
 
         return df
@@ -0,0 +1,140 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+import itertools
+from lazy_import import LazyModule
+
+pd = LazyModule('pandas')
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_ns(date):
+    """
+    Convert a date (string, datetime or Timestamp) to an integer amount of nanoseconds, used as sorting key, like
+    pandas.Timestamp(date).value
+    """
+    if isinstance(date, str) and '.' not in date:
+        # The ISO dates of the DR events files are converted without pandas, which is only loaded for the other formats
+        # (fromisoformat() would truncate the fractions of seconds to microseconds)
+        try:
+            dt = datetime.fromisoformat(date)
+        except ValueError:
+            dt = None
+
+        if dt is not None:
+            delta = dt - (EPOCH if dt.tzinfo is None else EPOCH_UTC)
+            return (delta.days * 86400 + delta.seconds) * 10**9 + delta.microseconds * 1000
+
+    return pd.Timestamp(date).value
+
+
+class EventIntervalIndex():
+    """
+    Index of DR events on their [startdate, enddate] interval.
+    The events are kept sorted on their start date; an overlap query only looks at the events starting between
+    (query start - longest event duration) and the query end, found by bisection. The durations are kept sorted too, so
+    that the longest one follows the removals.
+    """
+
+    def __init__(self):
+        self.__keys = []  # Sorted (start_ns, seq)
+        self.__events = []  # The events, in the same order as __keys
+        self.__ends = []  # The end dates in ns, in the same order as __keys
+        self.__positions = {}  # event key -> (start_ns, seq)
+        self.__undated = {}  # event key -> event, for the events without dates
+        self.__spans = []  # Sorted durations of the events, in ns
+        self.__seq = itertools.count()
+
+    def copy(self):
+        """
+        :return: a new index with the same events, that can be modified independently of this one
+        """
+        other = EventIntervalIndex()
+        other.__keys = list(self.__keys)
+        other.__events = list(self.__events)
+        other.__ends = list(self.__ends)
+        other.__positions = dict(self.__positions)
+        other.__undated = dict(self.__undated)
+        other.__spans = list(self.__spans)
+        other.__seq = self.__seq
+        return other
+
+    def __len__(self):
+        return len(self.__events) + len(self.__undated)
+
+    def insert(self, ev):
+        """
+        Add an event to the index
+        :param ev: a decoded DR event, with 'key', 'startdate' and 'enddate' entries
+        """
+        self.remove(ev['key'])
+
+        if ev['startdate'] is None or ev['enddate'] is None:
+            self.__undated[ev['key']] = ev
+            return
+
+        start, end = to_ns(ev['startdate']), to_ns(ev['enddate'])
+        sort_key = (start, next(self.__seq))
+
+        idx = bisect_right(self.__keys, sort_key)
+        self.__keys.insert(idx, sort_key)
+        self.__events.insert(idx, ev)
+        self.__ends.insert(idx, end)
+        self.__positions[ev['key']] = sort_key
+        insort(self.__spans, end - start)
+
+    def remove(self, key):
+        """
+        Remove the event with the given key from the index
+        :return: the removed event, or None if there was no such event
+        """
+        if key in self.__undated:
+            return self.__undated.pop(key)
+
+        sort_key = self.__positions.pop(key, None)
+        if sort_key is None:
+            return None
+
+        idx = bisect_left(self.__keys, sort_key)
+        del self.__spans[bisect_left(self.__spans, self.__ends[idx] - sort_key[0])]
+        del self.__keys[idx]
+        del self.__ends[idx]
+        return self.__events.pop(idx)
+
+    def get(self, key):
+        if key in self.__undated:
+            return self.__undated[key]
+
+        sort_key = self.__positions.get(key)
+        if sort_key is None:
+            return None
+
+        return self.__events[bisect_left(self.__keys, sort_key)]
+
+    def all(self):
+        """
+        :return: all the events, sorted on their start date, followed by the events without dates
+        """
+        return self.__events + list(self.__undated.values())
+
+    def ended_before(self, t):
+        """
+        :return: the events whose enddate is strictly before t, sorted on their start date
+        """
+        t = to_ns(t)
+
+        hi = bisect_left(self.__keys, (t,))
+        return [self.__events[i] for i in range(hi) if self.__ends[i] < t]
+
+    def overlapping(self, st, et):
+        """
+        :return: the events whose [startdate, enddate] interval overlaps with [st, et], sorted on their start date
+        """
+        st, et = to_ns(st), to_ns(et)
+
+        max_span = self.__spans[-1] if self.__spans else 0
+        lo = bisect_left(self.__keys, (st - max_span,))
+        hi = bisect_right(self.__keys, (et, float('inf')))
+
+        return [self.__events[i] for i in range(lo, hi) if self.__ends[i] >= st]
@@ -1,11 +1,14 @@
-import json
+import argparse
 from datetime import datetime
 import pytz
 from enum import Enum
-from .VTN_Api import VTN_Api
+from .event_ledger import EventLedger, event_key
+from .json_stream import iter_json_array
+from .metrics import REGISTRY
 
 EVENT_FILENAME = 'pdp_events.json'
 VTN_API_CONFIG_FILE = 'settings.json'
+LEDGER_FILENAME = 'pdp_events_ledger.sqlite'
 
 # Type and name the EVENTS
 class SigTypeDrEvent(Enum):
@@ -26,7 +29,16 @@ DR_EVENT_DEFAULT_MARKET_CONTEXT = 1
 DR_EVENT_DEFAULT_RESP_REQ_TYPE_ID = 1
 DR_EVENT_SOLARPLUS_VEN_TARGET_ID = 4
 
-vtn_api_obj = VTN_Api(config_file=VTN_API_CONFIG_FILE)
+# The VTN client is created on first use: importing this module neither reads the settings nor loads requests
+vtn_api_obj = None
+
+def get_vtn_api():
+    global vtn_api_obj
+
+    if vtn_api_obj is None:
+        from .VTN_Api import VTN_Api
+        vtn_api_obj = VTN_Api(config_file=VTN_API_CONFIG_FILE)
+    return vtn_api_obj
 
 
 def format_dr_event(name, type_id, dt_start, dur, payload,
@@ -55,16 +67,116 @@ def format_dr_event(name, type_id, dt_start, dur, payload,
 
     return ret_dict
 
+# The fields that must be identical for two events to be merged into a single multi-interval event
+COALESCE_KEY_FIELDS = ["signal_name_id", "signal_type_id", "market_context_id", "response_required_type_id",
+                       "vtn_comment", "priority", "time_zone", "test_event"]
+
+def coalesce_dr_events(l_events):
+    """
+    Merge the contiguous or overlapping events of the same signal into multi-interval events, to create them in the VTN
+    with a single request. On overlaps, the event starting later overrides the earlier one.
+    :param l_events: list of event dictionaries, as returned by format_dr_event()
+    :return: list of event dictionaries; merged events have an "intervals" list of (duration, payload) tuples
+    """
+    groups = {}
+    for ev in l_events:
+        key = tuple([ev[f] for f in COALESCE_KEY_FIELDS])
+        groups.setdefault(key, []).append(ev)
+
+    ret = []
+    for key, group in groups.items():
+        group.sort(key=lambda e: e["dtstart_str"])
+
+        blocks = []  # Each block is a list of (start, end, payload) of consecutive intervals
+        for ev in group:
+            st = ev["dtstart_str"]
+            et = st + ev["duration"]
+            if blocks and st <= blocks[-1][-1][1]:
+                block = blocks[-1]
+                # The new interval overrides the [st, et] part of the intervals it overlaps
+                head = [(a, min(b, st), p) for (a, b, p) in block if a < st]
+                tail = [(max(a, et), b, p) for (a, b, p) in block if b > et]
+                blocks[-1] = head + [(st, et, ev["payload"])] + tail
+            else:
+                blocks.append([(st, et, ev["payload"])])
+
+        for block in blocks:
+            ev = dict(group[0])
+            ev["dtstart_str"] = block[0][0]
+            ev["duration"] = block[-1][1] - block[0][0]
+            ev["payload"] = block[0][2]
+            if len(block) > 1:
+                ev["intervals"] = [(b - a, p) for (a, b, p) in block]
+            ret.append(ev)
+
+    ret.sort(key=lambda e: e["dtstart_str"])
+    return ret
+
 def create_events(l_events):
     """
     Takes list of dictionaries that have information about DR events and create events in the VTN server
     :param l_events: list of event dictionaries
     :return: list of responses after attempting to create the events
     """
-    vtn_api_obj.login()
-    responses = vtn_api_obj.create_events(events = l_events)
+    vtn_api = get_vtn_api()
+    vtn_api.ensure_logged_in()
+    responses = vtn_api.create_events(events = l_events)
     return responses
 
+def cancel_vtn_event(vtn_api, vtn_event_id):
+    """
+    Cancel an event in the VTN
+    :return: True if the VTN accepted the cancellation, False otherwise
+    """
+    try:
+        rsp = vtn_api.cancel_event(vtn_event_id)
+    except Exception as e:
+        print ('cant cancel event {0}: {1}'.format(vtn_event_id, e))
+        return False
+
+    if rsp.status_code >= 400:
+        print ('cant cancel event {0}: HTTP {1}'.format(vtn_event_id, rsp.status_code))
+        return False
+    return True
+
+def sync_events(l_events, ledger, target_id=DR_EVENT_SOLARPLUS_VEN_TARGET_ID):
+    """
+    Push to the VTN only the events that are new or modified since the last synchronization recorded in the ledger.
+    The previous version of a modified event is cancelled in the VTN, as well as the events removed from the list.
+    The ledger only changes once the VTN accepted the change: a failed cancellation is retried at the next
+    synchronization, and a modified event whose new version could not be pushed is pushed again as a new one.
+    :param l_events: list of event dictionaries
+    :param ledger: an EventLedger
+    :param target_id: the id of the target to add to the created events
+    :return: the list of EventSubmission of the created events
+    """
+    new_events, modified_events, removed_events = ledger.diff(l_events)
+    if not new_events and not modified_events and not removed_events:
+        return []
+
+    vtn_api = get_vtn_api()
+    vtn_api.ensure_logged_in()
+
+    # Cancel first: a cancelled event does not overlap with its new version anymore
+    replaced_events = [ev for ev, vtn_event_id in modified_events if cancel_vtn_event(vtn_api, vtn_event_id)]
+    for key, vtn_event_id in removed_events:
+        if cancel_vtn_event(vtn_api, vtn_event_id):
+            ledger.forget(key)
+
+    results = vtn_api.submit_events(new_events + replaced_events, target_id=target_id)
+    for res in results:
+        if res.succeeded:
+            ledger.record(res.event, res.event_id)
+            continue
+
+        if res.event_id is not None:
+            # Don't leave a half-pushed event behind: it is created again at the next synchronization
+            cancel_vtn_event(vtn_api, res.event_id)
+        # The previous version of a replaced event is cancelled: its entry would otherwise hide the event
+        ledger.forget(event_key(res.event))
+
+    return results
+
 def read_from_json(filename):
     """
     Read tariff data from a JSON file to build the internal structure. The JSON file
@@ -72,31 +184,45 @@ def read_from_json(filename):
      - A dictionary containing the data
      - None if the data couldn't be loaded from the json file or if the file couldn't be read
     """
-    data_pdp = None
+    data_pdp = []
 
+    # The entries are parsed one at a time while the file is read, instead of loading the whole document first
     try:
         with open(filename, 'r') as input_file:
             try:
-                data_pdp = json.load(input_file)
+                for pdp_event in iter_json_array(input_file):
+                    data_pdp.append(parse_pdp_event(pdp_event))
             except ValueError:
                 print ('cant parse json')
                 return None
-    except:
+    except IOError:
         print ('cant open file')
         return None
 
-    for pdp_event in data_pdp:
-        pdp_event['start_date'] = datetime.strptime(pdp_event['start_date'], '%Y-%m-%dT%H:%M:%S-08:00').replace(
-            tzinfo=pytz.timezone(DR_EVENT_DEFAULT_TZ))
-        pdp_event['end_date'] = datetime.strptime(
-            pdp_event['end_date'], '%Y-%m-%dT%H:%M:%S-08:00').replace(tzinfo=pytz.timezone(DR_EVENT_DEFAULT_TZ))
-        pdp_event['dur'] = pdp_event['end_date'] - pdp_event['start_date']
-
     return data_pdp
 
+def parse_pdp_event(pdp_event):
+    """
+    Convert the dates of an entry of the PDP events file
+    """
+    pdp_event['start_date'] = datetime.strptime(pdp_event['start_date'], '%Y-%m-%dT%H:%M:%S-08:00').replace(
+        tzinfo=pytz.timezone(DR_EVENT_DEFAULT_TZ))
+    pdp_event['end_date'] = datetime.strptime(
+        pdp_event['end_date'], '%Y-%m-%dT%H:%M:%S-08:00').replace(tzinfo=pytz.timezone(DR_EVENT_DEFAULT_TZ))
+    pdp_event['dur'] = pdp_event['end_date'] - pdp_event['start_date']
+
+    return pdp_event
+
 
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description="Push the events of {} to the VTN".format(EVENT_FILENAME))
+    parser.add_argument('--sync', action='store_true',
+                        help="only push the events that are new or modified since the last run, using a local ledger")
+    parser.add_argument('--ledger', default=LEDGER_FILENAME, help="the ledger file used by --sync")
+    parser.add_argument('--metrics', help="a file where the latency and errors of the calls to the VTN are written, in the Prometheus text format")
+    args = parser.parse_args()
+
     # Read data from a file
     data_from_file = read_from_json(EVENT_FILENAME)
 
@@ -104,19 +230,27 @@ if __name__ == '__main__':
     name = 4
     type_sig = 4
     list_dr_events = [format_dr_event(name, type_sig, e['start_date'], e['dur'], e['price']) for e in data_from_file]
+    list_dr_events = coalesce_dr_events(list_dr_events)
     print ("Sending to API, waiting for an answer ...")
 
-    vtn_api_obj.login()
-    rsp_list = vtn_api_obj.create_events(list_dr_events)
-    event_id_list = []
-    for rsp in rsp_list:
-        event_id = vtn_api_obj.get_event_id(rsp)
-        event_id_list.append(event_id)
+    if args.sync:
+        ledger = EventLedger(args.ledger)
+        results = sync_events(list_dr_events, ledger)
+        ledger.close()
+    else:
+        vtn_api = get_vtn_api()
+        vtn_api.ensure_logged_in()
+        results = vtn_api.submit_events(list_dr_events, target_id=DR_EVENT_SOLARPLUS_VEN_TARGET_ID)
 
-    for event_id in event_id_list:
-        vtn_api_obj.add_target_to_event(event_id=event_id, target_id=DR_EVENT_SOLARPLUS_VEN_TARGET_ID)
+    for res in results:
+        if not res.succeeded:
+            print ("Event starting at {0} failed after step '{1}': {2}".format(res.event["dtstart_str"], res.last_step, res.error))
+    print ("{0}/{1} events published".format(len([res for res in results if res.succeeded]), len(results)))
 
-    for event_id in event_id_list:
-        vtn_api_obj.publish_event(event_id=event_id)
+    if args.metrics:
+        with open(args.metrics, 'w') as f:
+            f.write(REGISTRY.render())
 
-    print((vtn_api_obj.logout()))
+    # The session is kept open (and cached) for the next run: call get_vtn_api().logout() to close it
+    if vtn_api_obj is not None:
+        vtn_api_obj.close()
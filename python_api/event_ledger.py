@@ -0,0 +1,95 @@
+import sqlite3
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+
+# The fields identifying an event: an event with the same identity but a different content is a modified event
+LEDGER_KEY_FIELDS = ["signal_name_id", "signal_type_id", "market_context_id", "dtstart_str"]
+
+
+def encode_field(value):
+    """
+    JSON encoder for the fields of a formatted event that are not natively serializable
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return str(value)
+
+
+def event_key(event):
+    """
+    The identity of an event, as formatted by event_json_readers.format_dr_event()
+    """
+    return json.dumps([event[f] for f in LEDGER_KEY_FIELDS], default=encode_field)
+
+
+def event_hash(event):
+    """
+    The hash of the whole content of an event, as formatted by event_json_readers.format_dr_event()
+    """
+    content = json.dumps(event, sort_keys=True, default=encode_field)
+    return hashlib.sha1(content.encode("utf8")).hexdigest()
+
+
+class EventLedger():
+    """
+    Local record of the events already pushed to the VTN: maps the identity of each event to the hash of its content
+    and to the id of the event created in the VTN
+    """
+
+    def __init__(self, filename):
+        self.__db = sqlite3.connect(filename)
+        self.__db.execute("CREATE TABLE IF NOT EXISTS pushed_events ("
+                          "event_key TEXT PRIMARY KEY, "
+                          "content_hash TEXT NOT NULL, "
+                          "vtn_event_id INTEGER NOT NULL, "
+                          "pushed_at REAL NOT NULL)")
+        self.__db.commit()
+
+    def get_entries(self):
+        """
+        :return: a dictionary {event_key: (content_hash, vtn_event_id)}
+        """
+        rows = self.__db.execute("SELECT event_key, content_hash, vtn_event_id FROM pushed_events")
+        return {key: (h, vtn_id) for key, h, vtn_id in rows}
+
+    def diff(self, events):
+        """
+        Compare a list of events with the ledger
+        :param events: a list of event dictionaries
+        :return: a tuple of 3 lists:
+         - the new events
+         - the modified events, as tuples (event, id of the previous version in the VTN)
+         - the events of the ledger absent from the list, as tuples (event_key, id in the VTN)
+        """
+        entries = self.get_entries()
+
+        new_events = []
+        modified_events = []
+        seen_keys = set()
+        for ev in events:
+            key = event_key(ev)
+            seen_keys.add(key)
+            if key not in entries:
+                new_events.append(ev)
+            elif entries[key][0] != event_hash(ev):
+                modified_events.append((ev, entries[key][1]))
+
+        removed_events = [(key, vtn_id) for key, (h, vtn_id) in entries.items() if key not in seen_keys]
+
+        return new_events, modified_events, removed_events
+
+    def record(self, event, vtn_event_id):
+        self.__db.execute("INSERT OR REPLACE INTO pushed_events VALUES (?, ?, ?, ?)",
+                          (event_key(event), event_hash(event), vtn_event_id, time.time()))
+        self.__db.commit()
+
+    def forget(self, key):
+        self.__db.execute("DELETE FROM pushed_events WHERE event_key = ?", (key,))
+        self.__db.commit()
+
+    def close(self):
+        self.__db.close()
@@ -0,0 +1,157 @@
+import time
+import json
+import logging
+import threading
+import collections
+import queue
+from lazy_import import LazyModule
+
+requests = LazyModule('requests')  # Only used to notify the downstream servers
+
+NOTIFICATION_BUFFER_SIZE = 10000  # Amount of recent notifications kept for the subscribers that are behind
+NOTIFY_QUEUE_SIZE = 1000  # Maximum amount of notifications waiting to be posted downstream, the newest are dropped
+NOTIFY_BATCH_SIZE = 100  # Maximum amount of notifications per POST request
+NOTIFY_TIMEOUT = 5  # Timeout of the POST requests, in seconds
+
+logger = logging.getLogger('DR-SERVER')
+
+
+def event_notification(ev):
+    """
+    The notification of a released DR event: the subscribers fetch its signal with the usual queries
+    """
+    return {'type_dr': ev['type_dr'], 'key': ev['key'], 'startdate': ev['startdate'], 'enddate': ev['enddate']}
+
+
+class EventBroadcaster():
+    """
+    Keep the notifications of the latest released events, each with a cursor, and wake up the subscribers waiting for
+    them. The cursors are increasing millisecond timestamps, so that they keep increasing across restarts.
+    """
+
+    def __init__(self, buffer_size=NOTIFICATION_BUFFER_SIZE):
+        self.__notifications = collections.deque(maxlen=buffer_size)  # (cursor, notification)
+        self.__cursor = int(time.time() * 1000)
+        self.__cond = threading.Condition()
+
+    def current_cursor(self):
+        return self.__cursor
+
+    def publish(self, l_ev):
+        """
+        Notify the subscribers of a batch of released events
+        :return: the list of notifications, with their cursor
+        """
+        ret = []
+        with self.__cond:
+            for ev in l_ev:
+                self.__cursor = max(self.__cursor + 1, int(time.time() * 1000))
+                notification = dict(event_notification(ev), cursor=self.__cursor)
+                self.__notifications.append((self.__cursor, notification))
+                ret.append(notification)
+            self.__cond.notify_all()
+
+        return ret
+
+    def get_since(self, cursor, types_dr=None):
+        """
+        :param cursor: the cursor of the last notification received, None for the current cursor
+        :param types_dr: the types of DR events to keep, None for all of them
+        :return: the notifications after the cursor, filtered on their type
+        """
+        if cursor is None:
+            return []
+
+        with self.__cond:
+            notifications = [n for c, n in self.__notifications if c > cursor]
+
+        if types_dr is not None:
+            notifications = [n for n in notifications if n['type_dr'] in types_dr]
+
+        return notifications
+
+    def wait_for(self, cursor, types_dr=None, timeout=None):
+        """
+        Wait until there are notifications after the cursor, at most timeout seconds
+        :return: a tuple (notifications after the cursor filtered on their type, cursor to use for the next call)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        if cursor is None:
+            cursor = self.__cursor
+
+        while True:
+            with self.__cond:
+                latest = self.__cursor
+                notifications = self.get_since(cursor, types_dr)
+                if notifications:
+                    return notifications, latest
+
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return [], latest
+
+                self.__cond.wait(remaining)
+
+
+class WebhookNotifier():
+    """
+    POST the notifications to downstream URLs, in batches, from a background thread.
+    The outbound queue is bounded: when the downstream servers are too slow, the newest notifications are dropped.
+    """
+
+    def __init__(self, urls, max_queue=NOTIFY_QUEUE_SIZE, batch_size=NOTIFY_BATCH_SIZE, timeout=NOTIFY_TIMEOUT):
+        self.urls = list(urls)
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__session = requests.Session()
+        self.__dropped = 0
+
+        self.__thread = threading.Thread(target=self.__run, name='dr-webhook-notifier')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def get_dropped_amount(self):
+        return self.__dropped
+
+    def notify(self, notifications):
+        """
+        Queue notifications to be posted, without blocking
+        """
+        for n in notifications:
+            try:
+                self.__queue.put_nowait(n)
+            except queue.Full:
+                self.__dropped += 1
+
+    def stop(self):
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            batch = [self.__queue.get()]
+
+            # Send everything that is already waiting in the same request
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            batch = [n for n in batch if n is not None]
+            if batch:
+                self.__post(batch)
+            if stop:
+                return
+
+    def __post(self, batch):
+        data = json.dumps(batch)
+        for url in self.urls:
+            try:
+                rsp = self.__session.post(url, data=data, headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+                rsp.raise_for_status()
+            except requests.RequestException as e:
+                logger.warning("Could not notify {0} of {1} events: {2}".format(url, len(batch), e))
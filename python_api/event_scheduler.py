@@ -0,0 +1,179 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger('DR-SERVER')
+
+
+class EventScheduler():
+    """
+    Release the DR events at their notification time, from a single thread.
+    The pending events are kept in a min-heap keyed on the notification time; all the events that are due at the same
+    time are released together, in one call to the release callback.
+    """
+
+    def __init__(self, release_callback, lag_metric=None, backfill_metric=None):
+        """
+        :param release_callback: a function taking the list of the data of the events that are due
+        :param lag_metric: a metrics.Histogram observing the delay between the notification time and the release of each
+        event scheduled before its notification time, in seconds
+        :param backfill_metric: a metrics.Histogram observing the same delay for the events scheduled after their
+        notification time (e.g. read at startup), which are released as soon as possible
+        """
+        self.__release_callback = release_callback
+        self.__lag_metric = lag_metric
+        self.__backfill_metric = backfill_metric
+
+        self.__heap = []  # Entries (due_time, seq, event_id); cancelled or rescheduled entries are skipped lazily
+        self.__pending = {}  # event_id -> (notif_time, seq, data)
+        self.__seq = itertools.count()
+
+        self.__cond = threading.Condition()
+        self.__release_lock = threading.RLock()  # Held while the due events are popped and released, then by cancel()
+        self.__running = False
+        self.__thread = None
+
+    def start(self):
+        with self.__cond:
+            if self.__running:
+                return
+            self.__running = True
+
+        self.__thread = threading.Thread(target=self.__run, name='dr-event-scheduler')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        with self.__cond:
+            self.__running = False
+            self.__cond.notify()
+
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def schedule(self, notif_time, data, event_id=None):
+        """
+        Schedule an event to be released at notif_time
+        :param notif_time: the notification time, as a UNIX timestamp
+        :param data: the data passed to the release callback
+        :param event_id: an identifier of the event, to cancel or reschedule it (generated if not given)
+        :return: the identifier of the event
+        """
+        with self.__cond:
+            seq = next(self.__seq)
+            if event_id is None:
+                event_id = seq
+
+            # An event scheduled after its notification time (e.g. at startup) is due from now on: the heap holds the
+            # due time, the lag is measured from the notification time
+            self.__pending[event_id] = (notif_time, seq, data)
+            heapq.heappush(self.__heap, (max(notif_time, time.time()), seq, event_id))
+
+            # Wake up the scheduler thread if this event is now the first to be released
+            if self.__heap[0][1] == seq:
+                self.__cond.notify()
+
+        return event_id
+
+    def cancel(self, event_id):
+        """
+        Cancel a pending event. If the event is being released, waits until the release callback returned.
+        :return: True if the event was pending, False otherwise (it is then released)
+        """
+        with self.__release_lock, self.__cond:
+            if self.__pending.pop(event_id, None) is None:
+                return False
+
+            self.__compact_heap()
+
+        return True
+
+    def reschedule(self, event_id, notif_time):
+        """
+        Change the notification time of a pending event. If the event is being released, waits until the release
+        callback returned.
+        :return: True if the event was pending, False otherwise
+        """
+        with self.__release_lock, self.__cond:
+            if event_id not in self.__pending:
+                return False
+
+            data = self.__pending[event_id][2]
+            self.schedule(notif_time, data, event_id)
+            self.__compact_heap()
+
+        return True
+
+    def pending(self):
+        """
+        :return: the list of the pending events, as tuples (event_id, notif_time, data) sorted by notification time
+        """
+        with self.__cond:
+            entries = [(event_id, notif_time, data) for event_id, (notif_time, seq, data) in self.__pending.items()]
+
+        return sorted(entries, key=lambda e: e[1])
+
+    def __compact_heap(self):
+        """
+        Drop the heap entries of the cancelled and rescheduled events once they outnumber the pending ones, so that the
+        heap size stays proportional to the amount of pending events. Must be called with the lock held.
+        """
+        if len(self.__heap) <= 2 * len(self.__pending) + 64:
+            return
+
+        self.__heap = [(due_time, seq, event_id) for due_time, seq, event_id in self.__heap
+                       if event_id in self.__pending and self.__pending[event_id][1] == seq]
+        heapq.heapify(self.__heap)
+
+    def __pop_due_events(self, now):
+        """
+        Remove from the heap all the events due at time now. Must be called with the lock held.
+        :return: the list of the tuples (due time, notification time, data) of the due events
+        """
+        batch = []
+        while self.__heap and self.__heap[0][0] <= now:
+            due_time, seq, event_id = heapq.heappop(self.__heap)
+
+            entry = self.__pending.get(event_id)
+            if entry is None or entry[1] != seq:
+                continue  # Cancelled or rescheduled
+
+            del self.__pending[event_id]
+            batch.append((due_time, entry[0], entry[2]))
+
+        return batch
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                if not self.__running:
+                    return
+
+                # Sleep until the next event is due, or until a new event is scheduled before it
+                now = time.time()
+                if not self.__heap or self.__heap[0][0] > now:
+                    self.__cond.wait(self.__heap[0][0] - now if self.__heap else None)
+                    continue
+
+            # The due events are popped and released under the release lock: cancel() waits for a release in progress,
+            # so that a cancelled event is either never released, or already released when cancel() returns
+            with self.__release_lock:
+                with self.__cond:
+                    batch = self.__pop_due_events(time.time())
+                if not batch:
+                    continue  # Only cancelled or rescheduled entries were due
+
+                release_time = time.time()
+                for due_time, notif_time, data in batch:
+                    metric = self.__lag_metric if due_time <= notif_time else self.__backfill_metric
+                    if metric is not None:
+                        metric.observe(release_time - notif_time)
+
+                # The callback is called without holding the condition lock, so that it can schedule new events. Its
+                # errors must not end the only thread releasing the events.
+                try:
+                    self.__release_callback([data for due_time, notif_time, data in batch])
+                except Exception:
+                    logger.exception("Failed to release %d DR events", len(batch))
@@ -0,0 +1,111 @@
+import json
+import sqlite3
+import threading
+
+REMOVED_HISTORY_SIZE = 10000  # Amount of removed events kept in the store for the replicas that are behind
+
+
+class SharedEventStore():
+    """
+    The available DR events, published in a SQLite database in WAL mode by the ingestion process and read by the worker
+    processes serving the API. Each change of the events is stored with the version of the DReventManager that made it,
+    so that the workers only read the changes since the version of their replica.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__lock = threading.Lock()
+
+        self.__db = sqlite3.connect(filename, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS events ("
+                          "type_dr TEXT NOT NULL, "
+                          "key TEXT NOT NULL, "
+                          "version INTEGER NOT NULL, "
+                          "data TEXT NOT NULL, "
+                          "PRIMARY KEY (type_dr, key))")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS events_version ON events (version)")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS removed ("
+                          "version INTEGER NOT NULL, "
+                          "type_dr TEXT NOT NULL, "
+                          "key TEXT NOT NULL)")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS meta ("
+                          "name TEXT PRIMARY KEY, "
+                          "value INTEGER NOT NULL)")
+        self.__db.commit()
+
+    def close(self):
+        self.__db.close()
+
+    def __set_meta(self, name, value):
+        self.__db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, value))
+
+    def __get_meta(self, name):
+        row = self.__db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else 0
+
+    # --- Writer side
+
+    def publish(self, added, removed, version, full=False):
+        """
+        Store a change of the events, meant to be registered with DReventManager.add_listener()
+        :param added: the events added or modified
+        :param removed: the (type_dr, key) of the removed events
+        :param version: the version of the manager after the change
+        :param full: True if the events replace all the previous ones
+        """
+        with self.__lock, self.__db:
+            if full:
+                self.__db.execute("DELETE FROM events")
+                self.__db.execute("DELETE FROM removed")
+                self.__set_meta('removed_horizon', version)
+
+            self.__db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)",
+                                  [(ev['type_dr'], ev['key'], ev.get('version', version), json.dumps(ev, default=str)) for ev in added])
+
+            if removed:
+                self.__db.executemany("DELETE FROM events WHERE type_dr = ? AND key = ?", removed)
+                self.__db.executemany("INSERT INTO removed VALUES (?, ?, ?)", [(version, t, key) for t, key in removed])
+
+                # Only keep the latest removals: the replicas older than that are reloaded entirely
+                row = self.__db.execute("SELECT version FROM removed ORDER BY version DESC LIMIT 1 OFFSET ?",
+                                        (REMOVED_HISTORY_SIZE,)).fetchone()
+                if row is not None:
+                    self.__db.execute("DELETE FROM removed WHERE version <= ?", (row[0],))
+                    self.__set_meta('removed_horizon', row[0])
+
+            self.__set_meta('version', version)
+
+    # --- Reader side
+
+    def get_version(self):
+        with self.__lock:
+            return self.__get_meta('version')
+
+    def get_changes(self, since):
+        """
+        :param since: the version of the replica
+        :return: a tuple (version, events added or modified after since, (type_dr, key) of the events removed after since,
+        full) where full is True if all the events are returned, to replace the ones of the replica
+        """
+        with self.__lock, self.__db:
+            # A single read transaction, so that the version matches the events
+            self.__db.execute("BEGIN")
+            version = self.__get_meta('version')
+            full = since < self.__get_meta('removed_horizon')
+
+            if full:
+                rows = self.__db.execute("SELECT data FROM events").fetchall()
+                removed = []
+            else:
+                rows = self.__db.execute("SELECT data FROM events WHERE version > ?", (since,)).fetchall()
+                removed = [(t, key) for t, key in self.__db.execute("SELECT type_dr, key FROM removed WHERE version > ?", (since,))]
+
+        events = [json.loads(data) for data, in rows]
+
+        # An event removed and added again is in both lists: it is available
+        added_keys = set((ev['type_dr'], ev['key']) for ev in events)
+        removed = [r for r in removed if r not in added_keys]
+
+        return version, events, removed, full
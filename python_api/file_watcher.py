@@ -0,0 +1,114 @@
+import os
+import time
+import hashlib
+import threading
+
+# Optional: inotify-based notifications (pip install watchdog). Without it, the folder is polled with os.stat
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+POLL_INTERVAL = 0.5  # Time between two checks of the folder when inotify is not available, in seconds
+
+
+def file_hash(filepath):
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _ChangeHandler(FileSystemEventHandler):
+
+    def __init__(self, changed_flag):
+        self.__changed_flag = changed_flag
+
+    def on_any_event(self, event):
+        self.__changed_flag.set()
+
+
+class FileWatcher():
+    """
+    Detect the files of a folder that were created, modified or deleted since the last check.
+    A file is considered modified when its mtime or size changed and its content hash differs.
+    """
+
+    def __init__(self, folder, extension='json'):
+        self.folder = folder
+        self.extension = extension
+        self.__files = {}  # filepath -> ((mtime_ns, size), content hash)
+
+        self.__changed_flag = threading.Event()
+        self.__observer = None
+        if Observer is not None:
+            self.__observer = Observer()
+            self.__observer.schedule(_ChangeHandler(self.__changed_flag), folder, recursive=False)
+            self.__observer.start()
+
+    def stop(self):
+        if self.__observer is not None:
+            self.__observer.stop()
+            self.__observer.join()
+
+    def wait(self, timeout):
+        """
+        Wait for a change in the folder, at most timeout seconds
+        """
+        if self.__observer is not None:
+            self.__changed_flag.wait(timeout)
+        else:
+            time.sleep(min(timeout, POLL_INTERVAL))
+
+    def get_state(self):
+        """
+        :return: the signature and hash of the known files, as a JSON-serializable dictionary
+        """
+        return {filepath: [list(signature), h] for filepath, (signature, h) in self.__files.items()}
+
+    def set_state(self, state):
+        """
+        Restore the known files from a state returned by get_state(): the next poll() only reports the files that
+        changed since then
+        """
+        self.__files = {filepath: (tuple(signature), h) for filepath, (signature, h) in state.items()}
+
+    def poll(self):
+        """
+        Check the folder for changes
+        :return: a tuple (list of new or modified files, list of deleted files)
+        """
+        self.__changed_flag.clear()
+
+        current_files = set()
+        changed_files = []
+        for f in os.listdir(self.folder):
+            filepath = os.path.join(self.folder, f)
+            if not os.path.isfile(filepath) or f.split(".")[-1] != self.extension:
+                continue
+            current_files.add(filepath)
+
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                continue
+            signature = (st.st_mtime_ns, st.st_size)
+
+            previous = self.__files.get(filepath)
+            if previous is not None and previous[0] == signature:
+                continue
+
+            # Only hash the content when the metadata changed
+            h = file_hash(filepath)
+            self.__files[filepath] = (signature, h)
+            if previous is None or previous[1] != h:
+                changed_files.append(filepath)
+
+        deleted_files = [filepath for filepath in self.__files if filepath not in current_files]
+        for filepath in deleted_files:
+            del self.__files[filepath]
+
+        return changed_files, deleted_files
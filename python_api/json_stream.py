@@ -0,0 +1,83 @@
+import json
+
+CHUNK_SIZE = 1 << 16  # Amount of characters read from the file at once
+MAX_VALUE_SIZE = 1 << 28  # Maximum size of an element of the array, in characters: a malformed one is not read until the end of the file
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array(input_file, chunk_size=CHUNK_SIZE, max_value_size=MAX_VALUE_SIZE):
+    """
+    Parse a JSON array incrementally, without loading the whole document
+    :param input_file: a file object opened in text mode
+    :param max_value_size: the maximum size of an element, in characters
+    :return: a generator of the elements of the array
+    :raise ValueError: if the document is not a JSON array, is malformed or has an element larger than max_value_size
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    read_size = chunk_size
+
+    def fill():
+        # Drop the parsed part of the buffer and append the next chunk. The chunks double while an element is incomplete,
+        # so that an element larger than chunk_size is only parsed again a logarithmic amount of times
+        nonlocal buf, pos, eof, read_size
+        if len(buf) - pos > max_value_size:
+            raise ValueError("An element of the JSON array exceeds {} characters".format(max_value_size))
+
+        chunk = input_file.read(read_size)
+        buf, pos, eof = buf[pos:] + chunk, 0, chunk == ''
+        read_size *= 2
+
+    # Opening bracket
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buf) or eof:
+            break
+        fill()
+
+    if pos >= len(buf) or buf[pos] != '[':
+        raise ValueError("The document is not a JSON array")
+    pos += 1
+
+    expect_value = True  # After '[' or ','
+    first = True
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of the JSON array")
+            fill()
+            continue
+
+        if buf[pos] == ']' and (first or not expect_value):
+            return
+        if buf[pos] == ',' and not expect_value:
+            pos += 1
+            expect_value = True
+            continue
+        if not expect_value:
+            raise ValueError("Expected ',' or ']' at character {}".format(pos))
+
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            fill()
+            continue
+
+        if not eof and (end == len(buf) or buf[end] not in _WHITESPACE + ',]'):
+            # A number may continue in the next chunk (e.g. '1.5' then 'e3'): parse it again with more data
+            fill()
+            continue
+
+        pos = end
+        expect_value = False
+        first = False
+        read_size = chunk_size
+        yield value
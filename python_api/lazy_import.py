@@ -0,0 +1,24 @@
+import importlib
+
+
+class LazyModule():
+    """
+    A module imported on the first access to one of its attributes, e.g. pd = LazyModule('pandas') then pd.DataFrame.
+    The heavy dependencies are then only loaded by the processes that use them, and when they first do.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        # Only called for the attributes of the module: the ones of the proxy are found first
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attr)
+
+    def is_loaded(self):
+        return self.__module is not None
+
+    def __repr__(self):
+        return "<lazy module '{0}' ({1})>".format(self.__name, 'loaded' if self.__module is not None else 'not loaded')
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import threading
+
+
+class LRUCache():
+    """
+    A thread-safe dictionary holding at most max_size entries, evicting the least recently used one when full.
+    When a sizeof function is given, the values also hold at most max_bytes bytes in total. When a tags function is
+    given, the entries of a tag can be removed without scanning the whole cache.
+    """
+
+    def __init__(self, max_size, max_bytes=None, sizeof=None, tags=None):
+        """
+        :param max_bytes: the maximum total size of the values, None for no limit
+        :param sizeof: a function returning the size of a value, in bytes
+        :param tags: a function returning the tags of a key, see discard_tags()
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.__sizeof = sizeof
+        self.__tags = tags
+        self.__entries = OrderedDict()  # key -> (value, size)
+        self.__tagged = {}  # tag -> set of the keys with this tag
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def size_bytes(self):
+        return self.__bytes
+
+    def get(self, key, default=None):
+        with self.__lock:
+            if key not in self.__entries:
+                return default
+
+            self.__entries.move_to_end(key)
+            return self.__entries[key][0]
+
+    def put(self, key, value, valid=None):
+        """
+        :param valid: a function called with the lock held, the entry is only stored if it returns True. Used to not
+        store a value computed from a state that was replaced meanwhile: the invalidation happens after the replacement.
+        """
+        size = self.__sizeof(value) if self.__sizeof is not None else 0
+
+        with self.__lock:
+            if valid is not None and not valid():
+                return
+
+            self.__remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # It would evict all the others
+
+            self.__entries[key] = (value, size)
+            self.__bytes += size
+            if self.__tags is not None:
+                for tag in self.__tags(key):
+                    self.__tagged.setdefault(tag, set()).add(key)
+
+            while len(self.__entries) > self.max_size or (self.max_bytes is not None and self.__bytes > self.max_bytes):
+                self.__remove(next(iter(self.__entries)))
+
+    def pop(self, key):
+        with self.__lock:
+            return self.__remove(key)
+
+    def __remove(self, key):
+        """
+        Remove an entry, must be called with the lock held
+        :return: its value, or None if there was no such entry
+        """
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return None
+
+        self.__bytes -= entry[1]
+        if self.__tags is not None:
+            for tag in self.__tags(key):
+                keys = self.__tagged.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.__tagged[tag]
+
+        return entry[0]
+
+    def discard_tags(self, tags):
+        """
+        Remove all the entries having one of the tags
+        """
+        with self.__lock:
+            for tag in tags:
+                for key in list(self.__tagged.get(tag, ())):
+                    self.__remove(key)
+
+    def discard_if(self, predicate):
+        """
+        Remove all the entries whose key verifies the predicate
+        """
+        with self.__lock:
+            for key in [k for k in self.__entries if predicate(k)]:
+                self.__remove(key)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__tagged.clear()
+            self.__bytes = 0
@@ -0,0 +1,225 @@
+import os
+import time
+import bisect
+import cProfile
+import threading
+import contextlib
+
+# Upper bounds of the latency histograms, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+BACKFILL_BUCKETS = (1, 10, 60, 600, 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600, 30 * 24 * 3600)
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join('{0}="{1}"'.format(k, v) for k, v in escaped) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric():
+    """
+    A metric, with one value per combination of its labels
+    """
+    TYPE = None
+    SUFFIX = ''  # Appended to the name in the text format
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("{0} expects the labels {1}".format(self.name, self.labelnames))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        :return: the list of tuples (suffix, label values, extra labels, value) of the Prometheus text format
+        """
+        raise NotImplementedError
+
+    def render(self):
+        name = self.name + self.SUFFIX
+        lines = ["# HELP {0} {1}".format(name, self.documentation), "# TYPE {0} {1}".format(name, self.TYPE)]
+        for suffix, values, extra, value in self.samples():
+            lines.append("{0}{1}{2} {3}".format(name, suffix, format_labels(self.labelnames, values, extra), format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+    SUFFIX = '_total'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. Its value can also be read by a function when the metrics are rendered.
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        Metric.__init__(self, name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            return [('', (), (), self.function())]
+
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values (e.g. durations in seconds), counted in cumulative buckets
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum of the values
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[idx] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of a block of code, in seconds
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        counts = self._values.get(self._key(labels))
+        return sum(counts[:-1]) if counts is not None else 0
+
+    def samples(self):
+        ret = []
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in sorted(self._values.items())]
+
+        for key, counts in items:
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts[:-1]):
+                cumulated += count
+                ret.append(('_bucket', key, (('le', format_value(float(bound))),), cumulated))
+            ret.append(('_sum', key, (), counts[-1]))
+            ret.append(('_count', key, (), cumulated))
+
+        return ret
+
+
+class MetricsRegistry():
+    """
+    The metrics of a process, rendered together in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Register a metric, or return the one already registered with the same name
+        """
+        with self.__lock:
+            existing = self.__metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) != type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError("A different metric is already registered as {}".format(metric.name))
+                return existing
+
+            self.__metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        :return: all the metrics in the Prometheus text exposition format
+        """
+        with self.__lock:
+            metrics = sorted(self.__metrics.values(), key=lambda m: m.name)
+
+        return ''.join(m.render() + '\n' for m in metrics)
+
+
+# The registry of the process
+REGISTRY = MetricsRegistry()
+
+
+def profile_call(directory, name, func, *args, **kwargs):
+    """
+    Call a function under cProfile, and dump the stats in a file of the directory (read them with pstats or snakeviz)
+    :return: a tuple (result of the function, path of the stats file); the path is None when another profiler is
+    already running in the process
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return func(*args, **kwargs), None
+
+    try:
+        ret = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, "{0}-{1}-{2}.prof".format(name, int(time.time() * 1000), threading.get_ident()))
+    profiler.dump_stats(filename)
+
+    return ret, filename
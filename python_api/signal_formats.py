@@ -0,0 +1,149 @@
+import json
+import math
+from lazy_import import LazyModule
+
+pd = LazyModule('pandas')
+
+# Optional: binary encoding of the responses (pip install msgpack)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT_JSON = 'json'  # Legacy: a list of DataFrame.to_json() strings
+FORMAT_COLUMNAR = 'columnar'  # A list of {type, key, start, step, values} records, one value array per column
+FORMAT_NDJSON = 'ndjson'  # The columnar records, one per line, streamed
+FORMAT_MSGPACK = 'msgpack'  # The columnar records, MessagePack-encoded
+
+FORMAT_MIMETYPES = {FORMAT_JSON: 'application/json',
+                    FORMAT_COLUMNAR: 'application/vnd.dr-signal.columnar+json',
+                    FORMAT_NDJSON: 'application/x-ndjson',
+                    FORMAT_MSGPACK: 'application/msgpack'}
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def negotiate_format(format_param, accept_mimetypes):
+    """
+    Choose the encoding of a response, from the 'format' query parameter if given, from the Accept header otherwise
+    :param format_param: the value of the 'format' query parameter, or None
+    :param accept_mimetypes: the werkzeug MIMEAccept of the request
+    :return: one of the FORMAT_* constants
+    """
+    if format_param is not None:
+        fmt = format_param.lower()
+        if fmt not in FORMAT_MIMETYPES:
+            raise ValueError("Unknown format '{}'".format(format_param))
+    else:
+        # Legacy JSON first, so that clients accepting anything keep receiving it
+        mimetypes = [FORMAT_MIMETYPES[f] for f in [FORMAT_JSON, FORMAT_COLUMNAR, FORMAT_NDJSON, FORMAT_MSGPACK]]
+        best = accept_mimetypes.best_match(mimetypes, default=FORMAT_MIMETYPES[FORMAT_JSON])
+        fmt = [f for f, m in FORMAT_MIMETYPES.items() if m == best][0]
+
+    if fmt == FORMAT_MSGPACK and msgpack is None:
+        raise UnsupportedFormat("The msgpack package is not installed")
+
+    return fmt
+
+
+def check_resolution(resolution):
+    """
+    Raise a ValueError if the resolution is not a valid fixed pandas frequency string (e.g. '15min', '1H', '1D').
+    The calendar units are rejected: 'M' is read as minutes by pandas.Timedelta, but as month ends by resample().
+    """
+    if resolution is None:
+        return
+
+    offset = pd.tseries.frequencies.to_offset(resolution)
+    if not isinstance(offset, pd.tseries.offsets.Tick) or offset.nanos != pd.Timedelta(resolution).value:
+        raise ValueError("The resolution must be a fixed duration, e.g. '15min', '1H' or '1D'")
+    if offset.nanos <= 0:
+        raise ValueError("The resolution must be positive")
+
+
+def frame_step(df, default):
+    """
+    :return: the smallest interval between two samples of the dataframe, as a pandas Timedelta
+    """
+    if len(df.index) < 2:
+        return pd.Timedelta(default)
+
+    return (df.index[1:] - df.index[:-1]).min()
+
+
+def resample_df(df, resolution, default_step):
+    """
+    Change the resolution of a signal: the samples are averaged when the resolution is coarser, held when it is finer
+    :param df: a pandas dataframe with a DatetimeIndex
+    :param resolution: the new step, as a pandas frequency string
+    :param default_step: the step of the dataframe if it cannot be inferred
+    :return: a pandas dataframe, without the rows falling in the gaps of the signal
+    """
+    if df is None or len(df.index) == 0:
+        return df
+
+    step = frame_step(df, default_step)
+    new_step = pd.Timedelta(resolution)
+
+    if new_step >= step:
+        ret = df.resample(resolution).mean(numeric_only=True)
+    else:
+        # Each sample is held over its whole step, the last one included
+        df = df[~df.index.duplicated(keep='last')]
+        index = pd.date_range(df.index[0], df.index[-1] + step - new_step, freq=new_step)
+        ret = df.reindex(index, method='ffill', limit=int(step / new_step) - 1)
+
+    return ret.dropna(how='all')
+
+
+def df_to_columnar(type_dr, key, df, default_step):
+    """
+    Encode a signal as a start date, a step and one array of values per column, with null in the gaps
+    :return: a dictionary
+    """
+    if df is None or len(df.index) == 0:
+        return {'type': type_dr, 'key': key, 'start': None, 'step': None, 'values': {}}
+
+    step = frame_step(df, default_step)
+    df = df[~df.index.duplicated(keep='last')].asfreq(step)
+
+    values = {}
+    for col in df.columns:
+        values[str(col)] = [None if (isinstance(v, float) and math.isnan(v)) else v for v in df[col].tolist()]
+
+    return {'type': type_dr, 'key': key, 'start': df.index[0].isoformat(), 'step': int(step.total_seconds()),
+            'values': values}
+
+
+def encode_records(records, fmt):
+    """
+    Encode a list of columnar records
+    :return: bytes
+    """
+    if fmt == FORMAT_MSGPACK:
+        return msgpack.packb(records, use_bin_type=True)
+    if fmt == FORMAT_NDJSON:
+        return b''.join(ndjson_lines(records))
+
+    return json.dumps(records, separators=(',', ':')).encode('utf8')
+
+
+def encode_document(doc, fmt):
+    """
+    Encode a JSON-serializable document: MessagePack for the msgpack format, compact JSON otherwise
+    :return: bytes
+    """
+    if fmt == FORMAT_MSGPACK:
+        return msgpack.packb(doc, use_bin_type=True)
+
+    return json.dumps(doc, separators=(',', ':')).encode('utf8')
+
+
+def ndjson_lines(records):
+    """
+    Generate the NDJSON lines of the columnar records, to stream a response
+    """
+    for r in records:
+        yield (json.dumps(r, separators=(',', ':')) + '\n').encode('utf8')
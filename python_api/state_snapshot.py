@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import threading
+
+SNAPSHOT_VERSION = 1  # Incremented when the content of the snapshots changes, older snapshots are then ignored
+
+
+def write_snapshot(filename, state):
+    """
+    Save the state of the DR server on disk
+    :param filename: the path of the snapshot file
+    :param state: a JSON-serializable dictionary, a TypeError is raised otherwise
+    """
+    snapshot = {"version": SNAPSHOT_VERSION, "taken_at": time.time(), "state": state}
+
+    # Write to a temporary file first, so that a crash never leaves a half-written snapshot
+    tmp_file = "{0}.{1}.tmp".format(filename, os.getpid())
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(snapshot, f)
+    except Exception:
+        os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, filename)
+
+
+def read_snapshot(filename):
+    """
+    Read the state of the DR server saved by write_snapshot()
+    :return: the state dictionary, or None if there is no valid snapshot
+    """
+    if not os.path.isfile(filename):
+        return None
+
+    try:
+        with open(filename, 'r') as f:
+            snapshot = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    return snapshot["state"]
+
+
+class ReleaseJournal():
+    """
+    Append-only record of the DR events released since the last snapshot, so that a restart after a crash does not
+    release them again: they are still pending in the snapshot.
+    The journal is flushed after each release, and cut when a snapshot is written.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__lock = threading.Lock()
+        self.__file = open(filename, 'ab')
+
+    def record(self, l_data):
+        """
+        :param l_data: the data of the released events, JSON-serializable
+        """
+        lines = [(json.dumps(data) + '\n').encode('utf8') for data in l_data]
+        with self.__lock:
+            self.__file.writelines(lines)
+            self.__file.flush()
+
+    def mark(self):
+        """
+        :return: the position of the end of the journal, to be given to cut() once a snapshot is written
+        """
+        with self.__lock:
+            return self.__file.tell()
+
+    def cut(self, position=None):
+        """
+        Remove the events recorded before a position returned by mark(), all of them if None
+        """
+        with self.__lock:
+            self.__file.close()
+            tail = b''
+            if position is not None:
+                with open(self.filename, 'rb') as f:
+                    f.seek(position)
+                    tail = f.read()
+
+            tmp_file = "{0}.{1}.tmp".format(self.filename, os.getpid())
+            with open(tmp_file, 'wb') as f:
+                f.write(tail)
+            os.replace(tmp_file, self.filename)
+            self.__file = open(self.filename, 'ab')
+
+
+def read_journal(filename):
+    """
+    Read the events recorded by a ReleaseJournal
+    :return: the list of the data of the released events, in their release order
+    """
+    if not os.path.isfile(filename):
+        return []
+
+    l_data = []
+    with open(filename, 'r') as f:
+        for line in f:
+            try:
+                l_data.append(json.loads(line))
+            except ValueError:
+                break  # The last line of a crashed process can be incomplete
+    return l_data
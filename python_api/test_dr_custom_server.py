@@ -0,0 +1,130 @@
+import json
+import pytest
+import dr_custom_server as server
+from file_watcher import FileWatcher
+from state_snapshot import ReleaseJournal, write_snapshot
+
+
+def limit_entry(power, event_id=None):
+    entry = {"type": "dr-limit", "notification-date": "2019-04-15T00:00:00",
+             "data": {"power": power, "start-date": "2019-04-15T12:00:00", "end-date": "2019-04-15T18:00:00"}}
+    if event_id is not None:
+        entry["id"] = event_id
+    return entry
+
+
+@pytest.fixture
+def dr_file(tmp_path):
+    """
+    Write the entries of a dr_limit file, and clean the scheduled and available events of the test afterwards
+    """
+    filepath = str(tmp_path / 'dr_limit.json')
+
+    def write(entries):
+        with open(filepath, 'w') as f:
+            json.dump(entries, f)
+        server.update_dr_file(filepath)
+
+    yield write
+
+    write([])
+
+
+def pending_powers():
+    return [data['signal']['power'] for (type_dr, key), notif_time, data in server.get_event_scheduler().pending()
+            if type_dr == 'dr_limit']
+
+
+def release_pending():
+    scheduler = server.get_event_scheduler()
+    for event_id, notif_time, data in scheduler.pending():
+        scheduler.cancel(event_id)
+        server.push_events_to_queue([data])
+
+
+def test_edited_pending_event_is_rescheduled(dr_file):
+    dr_file([limit_entry(35, 'a'), limit_entry(40)])
+    assert sorted(pending_powers()) == [[35], [40]]
+
+    dr_file([limit_entry(99, 'a'), limit_entry(40)])
+    assert sorted(pending_powers()) == [[40], [99]]
+
+
+def test_edited_released_event_is_replaced(dr_file):
+    manager = server.get_drevent_manager()
+    dr_file([limit_entry(35, 'b')])
+    release_pending()
+    assert manager.get_available_event('dr_limit', 'b')['signal']['power'] == [35]
+
+    dr_file([limit_entry(99, 'b')])
+    assert manager.get_available_event('dr_limit', 'b') is None
+    assert pending_powers() == [[99]]
+
+    release_pending()
+    assert manager.get_available_event('dr_limit', 'b')['signal']['power'] == [99]
+
+
+def test_unchanged_file_is_not_rescheduled(dr_file):
+    dr_file([limit_entry(35, 'c')])
+    release_pending()
+
+    dr_file([limit_entry(35, 'c')])
+    assert pending_powers() == []
+
+
+def test_events_released_after_the_snapshot_are_not_released_again(dr_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'SNAPSHOT_FILE', str(tmp_path / 'snapshot.json'))
+    monkeypatch.setattr(server, 'RELEASE_JOURNAL_FILE', str(tmp_path / 'releases.jsonl'))
+    monkeypatch.setattr(server, 'release_journal', ReleaseJournal(server.RELEASE_JOURNAL_FILE))
+    manager = server.get_drevent_manager()
+    watcher = FileWatcher(str(tmp_path))
+
+    dr_file([limit_entry(35, 'd'), limit_entry(40, 'e')])
+    server.save_snapshot(watcher)
+    release_pending()
+
+    # Restarting from the snapshot, where both events are still pending
+    manager.remove_available_events([('dr_limit', 'd'), ('dr_limit', 'e')])
+    assert server.restore_snapshot(watcher)
+    assert pending_powers() == []
+    assert manager.get_available_event('dr_limit', 'd')['signal']['power'] == [35]
+
+    # Once a new snapshot holds them, the journal is cut
+    server.save_snapshot(watcher)
+    assert (tmp_path / 'releases.jsonl').read_text() == ''
+    watcher.stop()
+
+
+def test_snapshot_of_unserializable_state_fails(tmp_path):
+    with pytest.raises(TypeError):
+        write_snapshot(str(tmp_path / 'snapshot.json'), {'date': object()})
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_removals_are_applied_in_one_batch(dr_file, monkeypatch):
+    manager = server.get_drevent_manager()
+    dr_file([limit_entry(35, str(i)) for i in range(5)])
+    release_pending()
+
+    batches = []
+    remove = manager.remove_available_events
+    monkeypatch.setattr(manager, 'remove_available_events', lambda l_type_key: batches.append(list(l_type_key)) or remove(l_type_key))
+
+    # Three edited entries and two removed ones
+    dr_file([limit_entry(99, str(i)) for i in range(3)])
+    assert [len(batch) for batch in batches] == [3, 2]
+    assert sorted(pending_powers()) == [[99]] * 3
+
+
+@pytest.mark.parametrize('query', ['startdate=2019-04-15T00:00:00&enddate=tomorrow', 'startdate=2019-13-45&enddate=2019-04-16'])
+def test_malformed_timeframe_is_rejected(query):
+    client = server.app.test_client()
+    for url in ['/get-dr-signal/dr_limit?', '/get-all-signal?', '/get-net-signal?']:
+        assert client.get(url + query).status_code == 400
+
+
+@pytest.mark.parametrize('resolution', ['0H', '-1H', 'abc'])
+def test_invalid_net_signal_resolution_is_rejected(resolution):
+    client = server.app.test_client()
+    rsp = client.get('/get-net-signal?startdate=2019-04-15T00:00:00&enddate=2019-04-16T00:00:00&resolution=' + resolution)
+    assert rsp.status_code == 400
@@ -0,0 +1,104 @@
+import json
+import pandas as pd
+import pytest
+import drevent_manager
+from drevent_manager import DReventManager, decode_rawjson, decode_batch
+
+
+class CountingCalculator():
+    """
+    Stand-in for the CostCalculator of a tariff file, counting the price signals it computes
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_electricity_price(self, period, timestep):
+        self.calls += 1
+        index = pd.date_range(period[0], period[1], freq='1H')
+        return pd.DataFrame({'price': [float(i.hour) for i in index]}, index=index), {}
+
+
+def test_tou_price_signal_is_computed_once_per_event(tmp_path, monkeypatch):
+    pytest.importorskip('electricitycostcalculator')
+
+    (tmp_path / 'tariff.json').write_text('{}')
+    monkeypatch.setattr(drevent_manager, 'get_costcalculator_path', lambda: str(tmp_path) + '/')
+    calculator = CountingCalculator()
+    manager = DReventManager()
+    monkeypatch.setattr(manager, 'get_tariff_manager', lambda tariff_key: calculator)
+
+    notif_time, ev = decode_rawjson('dr_prices', {'type': 'price-tou', 'notification-date': '2019-01-01T00:00:00',
+                                                  'start-date': '2019-01-01T00:00:00', 'end-date': '2019-01-31T00:00:00',
+                                                  'data': {'tariff-json': 'tariff.json'}})
+    manager.add_available_event(ev)
+
+    windows = [('2019-01-02T00:00:00', '2019-01-03T00:00:00'), ('2019-01-02T12:00:00', '2019-01-04T00:00:00'), None]
+    frames = [manager.materialize(ev, window) for window in windows]
+
+    assert calculator.calls == 1
+    assert len(frames[0]) == 25 and len(frames[1]) == 37 and len(frames[2]) == 30 * 24 + 1
+    assert frames[1].index[0] == pd.Timestamp('2019-01-02T12:00:00')
+    assert frames[1]['price'].tolist() == frames[2].loc['2019-01-02T12:00:00':'2019-01-04T00:00:00', 'price'].tolist()
+
+
+def track_entry(profile, end_date='2019-04-15T15:00:00'):
+    return {'type': 'dr-track', 'notification-date': '2019-04-15T00:00:00',
+            'data': {'start-date': '2019-04-15T12:00:00', 'end-date': end_date, 'profile': profile}}
+
+
+def test_malformed_entries_are_rejected_at_decode():
+    decoded = decode_batch('dr_track', [('ok', track_entry([1, 2, 3, 4])),
+                                        ('short', track_entry([1, 2])),
+                                        ('reversed', track_entry([1], end_date='2019-04-15T11:00:00')),
+                                        ('missing', {'notification-date': '2019-04-15T00:00:00', 'data': {}})])
+
+    assert decoded[0][1]['key'] == 'ok' and decoded[0][2] is None
+    assert [(notif_time, ev) for notif_time, ev, error in decoded[1:]] == [(None, None)] * 3
+    assert [error.split()[0] for notif_time, ev, error in decoded[1:]] == ['short', 'reversed', 'missing']
+
+
+def test_shift_periods_share_their_boundary():
+    manager = DReventManager()
+    notif_time, ev = decode_rawjson('dr_shift', {'type': 'dr-shift', 'notification-date': '2019-04-15T00:00:00',
+                                                 'data': {'power-take': 5, 'power-relax': -5,
+                                                          'start-date-take': '2019-04-15T14:00:00',
+                                                          'end-date-take': '2019-04-15T16:00:00',
+                                                          'start-date-relax': '2019-04-15T16:00:00',
+                                                          'end-date-relax': '2019-04-15T18:00:00'}})
+    manager.add_available_event(ev)
+
+    # Serialized with a unique index, the relax period holding the shared time
+    data = json.loads(json.loads(manager.get_available_events_json('dr_shift'))[0])
+    assert list(data['power'].values()) == [5, 5, -5, -5, -5]
+
+    df = manager.materialize(ev)
+    net = manager.get_net_signal(('2019-04-15T12:00:00', '2019-04-15T20:00:00'))
+    assert net.loc['2019-04-15T14:00:00':'2019-04-15T18:00:00', 'power'].tolist() == df['power'].tolist()
+    assert net['power'].isna().tolist() == [True] * 2 + [False] * 5 + [True] * 2
+
+
+def test_delta_version_is_read_before_the_changes(monkeypatch):
+    manager = DReventManager()
+    manager.add_available_event(decode_rawjson('dr_track', dict(track_entry([1, 2, 3, 4]), id='a'))[1])
+
+    # An event released while the delta is computed
+    select_events = manager.select_events
+    def select_during_release(*args):
+        monkeypatch.setattr(manager, 'select_events', select_events)
+        manager.add_available_event(decode_rawjson('dr_track', dict(track_entry([5, 6, 7, 8]), id='b'))[1])
+        return select_events(*args)
+    monkeypatch.setattr(manager, 'select_events', select_during_release)
+
+    doc = json.loads(manager.get_available_changes_json('dr_track', since=0))
+    assert sorted(ev['key'] for ev in doc['events']) == ['a', 'b']
+
+    # The next delta contains the event again rather than never
+    doc = json.loads(manager.get_available_changes_json('dr_track', since=doc['version']))
+    assert [ev['key'] for ev in doc['events']] == ['b']
+
+
+@pytest.mark.parametrize('resolution', ['0H', '-15min'])
+def test_net_signal_rejects_non_positive_resolutions(resolution):
+    with pytest.raises(ValueError):
+        DReventManager().get_net_signal(('2019-04-15T00:00:00', '2019-04-16T00:00:00'), resolution)
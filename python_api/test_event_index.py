@@ -0,0 +1,78 @@
+import random
+from datetime import datetime, timedelta
+import pandas as pd
+from event_index import EventIntervalIndex, to_ns
+
+T0 = datetime(2019, 1, 1)
+
+
+def make_event(key, start_h, duration_h):
+    st = T0 + timedelta(hours=start_h)
+    return {'key': key, 'startdate': st.isoformat(), 'enddate': (st + timedelta(hours=duration_h)).isoformat()}
+
+
+def brute_force(events, st, et):
+    return sorted(ev['key'] for ev in events.values() if to_ns(ev['startdate']) <= to_ns(et) and to_ns(ev['enddate']) >= to_ns(st))
+
+
+def test_to_ns_matches_pandas():
+    for date in ['2019-04-15T12:00:00', '2019-04-15T12:00:00+02:00', '2019-04-15T12:00:00Z', '2019-04-15T12:00:00.123456789']:
+        assert to_ns(date) == pd.Timestamp(date).value
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(0)
+    index = EventIntervalIndex()
+    events = {}
+    for i in range(500):
+        ev = make_event(str(i), rng.randint(0, 24 * 365), rng.choice([1, 2, 24, 24 * 30]))
+        events[ev['key']] = ev
+        index.insert(ev)
+
+    for key in rng.sample(sorted(events), 200):
+        assert index.remove(key) is events.pop(key)
+
+    for i in range(200):
+        st = T0 + timedelta(hours=rng.randint(0, 24 * 365))
+        et = st + timedelta(hours=rng.randint(0, 72))
+        found = [ev['key'] for ev in index.overlapping(st.isoformat(), et.isoformat())]
+        assert sorted(found) == brute_force(events, st.isoformat(), et.isoformat())
+        assert found == sorted(found, key=lambda k: to_ns(events[k]['startdate']))
+
+
+def test_longest_duration_follows_removals():
+    index = EventIntervalIndex()
+    index.insert(make_event('long', 0, 24 * 150))
+    for i in range(10):
+        index.insert(make_event(str(i), 24 * 200 + i, 1))
+    assert index._EventIntervalIndex__spans[-1] == 24 * 150 * 3600 * 10**9
+
+    index.remove('long')
+    assert index._EventIntervalIndex__spans[-1] == 3600 * 10**9
+
+    # Replacing an event drops the duration of its previous version
+    index.insert(make_event('0', 24 * 200, 48))
+    index.insert(make_event('0', 24 * 200, 2))
+    assert index._EventIntervalIndex__spans[-1] == 2 * 3600 * 10**9
+
+
+def test_copy_is_independent():
+    index = EventIntervalIndex()
+    index.insert(make_event('a', 0, 1))
+    other = index.copy()
+    other.insert(make_event('b', 1, 1))
+    other.remove('a')
+
+    assert [ev['key'] for ev in index.all()] == ['a']
+    assert [ev['key'] for ev in other.all()] == ['b']
+
+
+def test_undated_events():
+    index = EventIntervalIndex()
+    index.insert({'key': 'u', 'startdate': None, 'enddate': None})
+    index.insert(make_event('a', 0, 1))
+
+    assert len(index) == 2
+    assert [ev['key'] for ev in index.all()] == ['a', 'u']
+    assert index.overlapping(T0.isoformat(), T0.isoformat())[0]['key'] == 'a'
+    assert index.remove('u')['key'] == 'u'
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+from python_api import event_json_readers as readers
+
+
+def event(start_h, end_h, payload, name=4):
+    return readers.format_dr_event(name, 4, datetime(2019, 8, 1, start_h), timedelta(hours=end_h - start_h), payload)
+
+
+def summary(events):
+    return [(ev["dtstart_str"].hour, ev["duration"], ev["payload"],
+             [(d.seconds // 3600, p) for d, p in ev["intervals"]] if "intervals" in ev else None)
+            for ev in events]
+
+
+def test_contiguous_events_are_merged():
+    merged = readers.coalesce_dr_events([event(11, 12, 2.0), event(10, 11, 1.0), event(12, 14, 3.0)])
+    assert summary(merged) == [(10, timedelta(hours=4), 1.0, [(1, 1.0), (1, 2.0), (2, 3.0)])]
+
+
+def test_later_event_overrides_the_overlapped_part():
+    merged = readers.coalesce_dr_events([event(10, 12, 1.0), event(11, 13, 2.0)])
+    assert summary(merged) == [(10, timedelta(hours=3), 1.0, [(1, 1.0), (2, 2.0)])]
+
+
+def test_nested_event_splits_the_outer_one():
+    merged = readers.coalesce_dr_events([event(10, 14, 1.0), event(11, 12, 2.0)])
+    assert summary(merged) == [(10, timedelta(hours=4), 1.0, [(1, 1.0), (1, 2.0), (2, 1.0)])]
+
+
+def test_overrides_follow_the_start_times_not_the_input_order():
+    merged = readers.coalesce_dr_events([event(12, 14, 2.0), event(10, 13, 1.0), event(11, 12, 3.0)])
+    assert summary(merged) == [(10, timedelta(hours=4), 1.0, [(1, 1.0), (1, 3.0), (2, 2.0)])]
+
+
+def test_events_separated_by_a_gap_stay_apart():
+    merged = readers.coalesce_dr_events([event(13, 14, 2.0), event(10, 11, 1.0)])
+    assert summary(merged) == [(10, timedelta(hours=1), 1.0, None), (13, timedelta(hours=1), 2.0, None)]
+
+
+def test_events_of_different_signals_are_not_merged():
+    merged = readers.coalesce_dr_events([event(10, 12, 1.0, name=4), event(11, 13, 2.0, name=5)])
+    assert [ev["signal_name_id"] for ev in merged] == [4, 5]
+    assert summary(merged) == [(10, timedelta(hours=2), 1.0, None), (11, timedelta(hours=2), 2.0, None)]
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+from python_api import event_json_readers as readers
+from python_api.event_ledger import EventLedger, event_key
+from python_api.VTN_Api import EventSubmission
+
+
+class Response():
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeVTN():
+    """
+    Stand-in for VTN_Api, creating the events with increasing ids and failing the calls it is told to
+    """
+
+    def __init__(self):
+        self.next_id = 1
+        self.live = set()
+        self.failing_cancels = set()
+        self.failing_payloads = set()
+
+    def ensure_logged_in(self):
+        pass
+
+    def cancel_event(self, event_id):
+        if event_id in self.failing_cancels:
+            return Response(500)
+        self.live.discard(event_id)
+        return Response(302)
+
+    def submit_events(self, events, target_id):
+        results = []
+        for ev in events:
+            res = EventSubmission(ev)
+            if ev["payload"] in self.failing_payloads:
+                res.status = EventSubmission.FAILED
+            else:
+                res.event_id = self.next_id
+                res.status = EventSubmission.PUBLISHED
+                self.live.add(res.event_id)
+                self.next_id += 1
+            results.append(res)
+        return results
+
+
+def make_event(hour, payload):
+    return readers.format_dr_event(4, 4, datetime(2019, 8, 1, hour), timedelta(hours=1), payload)
+
+
+def setup_sync(tmp_path, monkeypatch):
+    vtn = FakeVTN()
+    monkeypatch.setattr(readers, 'vtn_api_obj', vtn)
+    return vtn, EventLedger(str(tmp_path / 'ledger.sqlite'))
+
+
+def test_diff(tmp_path):
+    ledger = EventLedger(str(tmp_path / 'ledger.sqlite'))
+    kept, modified, removed = make_event(10, 1.0), make_event(11, 1.0), make_event(12, 1.0)
+    for i, ev in enumerate([kept, modified, removed]):
+        ledger.record(ev, i)
+
+    new = make_event(13, 1.0)
+    new_events, modified_events, removed_events = ledger.diff([kept, make_event(11, 2.0), new])
+
+    assert new_events == [new]
+    assert [(ev["payload"], vtn_id) for ev, vtn_id in modified_events] == [(2.0, 1)]
+    assert removed_events == [(event_key(removed), 2)]
+
+
+def test_sync_is_idempotent(tmp_path, monkeypatch):
+    vtn, ledger = setup_sync(tmp_path, monkeypatch)
+    events = [make_event(10, 1.0), make_event(11, 2.0)]
+
+    assert len(readers.sync_events(events, ledger)) == 2
+    assert readers.sync_events(events, ledger) == []
+    assert vtn.live == {1, 2}
+
+
+def test_failed_cancel_keeps_removed_event(tmp_path, monkeypatch):
+    vtn, ledger = setup_sync(tmp_path, monkeypatch)
+    readers.sync_events([make_event(10, 1.0)], ledger)
+
+    vtn.failing_cancels.add(1)
+    readers.sync_events([], ledger)
+    assert len(ledger.get_entries()) == 1
+
+    # Retried at the next synchronization
+    vtn.failing_cancels.clear()
+    readers.sync_events([], ledger)
+    assert ledger.get_entries() == {}
+    assert vtn.live == set()
+
+
+def test_failed_cancel_does_not_push_modified_event(tmp_path, monkeypatch):
+    vtn, ledger = setup_sync(tmp_path, monkeypatch)
+    readers.sync_events([make_event(10, 1.0)], ledger)
+
+    vtn.failing_cancels.add(1)
+    assert readers.sync_events([make_event(10, 2.0)], ledger) == []
+    assert vtn.live == {1}
+    assert list(ledger.get_entries().values())[0][1] == 1
+
+
+def test_failed_replacement_is_pushed_again_after_revert(tmp_path, monkeypatch):
+    vtn, ledger = setup_sync(tmp_path, monkeypatch)
+    readers.sync_events([make_event(10, 1.0)], ledger)
+
+    vtn.failing_payloads.add(2.0)
+    readers.sync_events([make_event(10, 2.0)], ledger)
+    assert vtn.live == set()
+    assert ledger.get_entries() == {}
+
+    # Reverted: the event was cancelled in the VTN, it must be pushed again
+    readers.sync_events([make_event(10, 1.0)], ledger)
+    assert vtn.live == {2}
+    assert list(ledger.get_entries().values())[0][1] == 2
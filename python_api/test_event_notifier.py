@@ -0,0 +1,95 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from event_notifier import EventBroadcaster, WebhookNotifier
+
+
+def make_event(type_dr, key):
+    return {'type_dr': type_dr, 'key': key, 'startdate': '2019-04-15T12:00:00', 'enddate': '2019-04-15T13:00:00', 'signal': {}}
+
+
+def test_notifications_since_a_cursor():
+    broadcaster = EventBroadcaster()
+    start = broadcaster.current_cursor()
+    first = broadcaster.publish([make_event('dr_limit', 'a'), make_event('dr_shed', 'b')])
+    broadcaster.publish([make_event('dr_limit', 'c')])
+
+    assert [n['key'] for n in broadcaster.get_since(start)] == ['a', 'b', 'c']
+    assert [n['key'] for n in broadcaster.get_since(first[0]['cursor'])] == ['b', 'c']
+    assert [n['key'] for n in broadcaster.get_since(start, types_dr=['dr_limit'])] == ['a', 'c']
+    assert broadcaster.get_since(None) == []
+    assert 'signal' not in first[0]
+
+
+def test_cursors_keep_increasing():
+    broadcaster = EventBroadcaster()
+    cursors = [n['cursor'] for n in broadcaster.publish([make_event('dr_limit', str(i)) for i in range(100)])]
+    assert cursors == sorted(set(cursors))
+
+
+def test_wait_for_wakes_up_on_publish():
+    broadcaster = EventBroadcaster()
+    cursor = broadcaster.current_cursor()
+    assert broadcaster.wait_for(cursor, timeout=0.01) == ([], cursor)
+
+    timer = threading.Timer(0.05, broadcaster.publish, [[make_event('dr_shed', 'a')]])
+    timer.start()
+    notifications, latest = broadcaster.wait_for(cursor, types_dr=['dr_shed'], timeout=5)
+    timer.join()
+
+    assert [n['key'] for n in notifications] == ['a']
+    assert latest == notifications[0]['cursor']
+
+
+@pytest.fixture
+def downstream():
+    """
+    A local HTTP server recording the JSON bodies posted to it, answering once the returned event is set
+    """
+    received = []
+    answer = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            answer.wait()
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    t = threading.Thread(target=server.serve_forever)
+    t.start()
+    yield 'http://127.0.0.1:{}/'.format(server.server_port), received, answer
+    answer.set()
+    server.shutdown()
+    t.join()
+    server.server_close()
+
+
+def test_webhook_posts_the_notifications_in_batches(downstream):
+    url, received, answer = downstream
+    answer.set()
+    notifier = WebhookNotifier([url], batch_size=2)
+    notifier.notify([{'key': str(i)} for i in range(5)])
+    notifier.stop()
+
+    assert [n['key'] for batch in received for n in batch] == ['0', '1', '2', '3', '4']
+    assert all(len(batch) <= 2 for batch in received)
+
+
+def test_webhook_drops_the_newest_notifications_when_full(downstream):
+    url, received, answer = downstream
+    notifier = WebhookNotifier([url], max_queue=3, batch_size=1)
+
+    # The downstream server does not answer yet: one notification is being posted, three are queued
+    notifier.notify([{'key': str(i)} for i in range(10)])
+    assert notifier.get_dropped_amount() >= 6
+
+    answer.set()
+    notifier.stop()
+    assert len(received) + notifier.get_dropped_amount() == 10
+    assert [batch[0]['key'] for batch in received] == [str(i) for i in range(len(received))]
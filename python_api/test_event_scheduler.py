@@ -0,0 +1,116 @@
+import time
+import threading
+from event_scheduler import EventScheduler
+from metrics import Histogram
+
+
+class Collector():
+    """
+    Release callback recording the released events, optionally failing on the first call
+    """
+
+    def __init__(self, amount, fail_first=False):
+        self.released = []
+        self.fail_first = fail_first
+        self.amount = amount
+        self.done = threading.Event()
+
+    def __call__(self, batch):
+        if self.fail_first:
+            self.fail_first = False
+            raise RuntimeError("listener failure")
+
+        self.released.extend(batch)
+        if len(self.released) >= self.amount:
+            self.done.set()
+
+
+def run_scheduler(collector, events, timeout=5):
+    scheduler = EventScheduler(collector)
+    for notif_time, data in events:
+        scheduler.schedule(notif_time, data)
+    scheduler.start()
+    collector.done.wait(timeout)
+    scheduler.stop()
+    return scheduler
+
+
+def test_releases_in_notification_order():
+    now = time.time()
+    collector = Collector(3)
+    run_scheduler(collector, [(now + 0.2, 'c'), (now - 10, 'a'), (now + 0.1, 'b')])
+
+    assert collector.released == ['a', 'b', 'c']
+
+
+def test_cancel_and_reschedule():
+    now = time.time()
+    collector = Collector(2)
+    scheduler = EventScheduler(collector)
+    first = scheduler.schedule(now + 0.1, 'first')
+    cancelled = scheduler.schedule(now + 0.05, 'cancelled')
+    later = scheduler.schedule(now + 60, 'later')
+
+    assert scheduler.cancel(cancelled)
+    assert not scheduler.cancel(cancelled)
+    assert scheduler.reschedule(later, now)
+    assert [data for event_id, notif_time, data in scheduler.pending()] == ['later', 'first']
+
+    scheduler.start()
+    collector.done.wait(5)
+    scheduler.stop()
+
+    assert collector.released == ['later', 'first']
+    assert scheduler.pending() == []
+
+
+def test_callback_error_does_not_stop_the_scheduler():
+    now = time.time()
+    collector = Collector(1, fail_first=True)
+    run_scheduler(collector, [(now - 1, 'lost'), (now + 0.1, 'released')])
+
+    assert collector.released == ['released']
+
+
+def test_lag_is_measured_from_the_notification_time():
+    lag, backfill = Histogram('lag', '', buckets=(0.5, 30)), Histogram('backfill', '', buckets=(0.5, 30))
+    collector = Collector(2)
+    scheduler = EventScheduler(collector, lag_metric=lag, backfill_metric=backfill)
+
+    # Read 10 s after its notification time, and released right away
+    scheduler.schedule(time.time() - 10, 'late')
+    scheduler.schedule(time.time() + 0.05, 'on time')
+    scheduler.start()
+    collector.done.wait(5)
+    scheduler.stop()
+
+    assert lag.get_count() == 1 and backfill.get_count() == 1
+    assert lag.samples()[0][3] == 1  # Below 0.5 s
+    assert [s[3] for s in backfill.samples()[:2]] == [0, 1]  # Between 0.5 and 30 s
+
+
+def test_cancel_waits_for_a_running_release():
+    started, proceed = threading.Event(), threading.Event()
+    published = []
+
+    def release(batch):
+        started.set()
+        proceed.wait(5)
+        published.extend(batch)
+
+    scheduler = EventScheduler(release)
+    event_id = scheduler.schedule(time.time(), 'a')
+    scheduler.start()
+    assert started.wait(5)
+
+    # The event is neither pending nor published yet: the cancellation waits for the release to be done
+    result = []
+    t = threading.Thread(target=lambda: result.append((scheduler.cancel(event_id), list(published))))
+    t.start()
+    time.sleep(0.05)
+    assert result == []
+
+    proceed.set()
+    t.join(5)
+    scheduler.stop()
+    assert result == [(False, ['a'])]
@@ -0,0 +1,121 @@
+import sqlite3
+import pytest
+import event_store
+import dr_custom_server as server
+from drevent_manager import DReventManager
+from event_store import SharedEventStore
+from event_notifier import EventBroadcaster
+
+
+def make_event(key, power=1):
+    return {'type_dr': 'dr_limit', 'key': key, 'startdate': '2019-04-15T12:00:00', 'enddate': '2019-04-15T13:00:00',
+            'signal': {'kind': 'powerconstraints', 'timeframes': [['2019-04-15T12:00:00', '2019-04-15T13:00:00']], 'power': [power]}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SharedEventStore(str(tmp_path / 'store.sqlite'))
+    yield store
+    store.close()
+
+
+def test_changes_since_a_version(store):
+    store.publish([make_event('a'), make_event('b')], [], 1, full=True)
+    store.publish([make_event('c')], [('dr_limit', 'a')], 2)
+
+    version, events, removed, full = store.get_changes(-1)
+    assert (version, full) == (2, True)
+    assert sorted(ev['key'] for ev in events) == ['b', 'c']
+
+    version, events, removed, full = store.get_changes(1)
+    assert (version, full, removed) == (2, False, [('dr_limit', 'a')])
+    assert [ev['key'] for ev in events] == ['c']
+
+    # An event removed and added again is available
+    store.publish([make_event('a', 2)], [], 3)
+    version, events, removed, full = store.get_changes(1)
+    assert removed == [] and sorted(ev['key'] for ev in events) == ['a', 'c']
+
+
+def test_replicas_behind_the_removals_reload_everything(store, monkeypatch):
+    monkeypatch.setattr(event_store, 'REMOVED_HISTORY_SIZE', 2)
+    store.publish([make_event(str(i)) for i in range(5)], [], 1, full=True)
+    for i in range(4):
+        store.publish([], [('dr_limit', str(i))], 2 + i)
+
+    assert store.get_changes(2)[3] is True
+    version, events, removed, full = store.get_changes(4)
+    assert (full, removed) == (False, [('dr_limit', '3')])
+
+
+def test_failed_publication_is_followed_by_a_full_one(store):
+    manager = DReventManager()
+    calls = []
+
+    def publish(added, removed, version, full=False):
+        calls.append(full)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        store.publish(added, removed, version, full)
+    manager.add_listener(publish)
+
+    manager.add_available_events([make_event('a'), make_event('b')])
+    assert store.get_version() == 0
+
+    manager.add_available_events([make_event('c')])
+    assert calls == [False, True]
+    assert store.get_version() == manager.get_version()
+    assert sorted(ev['key'] for ev in store.get_changes(-1)[1]) == ['a', 'b', 'c']
+    assert manager.retry_listeners()
+
+
+def test_replica_retries_after_an_error(store, monkeypatch):
+    store.publish([make_event('a')], [], 5, full=True)
+    manager = DReventManager()
+    monkeypatch.setattr(server, 'dr_manager', manager)
+    monkeypatch.setattr(server, 'REPLICA_REFRESH_INTERVAL', 0)
+
+    get_changes = store.get_changes
+    calls = []
+
+    def failing_get_changes(since):
+        calls.append(since)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        monkeypatch.setattr(server, 'KEEP_READING_FILE', False)
+        return get_changes(since)
+    monkeypatch.setattr(store, 'get_changes', failing_get_changes)
+
+    server.replica_loop(store)
+    assert calls == [-1, -1]
+    assert manager.get_version() == 5
+    assert manager.get_available_event('dr_limit', 'a') is not None
+
+
+def test_full_reload_only_notifies_the_new_events(store, monkeypatch):
+    manager, broadcaster = DReventManager(), EventBroadcaster()
+    monkeypatch.setattr(server, 'dr_manager', manager)
+    monkeypatch.setattr(server, 'event_broadcaster', broadcaster)
+    monkeypatch.setattr(server, 'REPLICA_REFRESH_INTERVAL', 0)
+    cursor = broadcaster.current_cursor()
+
+    first, second = dict(make_event('a'), version=5), dict(make_event('b'), version=5)
+    store.publish([first, second], [], 5, full=True)
+
+    # The ingest process restarts after the first load, and publishes its events again with one released since
+    get_changes = store.get_changes
+    calls = []
+    def restart_ingest(since):
+        calls.append(since)
+        ret = get_changes(since)
+        if len(calls) == 1:
+            store.publish([first, second, dict(make_event('c'), version=7)], [], 7, full=True)
+        else:
+            monkeypatch.setattr(server, 'KEEP_READING_FILE', False)
+        return ret
+    monkeypatch.setattr(store, 'get_changes', restart_ingest)
+
+    server.replica_loop(store)
+    assert calls == [-1, 5]
+    assert manager.get_available_event('dr_limit', 'c') is not None
+    assert [n['key'] for n in broadcaster.get_since(cursor)] == ['c']
@@ -0,0 +1,52 @@
+import io
+import json
+import pytest
+from json_stream import iter_json_array
+
+
+class CountingReader(io.StringIO):
+    """
+    A text file counting the sizes of its reads
+    """
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def test_elements_across_chunks():
+    elements = [{'id': i, 'power': [1.5e3] * (i % 7), 'name': 'é' * i} for i in range(50)] + [1.25e-3, 'x', None, []]
+    text = ' \n' + json.dumps(elements, indent=1)
+    for chunk_size in [1, 3, 7, 64, 1 << 16]:
+        assert list(iter_json_array(io.StringIO(text), chunk_size)) == elements
+
+
+def test_empty_array():
+    assert list(iter_json_array(io.StringIO(' [ ] '), 2)) == []
+
+
+@pytest.mark.parametrize('text', ['{"a": 1}', '[1, 2', '[1 2]', '[1,, 2]', '', '[{"a": tru}]'])
+def test_malformed_documents(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 4))
+
+
+def test_large_element_is_read_with_growing_chunks():
+    text = json.dumps([{'profile': list(range(100000))}, 1, 2])
+    reader = CountingReader(text)
+    elements = list(iter_json_array(reader, 64))
+
+    assert elements[0]['profile'][-1] == 99999 and elements[1:] == [1, 2]
+    assert len(reader.reads) < 20
+    assert max(reader.reads) >= len(text) // 4
+
+
+def test_oversized_element_is_not_read_entirely():
+    reader = CountingReader('[1, "' + 'x' * 100000)
+    with pytest.raises(ValueError):
+        list(iter_json_array(reader, 64, max_value_size=1000))
+    assert reader.tell() < 5000
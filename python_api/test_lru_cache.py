@@ -0,0 +1,54 @@
+from lru_cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_bounded_by_bytes():
+    cache = LRUCache(100, max_bytes=10, sizeof=len)
+    cache.put('a', b'xxxx')
+    cache.put('b', b'xxxx')
+    assert cache.size_bytes == 8
+
+    cache.put('c', b'xxxx')
+    assert cache.get('a') is None
+    assert cache.size_bytes == 8
+
+    # Replacing a value accounts for its new size
+    cache.put('b', b'x')
+    assert cache.size_bytes == 5
+
+    # A value larger than the whole budget is not stored, and does not evict the others
+    cache.put('d', b'x' * 11)
+    assert cache.get('d') is None
+    assert len(cache) == 2
+
+
+def test_discard_tags():
+    cache = LRUCache(100, tags=lambda k: [k[:2]])
+    cache.put(('dr_shed', 'a', 1), 1)
+    cache.put(('dr_shed', 'a', 2), 2)
+    cache.put(('dr_shed', 'b', 1), 3)
+
+    cache.discard_tags([('dr_shed', 'a'), ('dr_limit', 'x')])
+    assert len(cache) == 1
+    assert cache.get(('dr_shed', 'b', 1)) == 3
+
+    # The tags of evicted and popped entries are dropped too
+    assert cache.pop(('dr_shed', 'b', 1)) == 3
+    cache.discard_tags([('dr_shed', 'b')])
+    assert len(cache) == 0
+
+
+def test_put_is_skipped_when_invalid():
+    cache = LRUCache(10)
+    cache.put('a', 1, valid=lambda: False)
+    assert cache.get('a') is None
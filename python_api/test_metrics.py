@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import pytest
+from metrics import MetricsRegistry, Histogram
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter('events', "Events", ('type_dr',))
+    histogram = registry.histogram('duration_seconds', "Durations", buckets=(0.1, 1))
+    registry.gauge('version', "Version", function=lambda: 42)
+
+    counter.inc(type_dr='dr_limit')
+    counter.inc(2, type_dr='dr_limit')
+    histogram.observe(0.05)
+    histogram.observe(5)
+
+    lines = registry.render().splitlines()
+    assert 'events_total{type_dr="dr_limit"} 3' in lines
+    assert 'duration_seconds_bucket{le="0.1"} 1' in lines
+    assert 'duration_seconds_bucket{le="1"} 1' in lines
+    assert 'duration_seconds_bucket{le="+Inf"} 2' in lines
+    assert 'duration_seconds_count 2' in lines
+    assert 'version 42' in lines
+    assert '# TYPE duration_seconds histogram' in lines
+
+
+def test_registry_returns_the_existing_metric():
+    registry = MetricsRegistry()
+    counter = registry.counter('events', "Events", ('type_dr',))
+    assert registry.counter('events', "Events", ('type_dr',)) is counter
+
+    with pytest.raises(ValueError):
+        registry.histogram('events', "Events")
+    with pytest.raises(ValueError):
+        counter.inc(other='x')
+
+
+def test_histogram_timer():
+    histogram = Histogram('duration_seconds', "Durations", ('stage',))
+    with histogram.time(stage='decode'):
+        pass
+    assert histogram.get_count(stage='decode') == 1
+    assert histogram.get_count(stage='scan') == 0
+
+
+@pytest.mark.parametrize('cwd, statement', [(HERE, 'from VTN_Api import VTN_Api'),
+                                            (os.path.dirname(HERE), 'from python_api.VTN_Api import VTN_Api')])
+def test_vtn_client_imports_in_both_layouts(cwd, statement):
+    pytest.importorskip('requests')
+    subprocess.check_call([sys.executable, '-c', statement], cwd=cwd)
@@ -0,0 +1,75 @@
+import json
+import pandas as pd
+import pytest
+from werkzeug.datastructures import MIMEAccept
+import signal_formats
+from signal_formats import (negotiate_format, check_resolution, resample_df, df_to_columnar, encode_records,
+                            encode_document, ndjson_lines, UnsupportedFormat,
+                            FORMAT_JSON, FORMAT_COLUMNAR, FORMAT_NDJSON, FORMAT_MSGPACK)
+
+
+def hourly(values, start='2019-04-15T12:00:00'):
+    return pd.DataFrame({'power': values}, index=pd.date_range(start, periods=len(values), freq='1H'))
+
+
+def test_upsampling_holds_each_sample_over_its_step():
+    df = resample_df(hourly([1.0, 2.0, 3.0]), '15min', '1H')
+    assert df['power'].tolist() == [1.0] * 4 + [2.0] * 4 + [3.0] * 4
+    assert df.index[-1] == pd.Timestamp('2019-04-15T14:45:00')
+
+
+def test_upsampling_keeps_the_gaps():
+    df = pd.concat([hourly([1.0, 2.0]), hourly([5.0, 6.0], start='2019-04-15T18:00:00')])
+    ret = resample_df(df, '30min', '1H')
+    assert ret['power'].tolist() == [1.0, 1.0, 2.0, 2.0, 5.0, 5.0, 6.0, 6.0]
+    assert pd.Timestamp('2019-04-15T15:00:00') not in ret.index
+
+
+def test_downsampling_averages():
+    ret = resample_df(hourly([1.0, 3.0, 5.0, 7.0]), '2H', '1H')
+    assert ret['power'].tolist() == [2.0, 6.0]
+
+
+@pytest.mark.parametrize('resolution', ['0H', '-1H', '1M', '1m', '1Y', '1W', 'abc'])
+def test_invalid_resolutions(resolution):
+    with pytest.raises(ValueError):
+        check_resolution(resolution)
+
+
+def test_valid_resolutions():
+    for resolution in [None, '15min', '1H', '1h', '1D', '30s']:
+        check_resolution(resolution)
+
+
+def test_columnar_record_with_gaps():
+    df = pd.concat([hourly([1.0, 2.0]), hourly([5.0], start='2019-04-15T15:00:00')])
+    record = df_to_columnar('dr_limit', 'a', df, '1H')
+    assert record == {'type': 'dr_limit', 'key': 'a', 'start': '2019-04-15T12:00:00', 'step': 3600,
+                      'values': {'power': [1.0, 2.0, None, 5.0]}}
+
+    assert df_to_columnar('dr_limit', 'b', None, '1H')['values'] == {}
+
+
+def test_encodings():
+    records = [{'type': 'dr_limit', 'key': str(i), 'values': {'power': [i]}} for i in range(3)]
+
+    assert json.loads(encode_records(records, FORMAT_COLUMNAR)) == records
+    lines = encode_records(records, FORMAT_NDJSON).decode('utf8').splitlines()
+    assert [json.loads(line) for line in lines] == records
+    assert b''.join(ndjson_lines(records)) == encode_records(records, FORMAT_NDJSON)
+
+    msgpack = pytest.importorskip('msgpack')
+    assert msgpack.unpackb(encode_records(records, FORMAT_MSGPACK), raw=False) == records
+    assert msgpack.unpackb(encode_document({'version': 1}, FORMAT_MSGPACK), raw=False) == {'version': 1}
+
+
+def test_negotiate_format(monkeypatch):
+    assert negotiate_format(None, MIMEAccept([('*/*', 1)])) == FORMAT_JSON
+    assert negotiate_format(None, MIMEAccept([('application/x-ndjson', 1), ('application/json', 0.5)])) == FORMAT_NDJSON
+    assert negotiate_format('NDJSON', MIMEAccept([('application/json', 1)])) == FORMAT_NDJSON
+    with pytest.raises(ValueError):
+        negotiate_format('xml', MIMEAccept([]))
+
+    monkeypatch.setattr(signal_formats, 'msgpack', None)
+    with pytest.raises(UnsupportedFormat):
+        negotiate_format('msgpack', MIMEAccept([]))
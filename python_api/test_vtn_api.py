@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import pytest
+import requests
+from python_api import event_json_readers as readers
+from python_api.VTN_Api import VTN_Api, EventSubmission, NotLoggedInError
+from python_api.benchmarks.stub_vtn import StubVTN, AUTHENTICITY_TOKEN
+
+
+def make_event(hour, payload, duration_h=1):
+    return readers.format_dr_event(4, 4, datetime(2019, 8, 1, hour), timedelta(hours=duration_h), payload)
+
+
+@pytest.fixture
+def vtn(request):
+    """
+    The stub VTN, answering in HTML unless the test is parametrized with indirect=True and json_mode=True
+    """
+    server = StubVTN(json_mode=getattr(request, 'param', False)).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_api(vtn, tmp_path):
+    """
+    Create VTN_Api clients of the stub VTN, sharing their settings file
+    """
+    def make(**options):
+        settings = str(tmp_path / 'settings.json')
+        vtn.write_settings(settings, **options)
+        return VTN_Api(config_file=settings)
+
+    return make
+
+
+def failed_response(*args, **kwargs):
+    rsp = requests.Response()
+    rsp.status_code = 500
+    return rsp
+
+
+def test_failed_submission_keeps_its_last_step(make_api, monkeypatch):
+    api = make_api()
+    api.ensure_logged_in()
+    monkeypatch.setattr(api, 'add_target_to_event', failed_response)
+
+    res = api.submit_events([make_event(10, 1.0)])[0]
+    assert (res.status, res.last_step, res.event_id) == (EventSubmission.FAILED, EventSubmission.CREATED, 1)
+    assert isinstance(res.error, requests.HTTPError)
+
+
+def test_events_are_not_pushed_before_login(make_api, vtn):
+    api = make_api()
+    results = api.submit_events([make_event(10, 1.0), make_event(12, 2.0)])
+
+    assert [(res.status, res.last_step) for res in results] == [(EventSubmission.FAILED, EventSubmission.PENDING)] * 2
+    assert all(isinstance(res.error, NotLoggedInError) for res in results)
+    with pytest.raises(NotLoggedInError):
+        api.create_events([make_event(10, 1.0)])
+    assert 'create' not in vtn.get_calls()
+
+
+def test_merged_event_is_sent_with_its_intervals(make_api, monkeypatch):
+    api = make_api()
+    sent = []
+    monkeypatch.setattr(api, 'request', lambda method, path, data=None, **kwargs: sent.append((method, path, data)))
+
+    merged = readers.coalesce_dr_events([make_event(10, 1.0, duration_h=2), make_event(11, 2.0, duration_h=2)])
+    api.create_event(merged[0])
+
+    (method, path, data), = sent
+    assert (method, path) == ('POST', '/events')
+    assert ("event_interface[event][duration]", 180) in data
+    assert ("event_interface[event][dtstart_str]", datetime(2019, 8, 1, 10)) in data
+    intervals = [value for name, value in data if name.startswith("event_interface[event_signal_intervals][]")]
+    assert intervals == [60, 1.0, 120, 2.0]
+
+
+def test_calls_reuse_the_pooled_connections(make_api, vtn):
+    api = make_api(pool_size=3, max_concurrency=8)
+    api.ensure_logged_in()
+    api.submit_events([make_event(10, 1.0)])
+    assert vtn.get_calls()['connect'] == 1
+
+    results = api.submit_events([make_event(hour, 1.0) for hour in range(12)])
+    assert all(res.succeeded for res in results)
+    assert vtn.get_calls()['connect'] <= 3
+
+
+def test_idempotent_calls_are_retried(make_api, vtn):
+    api = make_api(max_retries=2, backoff_factor=0)
+    api.ensure_logged_in()
+
+    vtn.inject_errors(2)
+    assert api.publish_event(1).status_code == 302
+    assert vtn.get_calls()['publish'] == 1
+
+    # Creating an event is not idempotent: it is never replayed
+    vtn.inject_errors(1)
+    assert api.create_event(make_event(10, 1.0)).status_code == 503
+    assert 'create' not in vtn.get_calls()
+
+
+def test_cached_session_is_reused_by_the_next_instance(make_api, vtn, tmp_path):
+    cache = str(tmp_path / 'session.json')
+    make_api(session_cache_file=cache).ensure_logged_in()
+
+    api = make_api(session_cache_file=cache)
+    api.ensure_logged_in()
+    assert api.publish_event(1).status_code == 302
+    assert vtn.get_calls()['login'] == 1
+
+    # An expired cache is not reused
+    expired = make_api(session_cache_file=cache, session_ttl=0)
+    expired.login()
+    make_api(session_cache_file=cache).ensure_logged_in()
+    assert vtn.get_calls()['login'] == 3
+
+
+def test_expired_session_is_renewed(make_api, vtn):
+    api = make_api()
+    api.ensure_logged_in()
+
+    # The VTN redirects to the login page
+    vtn.session_id = 'new-session'
+    assert api.publish_event(1).status_code == 302
+    assert api.cookies['vtn_session'] == 'new-session'
+
+    # The VTN answers 401
+    vtn.inject_errors(1, status=401)
+    assert api.publish_event(1).status_code == 302
+    assert vtn.get_calls()['login'] == 3
+    assert vtn.get_calls()['publish'] == 2
+
+
+def test_concurrent_callers_log_in_again_once(make_api, vtn):
+    api = make_api(pool_size=8)
+    api.ensure_logged_in()
+    vtn.session_id = 'new-session'
+    vtn.latency = 0.05
+
+    barrier = threading.Barrier(8)
+
+    def publish(event_id):
+        barrier.wait()
+        return api.publish_event(event_id).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(publish, range(8)))
+
+    assert statuses == [302] * 8
+    assert vtn.get_calls()['login'] == 2
+    assert vtn.get_calls()['publish'] == 8
+
+
+@pytest.mark.parametrize('vtn', [False, True], ids=['html', 'json'], indirect=True)
+def test_ids_and_tokens_are_read_from_html_or_json(make_api, vtn):
+    api = make_api()
+    api.ensure_logged_in()
+    assert api.authenticity_token == AUTHENTICITY_TOKEN
+
+    results = api.submit_events([make_event(10, 1.0), make_event(12, 2.0)], max_concurrency=1)
+    assert [(res.status, res.event_id) for res in results] == [(EventSubmission.PUBLISHED, 1), (EventSubmission.PUBLISHED, 2)]
+
+    # Only the HTML login needs to load a page to find the token
+    assert vtn.get_calls().get('GET', 0) == (0 if vtn.json_mode else 1)
+
+
+def make_response(status, headers=(), content=b'', history=()):
+    rsp = requests.Response()
+    rsp.status_code = status
+    rsp.headers.update(dict(headers))
+    rsp._content = content
+    rsp.history = list(history)
+    return rsp
+
+
+def test_event_id_fallbacks(make_api):
+    api = make_api()
+
+    assert api.get_event_id(make_response(201, [('Content-Type', 'application/json')], b'{"id": "5"}')) == 5
+    assert api.get_event_id(make_response(302, [('Location', 'http://vtn:8080/events/6/')])) == 6
+
+    # Redirect followed: the id is in the history
+    redirect = make_response(302, [('Location', 'http://vtn:8080/events/7')])
+    assert api.get_event_id(make_response(200, content=b'<html></html>', history=[redirect])) == 7
+
+    # No redirect: the id is found in the page
+    page = b'<ul><div class="item current"><a href="/events/8">Event 8</a></div></ul>'
+    assert api.get_event_id(make_response(200, [('Content-Type', 'text/html')], page)) == 8
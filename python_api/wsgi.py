@@ -0,0 +1,22 @@
+"""
+WSGI entry point of the custom DR server, e.g.: waitress-serve --threads=8 --port=5000 wsgi:application
+
+By default (DR_SERVER_ROLE=standalone), the DR events are read and released by background threads of the serving
+process: run a single process, with several threads.
+With DR_SERVER_ROLE=worker, the events are read from the shared store (DR_SERVER_STORE) published by a separate
+`python dr_custom_server.py --role ingest` process, and any number of worker processes can serve the API, e.g.:
+gunicorn -w 4 --threads 8 wsgi:application
+DR_SERVER_RETENTION_DAYS enables the eviction of the events that ended more than this amount of days ago.
+"""
+import os
+from dr_custom_server import app, dr_manager, start_background_tasks, start_replica, ROLE_WORKER, SHARED_STORE_FILE
+
+if os.environ.get('DR_SERVER_RETENTION_DAYS'):
+    dr_manager.retention_age = float(os.environ['DR_SERVER_RETENTION_DAYS']) * 24 * 3600
+
+if os.environ.get('DR_SERVER_ROLE') == ROLE_WORKER:
+    start_replica(os.environ.get('DR_SERVER_STORE', SHARED_STORE_FILE))
+else:
+    start_background_tasks()
+
+application = app
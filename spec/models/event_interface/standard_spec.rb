@@ -275,6 +275,20 @@ describe EventInterface::Standard do
 
     # # # # # # # # # # # # # # # #
 
+    it 'creates one EventSignalInterval per entry of the :event_signal_intervals param' do
+      intervals_params = [{ duration: 30, payload: 1 }, { duration: 15, payload: 2 }, { duration: 15, payload: 3 }]
+      @standard_ei_params[:event][:duration] = 60
+      @created_sei = EventInterface::Standard.new.create(@standard_ei_params.merge(event_signal_intervals: intervals_params), @admin_account)
+
+      intervals = @created_sei.event_signal.event_signal_intervals.order(:uid)
+
+      expect(intervals.map(&:uid)).to eq([0, 1, 2])
+      expect(intervals.map(&:duration)).to eq([30, 15, 15])
+      expect(intervals.map { |interval| interval.payload.to_f }).to eq([1.0, 2.0, 3.0])
+    end
+
+    # # # # # # # # # # # # # # # #
+
     it 'created Event instance has an event interface name of EventInterface::Standard' do
       @created_sei = EventInterface::Standard.new.create(@standard_ei_params, @admin_account)
 
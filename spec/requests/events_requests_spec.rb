@@ -531,3 +531,25 @@ describe "Responses from view-related EventsController actions" do
     expect(response.status).to eq(200)
   end
 end
+
+#####################################################################
+
+describe 'API clients requesting JSON' do
+
+  it 'get the authenticity token when logging in' do
+    @account = FactoryGirl.create(:account, :admin)
+    post login_path, { session: { user_name: @account.name, password: @account.password, agree: 1 } }, { 'HTTP_ACCEPT' => 'application/json' }
+
+    expect(response.status).to eq(200)
+    expect(JSON.parse(response.body)['authenticity_token']).to_not be_blank
+  end
+
+  it 'get the id of the created event' do
+    post_create_and_login_account(:admin)
+    event_params = FactoryGirl.attributes_for(:event, :ei_ready_standard, market_context_id: MarketContext.first.id).except(:dtstart, :event_id)
+    post events_path, { event_interface: FactoryGirl.attributes_for(:standard_ei, event: event_params) }, { 'HTTP_ACCEPT' => 'application/json' }
+
+    expect(response.status).to eq(201)
+    expect(response.headers['Location']).to end_with("/events/#{ JSON.parse(response.body)['id'] }")
+  end
+end